@@ -14,6 +14,11 @@
 #  cc, dd, ee, ff, ...
 #          Params as 2-digit pairs for the Action
 #  = 0000  == zero, false, etc; see action defns
+# The exception is SPAWN, whose location may be sent as two 4-digit values
+# instead, for worlds wider than 256 squares:
+#  0004 0001 0123 0456  spawn U-0001 at (0x123, 0x456)
+# A spawn with 8 or more param digits is read this way, and one with fewer as
+# 2-digit pairs; ConvertToBytecode always sends the wide form.
 # Note that the 'minimum'/default action would be:
 # 0x0000000000
 # Which would indicate an attempt by the player to delay;
@@ -22,9 +27,76 @@
 #  0000 = id=(player),
 #  00   = no params (null)
 # Return values are defined by the actions.
+# BINARY FORMAT
+# Controllers may instead send actions as fixed-width little-endian records,
+# see ACTIONRECORD:
+#  <u16 action> <u16 id#> <u16 param> <u16 param>
+# which carry the same values as the hex format; unused params are zero.
+# PROTOCOL
+# A controller opens its session by sending a hello line naming the protocol
+# mode it wants to speak:
+#  HELLO unit   one exchange per unit: the arena sends a unit ID, the
+#               controller replies with a bytecode, the arena sends back the
+#               action's return value
+#  HELLO batch  one exchange per controller per turn: the arena sends
+#               <turn>|<id> <id> ...|<id>:<retval>;<id>:<retval>...
+#               listing all of the controller's living units and the return
+#               values of their actions from the previous turn, and the
+#               controller replies with <turn>|<bytecode> <bytecode> ...
+# The hello may name a wire format after the mode, e.g. HELLO batch bin; the
+# default is hex. In the binary format every action the controller sends is a
+# blob (see battleComms) holding one ACTIONRECORD, or for a batch reply a
+# <u32 turn> followed by one ACTIONRECORD per unit.
+# SCAN
+# A SCAN's first param is the radius to look around the unit (0 asks for
+# SCANRADIUS, and anything over MAXSCANRADIUS is cut down to it). It returns
+# the unit's surroundings as a string:
+#  S<radius digit><packed cells>
+# covering the (2R+1) x (2R+1) squares from (x-R, y-R) to (x+R, y+R), row by
+# row from the bottom, each one a Cell: EMPTY, FRIEND (the unit itself or one
+# on its side), ENEMY or EDGE (off the board). Cells are packed two to a hex
+# digit, the first in the low two bits; BattleParser.DecodeScan unpacks them.
+# A unit that is not on the board gets False instead.
+# WORLD
+# The world is a grid of width x height squares, (0, 0) at the bottom left;
+# sizes are given as N for a square world or WxH, up to MAXWORLDSIZE a side
+# (coordinates have to fit the i16 fields of a record's keyframes).
+# PLUGINS
+# A controller written in Python can instead run inside the arena's process
+# by subclassing Controller; it is named in place of a pipe as module:Class,
+# e.g. randoBot:RandoBot, optionally followed by a #tag to tell two copies of
+# the same plugin apart. The arena calls it once per turn like a batch
+# controller, but with plain values: no pipes, no encoding.
 #import battler.py
+import importlib
+import re
+import struct
 from enum import Enum
 from abc import ABC, abstractmethod
+try:
+	import numpy
+except ImportError:
+	numpy = None # bulk decoding needs NumPy; everything else works without it
+
+ACTIONRECORD = struct.Struct('<HHHH')
+TURNRECORD = struct.Struct('<I')
+BULKDECODEMIN = 32 # below this many actions, decoding one by one is quicker
+CONTROLLERSPEC = re.compile(r'^([A-Za-z_][\w.]*):([A-Za-z_]\w*)(#\w+)?$')
+MAXWORLDSIZE = 0x7FFF
+WIDEPARAMDIGITS = 8 # a SPAWN with at least this many param digits holds 4-digit values
+SCANRADIUS = 1 # radius of a SCAN that asks for 0
+MAXSCANRADIUS = 7
+HEXDIGITSTRING = '0123456789abcdef'
+# NumPy layouts for bulk decoding: RECORDDTYPE matches ACTIONRECORD byte for
+# byte, ACTIONDTYPE adds a flag for whether the row passed validation
+if numpy is not None:
+	RECORDDTYPE = numpy.dtype([('type', '<u2'), ('unit', '<u2'), ('param0', '<u2'), ('param1', '<u2')])
+	ACTIONDTYPE = numpy.dtype([('type', '<u2'), ('unit', '<u2'), ('param0', '<u2'), ('param1', '<u2'), ('valid', '?')])
+	# Maps ASCII codes to hex digit values; anything else maps to 0xFF
+	HEXDIGITS = numpy.full(256, 0xFF, dtype=numpy.uint8)
+	for digit in b'0123456789abcdef':
+		HEXDIGITS[digit] = int(chr(digit), base=16)
+		HEXDIGITS[ord(chr(digit).upper())] = int(chr(digit), base=16)
 
 class Dir(Enum):
 	# Defines the set of directions on the map
@@ -44,64 +116,345 @@ class ActionType(Enum):
 	SPAWN = 4 # Create a new bot at specified location
 	# ActionTypes with num > 0x0100 are reserved?
 
+class Cell(Enum):
+	# Defines what a SCAN can see on a square
+	EMPTY = 0
+	FRIEND = 1
+	ENEMY = 2
+	EDGE = 3 # off the board
+
+class ProtocolMode(Enum):
+	# Defines the ways a controller may exchange actions with the arena
+	UNIT = 'unit' # Default, one request per unit
+	BATCH = 'batch' # One request per controller per turn
+
+class WireFormat(Enum):
+	# Defines the encodings a controller may use for its actions
+	HEX = 'hex' # Default, bytecode strings
+	BIN = 'bin' # Fixed-width ACTIONRECORD structs
+
 class Action:
+	# Actions are slotted and reused from turn to turn (see Engine.GetPooledAction),
+	# so subclasses list their fields in __slots__ and re-aim them in Set
+	__slots__ = ()
 	Type = ActionType.DELAY
 	Subject = 0x0000 # corr. to the unit's ID
+	Params = () # the action's params as ints, in bytecode order
 
 	@abstractmethod
 	def Do(self):
 		pass
 
+class Controller:
+	# Base for controllers that run inside the arena's process
+	# The arena calls these directly instead of exchanging messages over pipes
+	Name = ''
+	WorldSize = (0, 0) # (width, height)
+	Seed = None
+
+	def Start(self, name, worldSize, seed = None):
+		# Called once, before the first turn
+		# worldSize is the (width, height) of the world
+		# A controller that rolls dice should seed them from seed, so that
+		# battles with a fixed --seed can be replayed exactly
+		self.Name = name
+		self.WorldSize = tuple(worldSize)
+		self.Seed = seed
+
+	def NextActions(self, turn, unitIDs, results):
+		# Called once per turn with the IDs of all of this controller's living
+		# units and a dict of ID -> return value of each unit's previous action
+		# Returns a list of action values (ActionType, unit ID, params), as
+		# given by BattleParser.ConvertToValues; units left out will delay
+		return list()
+
+	def Stop(self):
+		# Called once, when the battle is over
+		pass
+
+def ScanOffsets(radius):
+	# Returns the (dx, dy) of every square a SCAN of the given radius covers,
+	# in the order its cells are sent
+	return [(dx, dy) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)]
+
+def ParseWorldSize(text):
+	# Reads a world size given as N (square) or WxH
+	# Returns a (width, height) tuple
+	# Raises ValueError if text is not a size or is out of range
+	widthString, sep, heightString = str(text).lower().partition('x')
+	width = int(widthString)
+	height = int(heightString) if len(sep) > 0 else width
+	if not (0 < width <= MAXWORLDSIZE and 0 < height <= MAXWORLDSIZE):
+		raise ValueError("world sizes run from 1 to {}: {}".format(MAXWORLDSIZE, text))
+	return (width, height)
+
+def ParseSquare(text):
+	# Reads a square given as X,Y
+	# Returns an (x, y) tuple
+	# Raises ValueError if text is not exactly two integers
+	values = str(text).split(',')
+	if len(values) != 2:
+		raise ValueError("a square is X,Y: {}".format(text))
+	return (int(values[0]), int(values[1]))
+
+def FormatWorldSize(width, height):
+	# The reverse of ParseWorldSize
+	if width == height:
+		return str(width)
+	return "{}x{}".format(width, height)
+
+def IsControllerSpec(text):
+	# Returns True if text names a plugin (module:Class) rather than a pipe
+	return CONTROLLERSPEC.match(text) is not None
+
+def LoadController(spec):
+	# Imports and creates the plugin named by a module:Class spec
+	# Raises ValueError if spec does not name a Controller
+	found = CONTROLLERSPEC.match(spec)
+	if found is None:
+		raise ValueError("not a module:Class controller spec: {}".format(spec))
+	controllerType = getattr(importlib.import_module(found.group(1)), found.group(2), None)
+	if not isinstance(controllerType, type) or not issubclass(controllerType, Controller):
+		raise ValueError("{} is not a Controller".format(spec))
+	return controllerType()
+
+# Every decoder checks the same things (see IsAimedOK), so that an action
+# decodes the same way whether it comes one at a time or in bulk
+HEXDIGITSET = frozenset(HEXDIGITSTRING)
+AIMEDTYPES = frozenset((ActionType.MOVE.value, ActionType.ATTACK.value))
+DIRVALUES = frozenset(entry.value for entry in Dir if entry != Dir.NONE)
+ACTIONTYPEOF = {entry.value: entry for entry in ActionType} # quicker than ActionType(value)
+
+def CleanCode(inputCodeString):
+	# Strips one 0x prefix from a bytecode and lowercases it
+	# Returns the digits, or None unless there are at least 8 and every
+	# one of them is a hex digit
+	code = inputCodeString.lower()
+	if code[:2] == '0x':
+		code = code[2:]
+	if len(code) < 8 or not HEXDIGITSET.issuperset(code):
+		return None
+	return code
+
+def IsAimedOK(actionValue, param0):
+	# A MOVE or ATTACK needs a real Dir as its first param
+	return actionValue not in AIMEDTYPES or param0 in DIRVALUES
+
 class BattleParser:
 	# Provides methods for converting to/from bytecode and Actions
 	def ConvertToValues(inputCodeString):
 		# Given a hexadecimal string of at least 8 digits,
-		# Returns a tuple of values: an ActionType, a unit ID, and addtl params
+		# Returns a tuple of values: an ActionType, a unit ID, and two params
+		# (4 digits each for a wide SPAWN, 2 otherwise; any further digits
+		# must be hex but are ignored)
 		# Returns false if there was a problem
-		#print("|   :      " + inputCodeString) # DEBUG
-		if inputCodeString[:2] == '0x':
-			#print("|   Removed hex prefix from code string") # DEBUG
-			inputCodeString = inputCodeString[2:]
-		if len(inputCodeString) < 8:
-			#print("| ! ERR: action input too short to parse: {}".format(inputCodeString)) # DEBUG
-			# FIXME: throw exception here prolly?
+		code = CleanCode(inputCodeString)
+		if code is None:
+			return False
+		code = code.ljust(12, '0') # pad with zeroes if too short
+		actionValue = int(code[:4], base=16)
+		actionType = ACTIONTYPEOF.get(actionValue)
+		if actionType is None:
+			return False
+		if actionType == ActionType.SPAWN and len(code) >= 8 + WIDEPARAMDIGITS:
+			params = [int(code[8:12], base=16), int(code[12:16], base=16)]
+		else:
+			params = [int(code[8:10], base=16), int(code[10:12], base=16)]
+		if actionValue in AIMEDTYPES and params[0] not in DIRVALUES: # IsAimedOK, inlined
+			return False
+		return (actionType, code[4:8], params)
+
+	def ConvertFromBinary(buffer, offset = 0):
+		# Given a buffer holding an ACTIONRECORD at offset,
+		# Returns the same tuple of values as ConvertToValues
+		# Returns false if there was a problem
+		try:
+			actionValue, unitID, param0, param1 = ACTIONRECORD.unpack_from(buffer, offset)
+		except struct.error:
+			return False
+		actionType = ACTIONTYPEOF.get(actionValue)
+		if actionType is None or not IsAimedOK(actionValue, param0):
+			return False
+		return (actionType, format(unitID, '04x'), [param0, param1])
+
+	def ConvertToBytecode(actionType, unitID, params = (), wireFormat = WireFormat.HEX):
+		# Encodes an action for sending to the arena
+		# unitID is the unit's 4-digit hex ID; params are small ints (e.g. a
+		# Dir value or a coordinate)
+		# Returns a hex string or a bytes ACTIONRECORD depending on wireFormat
+		if wireFormat == WireFormat.BIN:
+			paramValues = list(params[:2]) + [0] * (2 - len(params[:2]))
+			return ACTIONRECORD.pack(actionType.value, int(unitID, base=16), *paramValues)
+		bytecodeString = format(actionType.value, '04x') + unitID + BattleParser.EncodeParams(actionType, params)
+		return '0x' + bytecodeString.ljust(12, '0')
+
+	def EncodeParams(actionType, params):
+		# Returns the hex digits of an action's params: 2-digit pairs, or
+		# 4-digit values for a SPAWN's location
+		if actionType == ActionType.SPAWN:
+			return "".join(format(entry, '04x') for entry in params)
+		return "".join(format(entry, '02x') for entry in params)
+
+	def ConvertBlockToArray(block):
+		# Decodes many actions at once into a NumPy array of ACTIONDTYPE
+		# block is a bytes-like run of ACTIONRECORDs, a NumPy array with the
+		# fields of RECORDDTYPE (such as a strided view of a gameplay record),
+		# or a list of hex bytecode strings; only the first two params of a
+		# bytecode are kept
+		# (4 digits each for a wide SPAWN, 2 otherwise)
+		# Rows that ConvertToValues or ConvertFromBinary would turn down (an
+		# unknown ActionType, a bad Dir for a MOVE/ATTACK, or a bytecode that
+		# CleanCode rejects) have valid set to False
+		if numpy is None:
+			raise ImportError("NumPy is needed for bulk decoding")
+		result = None
+		if isinstance(block, (bytes, bytearray, memoryview, numpy.ndarray)):
+			records = block
+			if not isinstance(block, numpy.ndarray):
+				records = numpy.frombuffer(block, dtype=RECORDDTYPE)
+			result = numpy.empty(len(records), dtype=ACTIONDTYPE)
+			for field in RECORDDTYPE.names:
+				result[field] = records[field]
+			result['valid'] = True
+		else:
+			# Normalize to exactly 16 digits per code, then work on the digits
+			codes = list()
+			wide = numpy.zeros(len(block), dtype=bool) # long enough for 4-digit params
+			for index, code in enumerate(block):
+				code = CleanCode(code)
+				if code is None:
+					code = 'z' * 12 # marks the row invalid
+				wide[index] = len(code) >= 8 + WIDEPARAMDIGITS
+				# Digits past the params used are checked by CleanCode, then ignored
+				code = code[:16] if wide[index] else code[:12].ljust(12, '0')
+				codes.append(code.ljust(16, '0'))
+			digits = HEXDIGITS[numpy.frombuffer(''.join(codes).encode('ascii', 'replace'), dtype=numpy.uint8)]
+			digits = digits.reshape(len(codes), 16).astype(numpy.uint16)
+			result = numpy.empty(len(codes), dtype=ACTIONDTYPE)
+			result['type'] = (digits[:, 0] << 12) | (digits[:, 1] << 8) | (digits[:, 2] << 4) | digits[:, 3]
+			result['unit'] = (digits[:, 4] << 12) | (digits[:, 5] << 8) | (digits[:, 6] << 4) | digits[:, 7]
+			result['param0'] = (digits[:, 8] << 4) | digits[:, 9]
+			result['param1'] = (digits[:, 10] << 4) | digits[:, 11]
+			wide &= result['type'] == ActionType.SPAWN.value
+			result['param0'][wide] = ((digits[:, 8] << 12) | (digits[:, 9] << 8) | (digits[:, 10] << 4) | digits[:, 11])[wide]
+			result['param1'][wide] = ((digits[:, 12] << 12) | (digits[:, 13] << 8) | (digits[:, 14] << 4) | digits[:, 15])[wide]
+			result['valid'] = (digits != 0xFF).all(axis=1)
+		actionTypes = [entry.value for entry in ActionType]
+		result['valid'] &= numpy.isin(result['type'], actionTypes)
+		# IsAimedOK on every row at once
+		aimed = numpy.isin(result['type'], list(AIMEDTYPES))
+		result['valid'] &= ~aimed | numpy.isin(result['param0'], list(DIRVALUES))
+		return result
+
+	def ConvertArrayToValues(actionArray):
+		# Turns the rows of an ACTIONDTYPE array into the same tuples that
+		# ConvertToValues returns, one per row and in the same order
+		# Invalid rows come back as False, as ConvertToValues would return
+		actionTypes = {entry.value: entry for entry in ActionType}
+		return [(actionTypes[actionValue], format(unitID, '04x'), [param0, param1]) if valid else False
+				for actionValue, unitID, param0, param1, valid in zip(actionArray['type'].tolist(), actionArray['unit'].tolist(),
+						actionArray['param0'].tolist(), actionArray['param1'].tolist(), actionArray['valid'].tolist())]
+
+	def EncodeScan(radius, cells):
+		# Builds a SCAN's return value from a radius and a list of Cell values
+		# (ints), in ScanOffsets order
+		packed = [HEXDIGITSTRING[cells[index] | (cells[index + 1] << 2)] for index in range(0, len(cells) - 1, 2)]
+		if len(cells) % 2 == 1:
+			packed.append(HEXDIGITSTRING[cells[-1]])
+		return 'S' + HEXDIGITSTRING[radius] + "".join(packed)
+
+	def DecodeScan(text):
+		# Unpacks a SCAN's return value
+		# Returns a tuple of the radius and a dict of (dx, dy) -> Cell for
+		# every square covered, or false if text is not a scan
+		if not isinstance(text, str) or len(text) < 2 or text[0] != 'S':
+			return False
+		try:
+			radius = int(text[1], base=16)
+			packed = bytes.fromhex(text[2:] + '0' * (len(text) % 2)) # whole bytes, high digit first
+		except ValueError:
+			return False
+		offsets = ScanOffsets(radius)
+		if (len(text) - 2) * 2 < len(offsets):
+			return False
+		cells = list()
+		for value in packed:
+			# each byte holds two hex digits, i.e. four cells
+			cells += [Cell((value >> 4) & 3), Cell(value >> 6), Cell(value & 3), Cell((value >> 2) & 3)]
+		return (radius, dict(zip(offsets, cells)))
+
+	def EncodeHello(mode, wireFormat = WireFormat.HEX):
+		# Builds the line a controller sends to open its session
+		return "HELLO {} {}".format(mode.value, wireFormat.value)
+
+	def DecodeHello(line):
+		# Returns a tuple of the ProtocolMode and WireFormat asked for by a hello
+		# Returns false if the line is not a valid hello
+		if not isinstance(line, str):
+			return False
+		words = line.split()
+		if len(words) < 2 or words[0] != 'HELLO':
+			return False
+		try:
+			mode = ProtocolMode(words[1])
+			wireFormat = WireFormat.HEX
+			if len(words) > 2:
+				wireFormat = WireFormat(words[2])
+		except ValueError:
+			return False
+		return (mode, wireFormat)
+
+	def EncodeBatchRequest(turn, unitIDs, results):
+		# Builds the per-turn request for a batch controller
+		# results maps unit IDs to the previous turn's return values
+		resultString = ";".join("{}:{}".format(unitID, value) for unitID, value in results.items())
+		return "{}|{}|{}".format(turn, " ".join(unitIDs), resultString)
+
+	def DecodeBatchRequest(line):
+		# Returns a tuple of the turn number, a list of unit IDs and a dict of
+		# the previous turn's return values as strings
+		turnString, idString, resultString = line.split('|', 2)
+		results = dict()
+		for entry in resultString.split(';'):
+			if len(entry) > 0:
+				unitID, value = entry.split(':', 1)
+				results[unitID] = value
+		return (int(turnString), idString.split(), results)
+
+	def EncodeBatchReply(turn, bytecodes):
+		# Builds a batch controller's reply to the request for the given turn
+		return "{}|{}".format(turn, " ".join(bytecodes))
+
+	def DecodeBatchReply(line):
+		# Returns a tuple of the turn number and a list of bytecodes
+		# Returns false if the reply is malformed
+		if not isinstance(line, str):
+			return False
+		turnString, sep, codeString = line.partition('|')
+		if len(sep) == 0 or not turnString.isdigit():
+			return False
+		return (int(turnString), codeString.split())
+
+	def EncodeBatchReplyBinary(turn, records):
+		# Builds a binary batch reply from ACTIONRECORDs
+		return TURNRECORD.pack(turn) + b''.join(records)
+
+	def DecodeBatchReplyBinary(buffer):
+		# Returns a tuple of the turn number and a list of action values, one
+		# per record; records that cannot be decoded are given as False
+		# Returns false if the reply is malformed
+		if not isinstance(buffer, (bytes, bytearray, memoryview)):
+			return False
+		view = memoryview(buffer)
+		if len(view) < TURNRECORD.size or (len(view) - TURNRECORD.size) % ACTIONRECORD.size != 0:
 			return False
-		inputCodeString = inputCodeString.ljust(12, '0') # pad with zeroes if too short
-		# Slice the whole string up into pieces
-		actionString = inputCodeString[:4]
-		idString = inputCodeString[4:8]
-		paramString = inputCodeString[8:]
-		# Convert the part strings
-		actionType = ActionType(int(actionString))
-		params = list()
-		if len(paramString) > 2:
-			# Slice params into 2-digit chunks
-			n = 0
-			p = 2
-			keepSlicing = True
-			while keepSlicing:
-				if p >= len(paramString):
-					keepSlicing = False
-				params.append(paramString[n:p])
-				n += 2
-				p = n + 2
-		else: # length of paramString <= 2
-			params.append(paramString)
-		#print("|   : action " + actionString) # DEBUG
-		#print("|   : id     " + idString) # DEBUG
-		#print("|   : params {}".format(params)) # DEBUG
-		return (actionType, idString, params)
-
-	def ConvertToBytecode(inputAction, params):
-		# WARNING! This is untested/unused
-		# FIXME: There is no definition for the format of params yet
-		bytecodeString = ""
-		bytecodeString += inputAction.Type.value
-		bytecodeString += inputAction.Subject
-		for entry in params:
-			# Currently, this presumes all params to be Enums with hex value
-			# equivalents; this will be improved as use-cases become clear
-			bytecodeString += entry
-		return bytecodeString
+		turn = TURNRECORD.unpack_from(view, 0)[0]
+		if numpy is not None and len(view) >= BULKDECODEMIN * ACTIONRECORD.size:
+			actionArray = BattleParser.ConvertBlockToArray(view[TURNRECORD.size:])
+			return (turn, BattleParser.ConvertArrayToValues(actionArray))
+		values = list()
+		for offset in range(TURNRECORD.size, len(view), ACTIONRECORD.size):
+			values.append(BattleParser.ConvertFromBinary(view, offset))
+		return (turn, values)
 
 # EOF
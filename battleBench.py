@@ -0,0 +1,439 @@
+#!/usr/bin/python3
+# battleBench.py
+# Benchmarks for the arena, in three suites:
+#  memory  what the units and their actions cost in memory
+#  micro   the engine's hot paths, one at a time
+#  sweep   whole battles across world sizes, army sizes and controllers
+# Every suite reports a list of results (name, value, unit, and whether lower
+# or higher is better), which can be saved with --output and checked against
+# an earlier run with --compare; see COMPARING.
+# MEMORY
+# Runs an in-process battle (RandoBot against RandoBot with a fixed seed,
+# headless and without a record) under tracemalloc and reports:
+#  unit bytes     memory taken per unit by creating the armies
+#  held bytes     memory held per unit once the battle has run, including
+#                 anything the engine keeps between turns
+#  peak           the most memory traced at any point in the battle
+#  gc runs        garbage collections per generation during the battle
+#  actions        actions carried out, and Action objects created for them
+# tracemalloc slows everything down, so the turn rate here is not comparable
+# with a normal run.
+# MICRO
+# Times single operations on a battle that has already been set up, taking
+# the best of --repeat runs of as many calls as fill about 0.2s:
+#  convertToValues    decoding a hex bytecode
+#  convertFromBinary  decoding a binary ACTIONRECORD
+#  isOccupied         checking a square, about half of them occupied
+#  getIDAt            looking up the unit on a square
+#  buildActionFrom    turning action values into a pooled Action, and
+#                     handing it back at the end of the turn
+#  scan               a SCAN of SCANRADIUS around a living unit
+#  iterateBattle      a whole turn of MICROARMY units a side
+# With NumPy, it first decodes DECODECHECKS made-up bytecodes, good and bad,
+# both one at a time and in bulk, and reports how many came out differently
+# as decodeMismatches; any at all make the exit status 1.
+# SWEEP
+# Runs headless battles without a record for every combination of --worlds,
+# --armies and --controllers, and reports the unit actions carried out per
+# second (the best of --repeat). The controllers are in-process plugins:
+#  stub   StubController, which rolls no dice and costs next to nothing, so
+#         the battle measures the engine alone
+#  rando  RandoBot
+# With --turn-mode simultaneous the battles resolve their turns all at once
+# (see battleResolve), and the results are named with the mode at the end;
+# with --arrays the units are kept in an ArrayStore (see battleWorld), and
+# the names end in /arrays.
+# COMPARING
+# --output saves the results as JSON; --compare loads an earlier file and
+# prints the change in every result both runs have, marking those that got
+# worse by more than --threshold percent. The exit status is 1 if any did, so
+# a run can fail a build.
+# IMPORTS
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+from battler import Engine, WORLDSIDELENGTH
+from battleActions import ActionType, BattleParser, Controller, Dir, WireFormat, numpy, SCANRADIUS
+from battleResolve import TurnMode
+from battleWorld import ArrayStore, HasArrays
+
+PLUGIN = 'randoBot:RandoBot'
+CONTROLLERS = {'stub': 'battleBench:StubController', 'rando': PLUGIN}
+ACTIONCLASSES = (Engine.DelayAction, Engine.ScanAction, Engine.MoveAction, Engine.AttackAction, Engine.SpawnAction)
+MICROARMY = 1000 # units a side for the micro suite
+MICROWORLD = 64
+MICROTURNS = 20 # turns timed by iterateBattle
+MICROBATCH = 1024 # operations per call of the other micro benchmarks
+DECODECHECKS = 20000 # bytecodes decoded both ways by the micro suite
+SUITES = ('memory', 'micro', 'sweep')
+
+class StubController(Controller):
+	# A controller that costs as little as possible: its units spawn in rows
+	# from its own corner, then take turns to move and to attack towards the
+	# other side
+	def Start(self, name, worldSize, seed = None):
+		super().Start(name, worldSize, seed)
+		self.Spawned = set()
+		self.Mirrored = name.endswith('#2') # the second side starts from the far corner
+		self.Forward = (Dir.DOWN if self.Mirrored else Dir.UP).value
+
+	def NextActions(self, turn, unitIDs, results):
+		actions = list()
+		forward = [self.Forward]
+		act = ActionType.MOVE if turn % 2 == 0 else ActionType.ATTACK
+		for unitID in unitIDs:
+			if unitID in self.Spawned:
+				actions.append((act, unitID, forward))
+				continue
+			width, height = self.WorldSize
+			yVal, xVal = divmod(len(self.Spawned), width)
+			if self.Mirrored:
+				xVal = width - 1 - xVal
+				yVal = height - 1 - yVal
+			self.Spawned.add(unitID)
+			actions.append((ActionType.SPAWN, unitID, [xVal, yVal]))
+		return actions
+
+def Result(name, value, unit, better = 'lower'):
+	# One benchmark result, as saved and compared
+	return {'name': name, 'value': value, 'unit': unit, 'better': better}
+
+def MakeBattle(controller, seed = 1, arrays = False, worldSize = WORLDSIDELENGTH, turnMode = TurnMode.SEQUENTIAL):
+	# Returns a headless engine on a square world with two copies of a
+	# plugin, not yet set up
+	engine = Engine(controller + '#1', controller + '#2')
+	engine.Width = engine.Height = worldSize
+	engine.Headless = True
+	engine.Seed = seed
+	engine.TurnMode = turnMode
+	if arrays:
+		engine.SetStore(ArrayStore())
+	return engine
+
+def MeasureMemory(armySize, turns, seed = 1, arrays = False):
+	# Runs one battle and returns its memory figures as a dict
+	engine = MakeBattle(PLUGIN, seed, arrays)
+	engine.SetUpComms() # imports the plugin before anything is traced
+	engine.MaxDuration = turns
+	gc.collect()
+	tracemalloc.start()
+	baseBytes = tracemalloc.get_traced_memory()[0]
+	engine.SetupBattle(armySize)
+	gc.collect()
+	unitCount = len(engine.ListActors)
+	setupBytes = tracemalloc.get_traced_memory()[0]
+	# Count the Action objects the engine makes while the battle runs
+	created = [0]
+	originals = {actionClass: actionClass.__init__ for actionClass in ACTIONCLASSES}
+	for actionClass, original in originals.items():
+		def CountingInit(self, *args, original = original):
+			created[0] += 1
+			original(self, *args)
+		actionClass.__init__ = CountingInit
+	gcBefore = [entry['collections'] for entry in gc.get_stats()]
+	actionsDone = 0
+	engine.SetToState(Engine.Mode.RUNNING)
+	startTime = time.perf_counter()
+	try:
+		while not engine.IsBattleOver():
+			actionsDone += len(engine.ListActors)
+			engine.IterateBattle()
+	finally:
+		for actionClass, original in originals.items():
+			actionClass.__init__ = original
+	elapsed = time.perf_counter() - startTime
+	gcRuns = [entry['collections'] - before for entry, before in zip(gc.get_stats(), gcBefore)]
+	gc.collect()
+	heldBytes, peakBytes = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	engine.Cleanup()
+	return {
+		'store': 'arrays' if arrays else 'objects',
+		'units': unitCount,
+		'turns': engine.TurnCur,
+		'unitBytes': (setupBytes - baseBytes) / unitCount,
+		'heldBytes': (heldBytes - baseBytes) / unitCount,
+		'peakBytes': peakBytes - baseBytes,
+		'gcRuns': gcRuns,
+		'actions': actionsDone,
+		'actionObjects': created[0],
+		'seconds': elapsed
+	}
+
+def MemoryResults(figures):
+	# Turns the figures from MeasureMemory into results
+	prefix = 'memory/{}/'.format(figures['store'])
+	return [
+		Result(prefix + 'unitBytes', figures['unitBytes'], 'B/unit'),
+		Result(prefix + 'heldBytes', figures['heldBytes'], 'B/unit'),
+		Result(prefix + 'peakBytes', figures['peakBytes'], 'B'),
+		Result(prefix + 'actionObjects', figures['actionObjects'], 'objects')
+	]
+
+def PrintMemory(figures):
+	print("{store}: {units} units, {turns} turns".format(**figures))
+	print("  unit bytes  {:10.1f}".format(figures['unitBytes']))
+	print("  held bytes  {:10.1f}".format(figures['heldBytes']))
+	print("  peak        {:10.1f} KiB".format(figures['peakBytes'] / 1024))
+	print("  gc runs     {}".format(" / ".join(str(runs) for runs in figures['gcRuns'])))
+	print("  actions     {} carried out, {} objects created".format(figures['actions'], figures['actionObjects']))
+	print("  time        {:10.3f}s (traced)".format(figures['seconds']))
+
+def BestTime(function, repeat):
+	# Returns the best time of one call of function(), in seconds
+	timer = timeit.Timer(function)
+	number, _ = timer.autorange()
+	return min(timer.repeat(repeat, number)) / number
+
+def FuzzCode(dice):
+	# Returns a made-up bytecode: usually a real action, often mangled
+	actionType = dice.choice(list(ActionType))
+	params = [dice.randrange(16), dice.randrange(256)]
+	if actionType == ActionType.SPAWN:
+		params = [dice.randrange(1 << 16), dice.randrange(1 << 16)]
+	code = BattleParser.ConvertToBytecode(actionType, format(dice.randrange(1 << 16), '04x'), params)
+	match dice.randrange(6):
+		case 0:
+			code = code.upper()
+		case 1:
+			code = code[:dice.randrange(len(code) + 1)] # cut short
+		case 2:
+			code += "".join(dice.choice('0123456789abcdefABCDEF') for index in range(dice.randrange(8)))
+		case 3:
+			index = dice.randrange(len(code) + 1)
+			code = code[:index] + dice.choice('gxX _-+') + code[index + 1:]
+		case 4:
+			code = '0x' + code
+	return code
+
+def CheckDecoders(codes):
+	# Decodes the codes one at a time and in bulk
+	# Returns a list of (code, one at a time, in bulk) where they differ
+	bulk = BattleParser.ConvertArrayToValues(BattleParser.ConvertBlockToArray(codes))
+	return [(code, single, many) for code, single, many in zip(codes, [BattleParser.ConvertToValues(code) for code in codes], bulk)
+			if single != many]
+
+def MicroBattle(seed):
+	# Returns an engine with MICROARMY units a side that have all spawned
+	engine = MakeBattle(CONTROLLERS['stub'], seed, worldSize=MICROWORLD)
+	engine.SetUpComms()
+	engine.SetupBattle(MICROARMY)
+	engine.SetToState(Engine.Mode.RUNNING)
+	engine.IterateBattle()
+	return engine
+
+def RunMicro(repeat, seed = 1):
+	# Runs the micro suite and returns its results
+	results = list()
+	dice = random.Random(seed)
+	if numpy is not None:
+		mismatches = CheckDecoders([FuzzCode(dice) for index in range(DECODECHECKS)])
+		for code, single, many in mismatches[:10]:
+			print("decoders disagree on {!r}: {} one at a time, {} in bulk".format(code, single, many))
+		results.append(Result('micro/decodeMismatches', len(mismatches), 'codes'))
+	engine = MicroBattle(seed)
+	values = list()
+	for index in range(MICROBATCH):
+		unitID = format(dice.randrange(1, 2 * MICROARMY), '04x')
+		match dice.randrange(4):
+			case 0:
+				values.append((ActionType.DELAY, unitID, []))
+			case 1:
+				values.append((ActionType.MOVE, unitID, [dice.choice((Dir.UP, Dir.DOWN, Dir.LEFT, Dir.RIGHT)).value]))
+			case 2:
+				values.append((ActionType.ATTACK, unitID, [dice.choice((Dir.UP, Dir.DOWN, Dir.LEFT, Dir.RIGHT)).value]))
+			case 3:
+				values.append((ActionType.SPAWN, unitID, [dice.randrange(MICROWORLD), dice.randrange(MICROWORLD)]))
+	codes = [BattleParser.ConvertToBytecode(*entry) for entry in values]
+	records = [BattleParser.ConvertToBytecode(*entry, WireFormat.BIN) for entry in values]
+	squares = [(dice.randrange(MICROWORLD), dice.randrange(MICROWORLD)) for index in range(MICROBATCH)]
+	scans = [engine.ScanAction(engine, dice.choice(engine.ListActors).ID, SCANRADIUS) for index in range(MICROBATCH)]
+	def ConvertToValues():
+		for code in codes:
+			BattleParser.ConvertToValues(code)
+	def ConvertFromBinary():
+		for record in records:
+			BattleParser.ConvertFromBinary(record)
+	def IsOccupied():
+		for square in squares:
+			engine.IsOccupied(square)
+	def GetIDAt():
+		for xVal, yVal in squares:
+			engine.GetIDAt(xVal, yVal)
+	def BuildActionFrom():
+		for actionType, unitID, params in values:
+			engine.ListActionsThisTurn.append(engine.BuildActionFrom(actionType, unitID, params))
+		engine.ReleaseActions()
+	def Scan():
+		for action in scans:
+			action.Do()
+	for name, function in (('convertToValues', ConvertToValues), ('convertFromBinary', ConvertFromBinary),
+			('isOccupied', IsOccupied), ('getIDAt', GetIDAt), ('buildActionFrom', BuildActionFrom),
+			('scan', Scan)):
+		results.append(Result('micro/' + name, BestTime(function, repeat) / MICROBATCH * 1e9, 'ns/op'))
+	engine.Cleanup()
+	# A turn changes the battle, so each run gets a fresh one
+	best = None
+	for run in range(repeat):
+		engine = MicroBattle(seed)
+		startTime = time.perf_counter()
+		for turn in range(MICROTURNS):
+			engine.IterateBattle()
+		elapsed = (time.perf_counter() - startTime) / MICROTURNS
+		engine.Cleanup()
+		best = elapsed if best is None else min(best, elapsed)
+	results.append(Result('micro/iterateBattle', best * 1e6, 'us/turn'))
+	return results
+
+def RunBattle(controller, worldSize, armySize, turns, seed = 1, arrays = False, turnMode = TurnMode.SEQUENTIAL):
+	# Runs one headless battle without a record
+	# Returns the number of unit actions carried out and the seconds taken
+	engine = MakeBattle(controller, seed, arrays, worldSize, turnMode)
+	engine.SetUpComms()
+	engine.MaxDuration = turns
+	actionsDone = 0
+	startTime = time.perf_counter()
+	engine.SetupBattle(armySize)
+	engine.SetToState(Engine.Mode.RUNNING)
+	while not engine.IsBattleOver():
+		actionsDone += len(engine.ListActors)
+		engine.IterateBattle()
+	elapsed = time.perf_counter() - startTime
+	engine.Cleanup()
+	return (actionsDone, elapsed)
+
+def RunSweep(worlds, armies, controllers, turns, repeat, seed = 1, arrays = False, turnMode = TurnMode.SEQUENTIAL):
+	# Runs the sweep suite and returns its results
+	results = list()
+	for name in controllers:
+		for worldSize in worlds:
+			for armySize in armies:
+				best = 0.0
+				for run in range(repeat):
+					actionsDone, elapsed = RunBattle(CONTROLLERS[name], worldSize, armySize, turns, seed, arrays, turnMode)
+					best = max(best, actionsDone / elapsed if elapsed > 0 else 0.0)
+				label = 'sweep/{}/world{}/army{}'.format(name, worldSize, armySize)
+				if turnMode != TurnMode.SEQUENTIAL:
+					label += '/' + turnMode.value
+				if arrays:
+					label += '/arrays'
+				results.append(Result(label, best, 'actions/s', 'higher'))
+				print("{:<36} {:>12.0f} actions/s".format(label, best))
+	return results
+
+def Compare(oldResults, newResults, threshold):
+	# Prints the change in every result found in both runs
+	# Returns the number of results that got worse by more than threshold percent
+	old = {entry['name']: entry for entry in oldResults}
+	worse = 0
+	print("{:<36} {:>12} {:>12} {:>8}".format('result', 'before', 'after', 'change'))
+	for entry in newResults:
+		before = old.get(entry['name'])
+		if before is None or before['value'] == 0:
+			continue
+		change = 100.0 * (entry['value'] - before['value']) / before['value']
+		if entry['better'] == 'higher':
+			regressed = change < -threshold
+		else:
+			regressed = change > threshold
+		if regressed:
+			worse += 1
+		print("{:<36} {:>12.4g} {:>12.4g} {:>+7.1f}% {}{}".format(entry['name'], before['value'], entry['value'],
+				change, entry['unit'], '  WORSE' if regressed else ''))
+	return worse
+
+def ParseSizes(text):
+	return [int(entry) for entry in text.split(',') if entry != '']
+
+def main():
+	argparser = argparse.ArgumentParser(prog='battleBench.py',
+			description='Benchmarks the robot battler.')
+	argparser.add_argument('suite', nargs='?', default='memory', choices=SUITES + ('all',),
+			help='The suite to run (default memory).')
+	argparser.add_argument('--size', '-s', type=int, default=5000,
+			help='The number of units each side spawns in the memory suite.')
+	argparser.add_argument('--time', '-t', type=int, default=50,
+			help='The number of turns to run in the memory suite.')
+	argparser.add_argument('--seed', type=int, default=1,
+			help='The seed for both bots\' dice.')
+	argparser.add_argument('--arrays', action='store_true', default=False,
+			help='Also measure the array store (memory), or use it instead (sweep).')
+	argparser.add_argument('--worlds', type=str, default='16,256,4096',
+			help='The world sizes for the sweep suite, separated by commas.')
+	argparser.add_argument('--armies', type=str, default='100,1000,10000',
+			help='The units a side for the sweep suite, separated by commas.')
+	argparser.add_argument('--controllers', type=str, default=','.join(CONTROLLERS),
+			help='The controllers for the sweep suite, separated by commas: {}.'.format(', '.join(CONTROLLERS)))
+	argparser.add_argument('--turns', type=int, default=20,
+			help='The number of turns in each battle of the sweep suite.')
+	argparser.add_argument('--turn-mode', type=str, default=TurnMode.SEQUENTIAL.value,
+			choices=[entry.value for entry in TurnMode],
+			help='How the sweep suite\'s battles carry out their turns.')
+	argparser.add_argument('--repeat', '-r', type=int, default=3,
+			help='The number of runs of each benchmark to take the best of.')
+	argparser.add_argument('--output', '-o', type=str, default=None,
+			help='The path of a JSON file to save the results to.')
+	argparser.add_argument('--compare', '-c', type=str, default=None,
+			help='The path of an earlier results file to compare with.')
+	argparser.add_argument('--threshold', type=float, default=10.0,
+			help='The percentage by which a result may get worse before it counts as a regression.')
+	args = argparser.parse_args()
+	suites = SUITES if args.suite == 'all' else (args.suite,)
+	controllers = [name for name in args.controllers.split(',') if name != '']
+	for name in controllers:
+		if name not in CONTROLLERS:
+			print("Unknown controller {}; choose from {}. Exiting.".format(name, ', '.join(CONTROLLERS)))
+			return
+	results = list()
+	if 'memory' in suites:
+		figures = MeasureMemory(args.size, args.time, args.seed)
+		PrintMemory(figures)
+		results += MemoryResults(figures)
+		if args.arrays and HasArrays():
+			figures = MeasureMemory(args.size, args.time, args.seed, arrays=True)
+			PrintMemory(figures)
+			results += MemoryResults(figures)
+	failed = False
+	if 'micro' in suites:
+		microResults = RunMicro(args.repeat, args.seed)
+		for entry in microResults:
+			print("{:<36} {:>12.1f} {}".format(entry['name'], entry['value'], entry['unit']))
+			if entry['name'] == 'micro/decodeMismatches' and entry['value'] > 0:
+				failed = True
+		results += microResults
+	if 'sweep' in suites:
+		results += RunSweep(ParseSizes(args.worlds), ParseSizes(args.armies), controllers,
+				args.turns, args.repeat, args.seed, args.arrays and HasArrays(), TurnMode(args.turn_mode))
+	if args.output is not None:
+		report = {
+			'machine': {
+				'python': platform.python_version(),
+				'platform': platform.platform(),
+				'numpy': numpy.__version__ if numpy is not None else None
+			},
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+			'settings': vars(args),
+			'results': results
+		}
+		with open(args.output, 'w') as outFile:
+			json.dump(report, outFile, indent=1)
+	if args.compare is not None:
+		with open(args.compare) as inFile:
+			earlier = json.load(inFile)
+		print()
+		if Compare(earlier['results'], results, args.threshold) > 0:
+			failed = True
+	if failed:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
+
+# EOF
@@ -0,0 +1,148 @@
+# battleComms.py
+# Session layer for the pipes between the arena and its controllers.
+# Each controller gets a pair of named pipes that are opened once, when the
+# battle is set up, and stay open until it ends:
+#  <name>.req  arena -> controller (unit IDs, return values)
+#  <name>.rsp  controller -> arena (bytecodes)
+# Every message is a single line terminated by '\n', except for binary
+# blobs, which are sent as a '#<length>' line followed by that many raw bytes.
+# Both sides open the request pipe first and the response pipe second, which
+# keeps the two blocking opens from deadlocking each other.
+# The arena side can move its reads onto a background thread (StartReader) so
+# that waiting for a controller's reply can time out.
+import os
+import queue
+import threading
+
+from battleActions import ProtocolMode, WireFormat
+
+class PipeSession:
+	# One end of a long-lived pipe pair
+	def __init__(self, name):
+		self.Name = name
+		self.RequestPath = name + '.req'
+		self.ResponsePath = name + '.rsp'
+		self.Reader = None
+		self.Writer = None
+		self.Mode = ProtocolMode.UNIT # as announced by the controller's hello
+		self.Format = WireFormat.HEX
+		self.Inbox = None # filled by the reader thread, if one is running
+		self.ReaderThread = None
+		self.Closed = False # set once the other side has closed the session
+
+	def Create(self):
+		# Makes the pipes if they do not exist yet; either side may do this
+		for path in (self.RequestPath, self.ResponsePath):
+			try:
+				os.mkfifo(path)
+			except FileExistsError:
+				pass
+
+	def OpenAsEngine(self):
+		# Blocks until the controller has opened its end
+		self.Create()
+		self.Writer = open(self.RequestPath, 'wb')
+		self.Reader = open(self.ResponsePath, 'rb')
+
+	def OpenAsController(self):
+		# Blocks until the arena has opened its end
+		self.Create()
+		self.Reader = open(self.RequestPath, 'rb')
+		self.Writer = open(self.ResponsePath, 'wb')
+
+	def WriteLine(self, text):
+		# Sends one message to the other side
+		# Returns False if the other side has closed the session
+		return self.WriteRaw(text.encode() + b'\n')
+
+	def WriteBlob(self, data):
+		# Sends one binary message to the other side
+		# Returns False if the other side has closed the session
+		return self.WriteRaw(b'#' + str(len(data)).encode() + b'\n' + data)
+
+	def WriteRaw(self, data):
+		# Writes already-framed bytes and pushes them through the pipe
+		try:
+			self.Writer.write(data)
+			self.Writer.flush()
+		except BrokenPipeError:
+			return False
+		return True
+
+	def ReadFrame(self):
+		# Reads the next message straight from the pipe
+		# Returns a str for a line, bytes for a blob, or None at end-of-file
+		line = self.Reader.readline()
+		if len(line) == 0:
+			return None
+		if line[:1] == b'#':
+			length = int(line[1:])
+			data = self.Reader.read(length)
+			if len(data) < length:
+				return None # cut off part way through
+			return data
+		return line.rstrip(b'\n').decode()
+
+	def ReadLine(self, timeout = None):
+		# Waits for one message from the other side
+		# Returns a str, or bytes if the message was a blob
+		# Returns None if the other side has closed the session
+		# Raises TimeoutError if a timeout is given and no message arrives in time;
+		# timeouts need the reader thread to be running
+		if self.Closed:
+			return None
+		if self.Inbox is None:
+			line = self.ReadFrame()
+			if line is None:
+				self.Closed = True
+			return line
+		try:
+			line = self.Inbox.get(timeout=timeout)
+		except queue.Empty:
+			raise TimeoutError("no reply from {} within {}s".format(self.Name, timeout))
+		if line is None:
+			self.Closed = True
+		return line
+
+	def StartReader(self):
+		# Moves all further reads onto a background thread
+		if self.ReaderThread is not None:
+			return
+		self.Inbox = queue.Queue()
+		self.ReaderThread = threading.Thread(target=self.ReadLoop, name=self.Name, daemon=True)
+		self.ReaderThread.start()
+
+	def ReadLoop(self):
+		# Body of the reader thread: queue every message until end-of-file
+		while True:
+			try:
+				line = self.ReadFrame()
+			except (OSError, ValueError):
+				line = None
+			self.Inbox.put(line)
+			if line is None:
+				return
+
+	def Close(self):
+		# Closes this end; the other side will read end-of-file
+		for stream in (self.Writer, self.Reader):
+			if stream is None:
+				continue
+			if stream is self.Reader and self.ReaderThread is not None:
+				self.ReaderThread.join(timeout=0.1) # lets a well-behaved controller hang up first
+				if self.ReaderThread.is_alive():
+					continue # a hung controller; closing would block on the thread's read
+			try:
+				stream.close()
+			except BrokenPipeError:
+				pass # the other side left first
+		self.Writer = None
+		self.Reader = None
+
+	def Remove(self):
+		# Deletes the pipes from the filesystem
+		for path in (self.RequestPath, self.ResponsePath):
+			if os.path.exists(path):
+				os.remove(path)
+
+# EOF
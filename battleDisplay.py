@@ -0,0 +1,266 @@
+# battleDisplay.py
+# Renderers for watching a battle while it is running.
+# The curses renderer keeps one screen session open for the whole battle and
+# only repaints the squares and roster lines that changed since the previous
+# frame; frames are dropped (not waited for) when the engine runs faster than
+# the requested frame rate, so drawing never slows the simulation down.
+# VIEWPORT
+# Only a window onto the world is drawn, as much of it as fits the terminal.
+# The view follows the armies by default: it recentres on the middle of the
+# living units whenever that drifts out of the middle half of the view. The
+# arrow keys (or h/j/k/l) scroll it by a quarter of a screen and stop it
+# following; f starts following again.
+# Nothing outside the view is looked at, so a frame costs the same on any size
+# of world: the units in view are found by looking up each square of the view
+# in the engine's GridIndex, or by going through the units if there are fewer
+# of them than squares. The roster only lists the units in view.
+import time
+
+EMPTYGLYPH = '┼'
+UNITGLYPH = '@'
+HEADERROWS = 3 # the turn line and two rulers above the grid
+ROSTERMIN = 6 # screen rows kept for the roster below the grid
+ROSTERKEY = "  id   HP  x, y  ^last action taken"
+
+def Rulers(left, width):
+	# Returns the two ruler lines for the columns from left to left+width-1:
+	# the full coordinate on every tenth column, and the last digit of each
+	numbers = [' '] * width
+	for xVal in range(left + (-left % 10), left + width, 10):
+		start = xVal - left
+		label = str(xVal)[:width - start]
+		numbers[start:start + len(label)] = label
+	digits = "".join(str(xVal % 10) for xVal in range(left, left + width))
+	return ("".join(numbers), digits)
+
+def ClampView(centre, size, limit):
+	# Returns the lowest coordinate of a view of the given size centred on
+	# centre, keeping it inside [0, limit)
+	return max(0, min(centre - size // 2, limit - size))
+
+def UnitsInView(engine, left, bottom, width, height):
+	# Returns a dict of (x, y) -> unit for the living units in a view
+	cells = dict()
+	if width * height < len(engine.ListActors):
+		grid = engine.GridIndex
+		actors = engine.DictActors
+		for yVal in range(bottom, bottom + height):
+			for xVal in range(left, left + width):
+				unitID = grid.get((xVal, yVal))
+				if unitID is not None:
+					cells[(xVal, yVal)] = actors[unitID]
+	else:
+		right = left + width
+		top = bottom + height
+		for guy in engine.ListActors:
+			location = guy.Location()
+			if left <= location[0] < right and bottom <= location[1] < top:
+				cells[location] = guy
+	return cells
+
+def ArmyCentre(engine):
+	# Returns the middle of the box around all of the living units on the
+	# board, or None if there are none
+	xVals = list()
+	yVals = list()
+	for guy in engine.ListActors:
+		location = guy.Location()
+		if engine.IsInBounds(location):
+			xVals.append(location[0])
+			yVals.append(location[1])
+	if len(xVals) == 0:
+		return None
+	return ((min(xVals) + max(xVals)) // 2, (min(yVals) + max(yVals)) // 2)
+
+class CursesRenderer:
+	# Draws the battlefield using a persistent curses screen
+	def __init__(self, worldSize, frameRate = 20, focus = None):
+		self.Width, self.Height = worldSize
+		self.FrameInterval = 0.0
+		if frameRate > 0:
+			self.FrameInterval = 1.0 / frameRate
+		self.LastFrameTime = 0.0
+		self.Screen = None
+		self.Curses = None
+		self.ColorPairs = dict() # controller -> curses attribute
+		self.Cells = dict() # (x, y) -> (glyph, attr) currently on the screen
+		self.Roster = list() # roster lines currently on the screen
+		self.Header = ""
+		self.LabelWidth = len(str(self.Height - 1)) # digits in a row label
+		self.Following = focus is None # recentre on the armies as they move
+		self.Focus = focus or (self.Width // 2, self.Height // 2) # world square the view is centred on
+		self.ScreenSize = None # (rows, cols) the view was laid out for
+		self.ViewLeft = 0
+		self.ViewBottom = 0
+		self.ViewWidth = 0
+		self.ViewHeight = 0
+
+	def Open(self, controllers):
+		# Starts the curses session; the view is laid out by the first Draw
+		import curses
+		self.Curses = curses
+		self.Screen = curses.initscr()
+		curses.noecho()
+		curses.cbreak()
+		self.Screen.keypad(True)
+		self.Screen.nodelay(True) # reading keys never waits
+		try:
+			curses.curs_set(0)
+		except curses.error:
+			pass # not every terminal can hide the cursor
+		if curses.has_colors():
+			curses.start_color()
+			teamColors = (curses.COLOR_BLUE, curses.COLOR_GREEN)
+			for index, controller in enumerate(controllers[:len(teamColors)]):
+				curses.init_pair(index + 1, teamColors[index], curses.COLOR_BLACK)
+				self.ColorPairs[controller] = curses.color_pair(index + 1)
+
+	def Close(self):
+		# Ends the curses session and gives the terminal back
+		if self.Screen is None:
+			return
+		self.Screen.keypad(False)
+		self.Curses.nocbreak()
+		self.Curses.endwin()
+		self.Screen = None
+
+	def Layout(self):
+		# Fits the view to the screen around the focus and draws the parts
+		# that only change when the view moves
+		maxRows, maxCols = self.Screen.getmaxyx()
+		self.ScreenSize = (maxRows, maxCols)
+		self.ViewWidth = max(1, min(self.Width, maxCols - 2 * (self.LabelWidth + 1)))
+		self.ViewHeight = max(1, min(self.Height, maxRows - HEADERROWS - 2 - ROSTERMIN))
+		self.ViewLeft = ClampView(self.Focus[0], self.ViewWidth, self.Width)
+		self.ViewBottom = ClampView(self.Focus[1], self.ViewHeight, self.Height)
+		self.Screen.erase()
+		self.Cells.clear()
+		self.Roster = list()
+		self.Header = ""
+		numbers, digits = Rulers(self.ViewLeft, self.ViewWidth)
+		gridCol = self.ColFor(self.ViewLeft)
+		self.Put(1, gridCol, numbers)
+		self.Put(2, gridCol, digits)
+		for yVal in range(self.ViewBottom, self.ViewBottom + self.ViewHeight):
+			label = str(yVal).rjust(self.LabelWidth)
+			self.Put(self.RowFor(yVal), 0, label + '-' + EMPTYGLYPH * self.ViewWidth + '-' + label.strip())
+		self.Put(self.RosterRow() - 2, gridCol, digits)
+		self.Put(self.RosterRow() - 1, gridCol, numbers)
+
+	def RowFor(self, yVal):
+		# Screen row of the given battlefield row; y increases upwards
+		return HEADERROWS + (self.ViewBottom + self.ViewHeight - 1 - yVal)
+
+	def ColFor(self, xVal):
+		# Screen column of the given battlefield column
+		return self.LabelWidth + 1 + (xVal - self.ViewLeft)
+
+	def RosterRow(self):
+		# Screen row of the first roster line
+		return HEADERROWS + self.ViewHeight + 2
+
+	def Put(self, row, col, text, attr = 0):
+		# Writes text to the screen, ignoring anything that would fall off it
+		maxRows, maxCols = self.Screen.getmaxyx()
+		if row >= maxRows or col >= maxCols:
+			return
+		text = text[:maxCols - col]
+		try:
+			self.Screen.addstr(row, col, text, attr)
+		except self.Curses.error:
+			pass # writing to the bottom-right corner raises after the fact
+
+	def ReadKeys(self):
+		# Scrolls the view for any keys pressed since the last frame
+		# Returns True if the view has to move
+		curses = self.Curses
+		stepX = max(1, self.ViewWidth // 4)
+		stepY = max(1, self.ViewHeight // 4)
+		moves = {
+			curses.KEY_LEFT: (-stepX, 0), ord('h'): (-stepX, 0),
+			curses.KEY_RIGHT: (stepX, 0), ord('l'): (stepX, 0),
+			curses.KEY_UP: (0, stepY), ord('k'): (0, stepY),
+			curses.KEY_DOWN: (0, -stepY), ord('j'): (0, -stepY)
+		}
+		moved = False
+		while True:
+			key = self.Screen.getch()
+			if key == -1:
+				return moved
+			if key == ord('f'):
+				self.Following = True
+			elif key in moves:
+				# Scroll from where the view actually is, which may have been clamped
+				offX, offY = moves[key]
+				centreX = self.ViewLeft + self.ViewWidth // 2 + offX
+				centreY = self.ViewBottom + self.ViewHeight // 2 + offY
+				self.Focus = (min(max(centreX, 0), self.Width - 1), min(max(centreY, 0), self.Height - 1))
+				self.Following = False
+				moved = True
+
+	def NeedsRecentre(self, centre):
+		# Returns True if centre has left the middle half of the view
+		marginX = self.ViewWidth // 4
+		marginY = self.ViewHeight // 4
+		return not (self.ViewLeft + marginX <= centre[0] < self.ViewLeft + self.ViewWidth - marginX
+				and self.ViewBottom + marginY <= centre[1] < self.ViewBottom + self.ViewHeight - marginY)
+
+	def Draw(self, engine, force = False):
+		# Draws one frame of the given engine's battle
+		# Returns False if the frame was skipped to stay under the frame rate
+		if self.Screen is None:
+			return False
+		now = time.perf_counter()
+		if not force and now - self.LastFrameTime < self.FrameInterval:
+			return False
+		self.LastFrameTime = now
+		moved = self.ReadKeys()
+		if self.Following:
+			centre = ArmyCentre(engine)
+			if centre is not None and (self.ScreenSize is None or self.NeedsRecentre(centre)):
+				self.Focus = centre
+				moved = True
+		if moved or self.ScreenSize != self.Screen.getmaxyx():
+			self.Layout()
+		header = "----TURN #{}----  x {}-{}, y {}-{} of {}x{}  {}".format(engine.TurnCur,
+				self.ViewLeft, self.ViewLeft + self.ViewWidth - 1, self.ViewBottom, self.ViewBottom + self.ViewHeight - 1,
+				self.Width, self.Height, "following" if self.Following else "arrows scroll, f follows")
+		if header != self.Header:
+			self.Put(0, 0, header.ljust(len(self.Header)))
+			self.Header = header
+		# Update only the squares that have changed
+		cells = dict()
+		units = UnitsInView(engine, self.ViewLeft, self.ViewBottom, self.ViewWidth, self.ViewHeight)
+		for location, guy in units.items():
+			cells[location] = (UNITGLYPH, self.ColorPairs.get(guy.Controller, 0))
+		for location in self.Cells.keys() - cells.keys():
+			self.Put(self.RowFor(location[1]), self.ColFor(location[0]), EMPTYGLYPH)
+		for location, glyph in cells.items():
+			if self.Cells.get(location) != glyph:
+				self.Put(self.RowFor(location[1]), self.ColFor(location[0]), glyph[0], glyph[1])
+		self.Cells = cells
+		# Update only the roster lines that have changed; the roster lists
+		# the units in view, then the dead, as far as the screen goes
+		rosterRow = self.RosterRow()
+		space = max(1, self.Screen.getmaxyx()[0] - rosterRow - 1)
+		roster = list()
+		for guy in sorted(units.values(), key=lambda unit: unit.ID)[:space]:
+			roster.append("U-{}[{}] :{},{}:{}".format(guy.ID, guy.HP, guy.xPos, guy.yPos, guy.LastAction))
+		right = self.ViewLeft + self.ViewWidth
+		top = self.ViewBottom + self.ViewHeight
+		for corpse in engine.ListDead:
+			if len(roster) >= space:
+				break
+			if self.ViewLeft <= corpse.xPos < right and self.ViewBottom <= corpse.yPos < top:
+				roster.append("D-{}[{}] :{},{}:{}".format(corpse.ID, corpse.HP, corpse.xPos, corpse.yPos, corpse.LastAction))
+		roster.append(ROSTERKEY)
+		for index in range(max(len(roster), len(self.Roster))):
+			newLine = roster[index] if index < len(roster) else ""
+			oldLine = self.Roster[index] if index < len(self.Roster) else ""
+			if newLine != oldLine:
+				self.Put(rosterRow + index, 2, newLine.ljust(len(oldLine)))
+		self.Roster = roster
+		self.Screen.refresh()
+		return True
+
+# EOF
@@ -0,0 +1,131 @@
+# battleLog.py
+# Logging for the arena and its tools.
+# LEVELS
+# Every message has a level (see Level); a Logger only writes the messages at
+# or above its own level, and writes nothing at all when set to OFF, which is
+# the default.
+# Messages are format strings with their arguments passed separately:
+#  LOG.Debug("*   U-{}: Do.MOVE to {}", unitID, location)
+# so that a message which is not written is never formatted either.
+# Whenever the level changes, the Logger rebinds its Debug/Info/Warn/Error
+# calls: those below the level become Ignore, which does nothing. Call sites
+# in the per-unit loops also check LOG.Debugging first, so that a disabled
+# message does not even cost a call.
+# Output goes through a large buffer instead of straight to stderr, and is
+# flushed on warnings, errors and Flush (the engine flushes in Cleanup).
+# TRACE
+# Each engine can also keep its own TraceBuffer: a ring holding the last few
+# thousand structured events, one per action carried out:
+#  (turn, unit, action, params, result)
+# so that battles run side by side in one process never mix their traces.
+# Adding to the ring costs no formatting and no I/O; it is only written out by
+# DumpTrace, which the engine calls when a battle fails, whatever the level.
+# IMPORTS
+import sys
+from collections import deque
+from enum import IntEnum
+
+LOGBUFFER = 1 << 16 # bytes held before the log is written out
+TRACESIZE = 4096 # events kept by a TraceBuffer
+
+class Level(IntEnum):
+	DEBUG = 10
+	INFO = 20
+	WARN = 30
+	ERROR = 40
+	OFF = 50
+
+def Ignore(*args):
+	# Stands in for the log calls that are below the current level
+	pass
+
+class TraceBuffer:
+	# A fixed-size ring of the most recent actions
+	def __init__(self, size = TRACESIZE):
+		self.Events = deque(maxlen=size)
+
+	def Add(self, turn, unit, action, params, result):
+		self.Events.append((turn, unit, action, params, result))
+
+	def Clear(self):
+		self.Events.clear()
+
+	def Lines(self):
+		# Yields the events as text, oldest first
+		for turn, unit, action, params, result in self.Events:
+			yield "T-{} U-{} {} {} -> {}".format(turn, unit, action.name, list(params), result)
+
+class Logger:
+	# Writes leveled messages to a stream, stderr unless Open is called
+	def __init__(self, level = Level.OFF):
+		self.Stream = None # opened on first use
+		self.OwnsStream = False
+		self.SetLevel(level)
+
+	def SetLevel(self, level):
+		# Sets the lowest level that is written and rebinds the level calls
+		self.Level = Level(level)
+		self.Debugging = self.Level <= Level.DEBUG
+		self.Debug = self.Emitter(Level.DEBUG)
+		self.Info = self.Emitter(Level.INFO)
+		self.Warn = self.Emitter(Level.WARN)
+		self.Error = self.Emitter(Level.ERROR)
+
+	def Emitter(self, level):
+		# Returns the call for messages of the given level
+		if level < self.Level:
+			return Ignore
+		def Emit(message, *args):
+			self.Write(level, message, args)
+		return Emit
+
+	def Open(self, fileName):
+		# Sends the log to a file instead of stderr
+		self.Close()
+		self.Stream = open(fileName, 'w', buffering=LOGBUFFER)
+		self.OwnsStream = True
+
+	def GetStream(self):
+		if self.Stream is None:
+			try:
+				self.Stream = open(sys.stderr.fileno(), 'w', buffering=LOGBUFFER, closefd=False)
+			except (AttributeError, OSError, ValueError):
+				self.Stream = sys.stderr # no real file behind stderr
+		return self.Stream
+
+	def Write(self, level, message, args):
+		stream = self.GetStream()
+		if len(args) > 0:
+			message = message.format(*args)
+		stream.write(message + '\n')
+		if level >= Level.WARN:
+			stream.flush()
+
+	def DumpTrace(self, title, trace):
+		# Writes out a TraceBuffer, if there is one, whatever the level
+		if trace is None or len(trace.Events) == 0:
+			return
+		stream = self.GetStream()
+		stream.write("*!! {}; the last {} actions were:\n".format(title, len(trace.Events)))
+		for line in trace.Lines():
+			stream.write(line + '\n')
+		stream.flush()
+
+	def Flush(self):
+		if self.Stream is not None:
+			self.Stream.flush()
+
+	def Close(self):
+		# Flushes the log and closes its file, if it has one
+		if self.Stream is None:
+			return
+		if self.OwnsStream:
+			self.Stream.close()
+		else:
+			self.Stream.flush()
+		self.Stream = None
+		self.OwnsStream = False
+
+LOG = Logger() # shared by every module of a program
+
+# EOF
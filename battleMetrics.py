@@ -0,0 +1,182 @@
+# battleMetrics.py
+# Per-turn timing of the engine's phases.
+# PHASES
+# Every turn of IterateBattle is split into laps, each of which is added to
+# one of these phases:
+#  gather   asking batch and in-process controllers for their units' actions
+#  request  asking unit-mode controllers for each action and sending back its
+#           result, plus decoding the action
+#  do       carrying out the actions
+#  record   writing the gameplay record (keyframes included) and putting the
+#           turn's actions back in the pool
+#  cull     removing the dead
+#  render   drawing the display
+#  idle     the pause between turns when displaying
+# and turn is the whole of it. gather, request and do are also kept for each
+# controller; gather covers each controller's own wait, so those can add up
+# to more than the phase when controllers are asked at the same time.
+# A BattleMetrics is only touched from the engine's main thread: a batch
+# controller's wait is timed on its worker thread with Measure, and the
+# engine adds it with Add once it has the result, so a reply that arrives
+# after the deadline is thrown away together with its time.
+# A lap costs one perf_counter call and a dict update, and each turn adds one
+# float per phase to an array, so the metrics can be left on for long runs.
+# REPORT
+# At the end of the battle every phase is summed up over all turns:
+#  count, total, mean, p50, p99 and max, in seconds
+#  histogram  [[below, turns], ...] counting the turns whose time in the
+#             phase was under each power of two of microseconds (and over
+#             the previous one)
+# and written as JSON if the metrics were given a file name.
+# IMPORTS
+import json
+import math
+import time
+from array import array
+
+PHASES = ('gather', 'request', 'do', 'record', 'cull', 'render', 'idle', 'turn')
+CONTROLLERPHASES = ('gather', 'request', 'do')
+
+def Percentile(ordered, percent):
+	# Returns the nearest-rank percentile of an already sorted sequence
+	if len(ordered) == 0:
+		return 0.0
+	rank = math.ceil(percent / 100 * len(ordered))
+	return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+def Histogram(samples):
+	# Counts samples by power of two of microseconds
+	# Returns a list of [below, count] from the lowest bucket used to the highest
+	counts = dict()
+	for seconds in samples:
+		bucket = int(seconds * 1000000).bit_length()
+		counts[bucket] = counts.get(bucket, 0) + 1
+	if len(counts) == 0:
+		return list()
+	return [[1 << bucket, counts.get(bucket, 0)] for bucket in range(min(counts), max(counts) + 1)]
+
+def Measure(function, *args):
+	# Calls function(*args) and returns (its result, the seconds it took)
+	# Touches no shared state, so it can run on a worker thread
+	startTime = time.perf_counter()
+	result = function(*args)
+	return (result, time.perf_counter() - startTime)
+
+def Describe(samples):
+	# Returns the summary of one series of per-turn times as a dict
+	ordered = sorted(samples)
+	total = math.fsum(ordered)
+	return {
+		'count': len(ordered),
+		'total': total,
+		'mean': total / len(ordered) if len(ordered) > 0 else 0.0,
+		'p50': Percentile(ordered, 50),
+		'p99': Percentile(ordered, 99),
+		'max': ordered[-1] if len(ordered) > 0 else 0.0,
+		'histogram': Histogram(ordered)
+	}
+
+class BattleMetrics:
+	# Collects the time spent in each phase of every turn
+	def __init__(self, fileName = None):
+		self.FileName = fileName # where to write the report; None only keeps it
+		self.Series = {phase: array('d') for phase in PHASES} # phase -> seconds per turn
+		self.ControllerSeries = dict() # (phase, controller) -> seconds per turn
+		self.Current = dict() # phase or (phase, controller) -> seconds so far this turn
+		self.TurnStart = 0.0
+		self.LastMark = 0.0
+		self.Turns = 0
+		self.Closed = False
+
+	def StartTurn(self):
+		self.Current.clear()
+		self.TurnStart = self.LastMark = time.perf_counter()
+
+	def Lap(self, phase, controller = None):
+		# Adds the time since the last lap to a phase, and to the controller's
+		# share of it if one is given
+		now = time.perf_counter()
+		elapsed = now - self.LastMark
+		self.LastMark = now
+		current = self.Current
+		current[phase] = current.get(phase, 0.0) + elapsed
+		if controller is not None:
+			key = (phase, controller)
+			current[key] = current.get(key, 0.0) + elapsed
+
+	def Add(self, phase, controller, seconds):
+		# Adds time measured elsewhere to a controller's share of a phase
+		key = (phase, controller)
+		self.Current[key] = self.Current.get(key, 0.0) + seconds
+
+	def Timed(self, phase, controller, function, *args):
+		# Calls function(*args), adding its time to the controller's share of a phase
+		# Main thread only; worker threads use Measure instead
+		startTime = time.perf_counter()
+		try:
+			return function(*args)
+		finally:
+			self.Add(phase, controller, time.perf_counter() - startTime)
+
+	def EndTurn(self):
+		# Files this turn's times away; phases that were not reached count as 0
+		current = self.Current
+		current['turn'] = time.perf_counter() - self.TurnStart
+		for phase, samples in self.Series.items():
+			samples.append(current.get(phase, 0.0))
+		for key in current:
+			if isinstance(key, tuple) and key not in self.ControllerSeries:
+				# Turns from before the controller was first seen count as 0
+				self.ControllerSeries[key] = array('d', bytes(8 * self.Turns))
+		for key, samples in self.ControllerSeries.items():
+			samples.append(current.get(key, 0.0))
+		self.Turns += 1
+
+	def Summary(self, info = None):
+		# Returns the whole report as a dict; info is added as the battle's details
+		controllers = dict()
+		for (phase, controller), samples in self.ControllerSeries.items():
+			controllers.setdefault(controller, dict())[phase] = Describe(samples)
+		return {
+			'battle': dict(info or {}),
+			'turns': self.Turns,
+			'phases': {phase: Describe(samples) for phase, samples in self.Series.items()},
+			'controllers': controllers
+		}
+
+	def Close(self, info = None):
+		# Writes the report to the metrics file, once
+		# Returns the report, or None if it was already closed
+		if self.Closed:
+			return None
+		self.Closed = True
+		report = self.Summary(info)
+		if self.FileName is not None:
+			with open(self.FileName, 'w') as outFile:
+				json.dump(report, outFile, indent=1)
+		return report
+
+def PrintRow(name, entry):
+	print("{:<10} {:>10.3f} {:>11.3f} {:>11.3f} {:>11.3f} {:>11.3f}".format(name,
+			entry['total'], entry['mean'] * 1000, entry['p50'] * 1000, entry['p99'] * 1000, entry['max'] * 1000))
+
+def PrintSummary(report):
+	# Prints a report from BattleMetrics.Summary as tables
+	print("phase        total(s)    mean(ms)     p50(ms)     p99(ms)     max(ms)")
+	for phase, entry in report['phases'].items():
+		PrintRow(phase, entry)
+	for controller, phases in report['controllers'].items():
+		print(controller)
+		for phase in CONTROLLERPHASES:
+			if phase in phases:
+				PrintRow('  ' + phase, phases[phase])
+	histogram = report['phases']['turn']['histogram']
+	if len(histogram) > 0:
+		print()
+		print("turn time       turns")
+		widest = max(count for below, count in histogram)
+		for below, count in histogram:
+			bar = '#' * (40 * count // widest) if widest > 0 else ''
+			print("< {:>10}us {:>7} {}".format(below, count, bar))
+
+# EOF
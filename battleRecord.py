@@ -0,0 +1,611 @@
+# battleRecord.py
+# Writes the gameplay record of a battle as it happens.
+# Every action taken is appended along with its return value; rows are
+# collected for a whole turn and then handed to a large buffered writer, which
+# is flushed to disk every few turns rather than on every action.
+# CSV FORMAT
+# Follows the ordering of the bytecode (see battleActions and replayer):
+#  turn,action,unit,params,result
+#  12,0002,0001,10,"(3, 4)"
+# where action, unit and params are the same hex digits used in a bytecode
+# (so a spawn's location is written as two 4-digit values).
+# Lines starting with '#' hold battle metadata as #key,value.
+# A keyframe is written as one row per actor, ahead of that turn's actions:
+#  12,K,0001,01,"(3, 4, 1)"
+# where the params hold the actor's team (1 or 2) and the result its x, y, HP.
+# BINARY FORMAT
+# All values little-endian.
+#  FILEHEADER  magic 'RBTL', u16 version, u32 metadata length,
+#              then the metadata as key=value lines
+#  per turn:
+#  TURNHEADER  'T', u32 turn, u32 number of actions
+#  per action:
+#  ACTIONRECORD (see battleActions) followed by RESULTRECORD
+#  RESULTRECORD u8 kind (see ResultKind), i32, i32
+#  every few turns, ahead of that turn's TURNHEADER:
+#  KEYHEADER   'K', u32 turn, u32 number of actors
+#  KEYRECORD   u16 unit, u8 team, i16 x, i16 y, i16 HP, one per actor
+#  after the last turn:
+#  INDEXHEADER 'I', u32 number of turns
+#  INDEXENTRY  u32 turn, u64 file offset of its TURNHEADER, one per turn
+#  INDEXHEADER 'K', u32 number of keyframes
+#  INDEXENTRY  u32 turn, u64 file offset of its KEYHEADER, one per keyframe
+#  FOOTER      u64 file offset of the INDEXHEADER, magic 'RBTX'
+# A file cut off before the footer is still readable; the turn index is then
+# rebuilt by walking the turn headers.
+# SEED FORMAT
+# A battle between two in-process controllers (see battleActions) with a
+# fixed seed plays out the same way every time, so its record can be just the
+# CSV metadata (including 'seed') with no rows at all; the metadata also holds
+# record=seed, which tells the replayer to run the battle again to get the
+# actions back. A battle run under a turn budget records it as 'budget'; such
+# a battle depends on timing and cannot be regenerated.
+# KEYFRAMES
+# A keyframe holds every actor, alive or dead, as it stands at the start of its
+# turn; one is written every KEYFRAMEINTERVAL turns (recorded in the metadata
+# as 'keyframes'). Any turn can then be rebuilt from the keyframe before it and
+# at most that many turns of actions, so a shorter interval means quicker
+# seeking and a larger file.
+# READING
+# Records are read back through a memory map, so only the pages holding the
+# turns actually asked for are ever loaded. Turns are found through the footer
+# index (binary) or by bisecting the file on its turn column (CSV, whose rows
+# are in turn order), and their actions are only decoded when they are read.
+# With NumPy, a binary turn of at least BULKDECODEMIN actions is decoded in one
+# go, through a dtype that steps over each ACTIONRECORD and its RESULTRECORD.
+import ast
+import csv
+import io
+import mmap
+import struct
+from enum import Enum
+
+from battleActions import ACTIONRECORD, BULKDECODEMIN, BattleParser, numpy
+
+BUFFERSIZE = 1 << 20 # bytes held by the file writer between flushes
+FLUSHINTERVAL = 100 # turns between explicit flushes
+KEYFRAMEINTERVAL = 100 # turns between world-state keyframes; 0 for none
+MAGIC = b'RBTL'
+VERSION = 1
+FILEHEADER = struct.Struct('<4sHI')
+TURNHEADER = struct.Struct('<cII')
+RESULTRECORD = struct.Struct('<Bii')
+KEYRECORD = struct.Struct('<HBhhh')
+INDEXMAGIC = b'RBTX'
+INDEXHEADER = struct.Struct('<cI')
+INDEXENTRY = struct.Struct('<IQ')
+FOOTER = struct.Struct('<Q4s')
+CSVCOLUMNS = ('turn', 'action', 'unit', 'params', 'result')
+if numpy is not None:
+	# One action of a binary turn block: an ACTIONRECORD and its RESULTRECORD
+	TURNDTYPE = numpy.dtype({
+		'names': ['type', 'unit', 'param0', 'param1', 'kind', 'first', 'second'],
+		'formats': ['<u2', '<u2', '<u2', '<u2', 'u1', '<i4', '<i4'],
+		'offsets': [0, 2, 4, 6, 8, 9, 13],
+		'itemsize': ACTIONRECORD.size + RESULTRECORD.size
+	})
+
+class RecordFormat(Enum):
+	# Defines the kinds of gameplay record that can be written
+	NONE = 'none'
+	CSV = 'csv'
+	BIN = 'bin'
+	SEED = 'seed' # metadata only; the battle is regenerated from its seed
+
+class ResultKind(Enum):
+	# Defines how an action's return value is packed into a RESULTRECORD
+	OTHER = 0 # Not kept, e.g. None
+	BOOL = 1 # first value is 0 or 1
+	INT = 2 # first value, e.g. HP left after an attack
+	LOCATION = 3 # x, y
+
+def EncodeResult(result):
+	# Packs an action's return value into a (kind, a, b) tuple
+	if isinstance(result, bool):
+		return (ResultKind.BOOL.value, int(result), 0)
+	if isinstance(result, int):
+		return (ResultKind.INT.value, result, 0)
+	if isinstance(result, tuple) and len(result) == 2:
+		return (ResultKind.LOCATION.value, result[0], result[1])
+	return (ResultKind.OTHER.value, 0, 0)
+
+def DecodeResult(kind, first, second):
+	# Unpacks a RESULTRECORD's values into the original return value
+	match ResultKind(kind):
+		case ResultKind.BOOL:
+			return bool(first)
+		case ResultKind.INT:
+			return first
+		case ResultKind.LOCATION:
+			return (first, second)
+	return None
+
+class BattleRecorder:
+	# Common parts of the gameplay recorders
+	def __init__(self, fileName, flushInterval = FLUSHINTERVAL, keyframeInterval = KEYFRAMEINTERVAL):
+		self.FileName = fileName
+		self.FlushInterval = flushInterval
+		self.KeyframeInterval = keyframeInterval
+		self.OutFile = None
+		self.TurnsSinceFlush = 0
+		self.Teams = dict() # controller -> team number used in keyframes
+
+	def Open(self, metadata):
+		# Creates the output file and writes the battle metadata
+		self.OutFile = open(self.FileName, 'wb', buffering=BUFFERSIZE)
+		self.Teams = {metadata.get('p1'): 1, metadata.get('p2'): 2}
+		self.WriteHeader(dict(metadata, keyframes=self.KeyframeInterval))
+
+	def WriteHeader(self, metadata):
+		pass
+
+	def WantsKeyframe(self, turn):
+		# Returns True if a keyframe should be written at the start of this turn
+		return self.KeyframeInterval > 0 and turn % self.KeyframeInterval == 0
+
+	def WriteKeyframe(self, turn, actors, corpses):
+		# Writes the state of every actor at the start of the given turn
+		units = list()
+		for guy in list(actors) + list(corpses):
+			units.append((int(guy.ID, base=16), self.Teams.get(guy.Controller, 0), guy.xPos, guy.yPos, guy.HP))
+		self.WriteUnits(turn, units)
+
+	def WriteUnits(self, turn, units):
+		pass
+
+	def WriteAction(self, turn, action, result):
+		# Adds one action and its return value to the current turn
+		pass
+
+	def EndTurn(self, turn):
+		# Hands the finished turn to the writer, flushing every few turns
+		self.WriteTurn(turn)
+		self.TurnsSinceFlush += 1
+		if self.TurnsSinceFlush >= self.FlushInterval:
+			self.OutFile.flush()
+			self.TurnsSinceFlush = 0
+
+	def WriteTurn(self, turn):
+		pass
+
+	def Close(self):
+		# Flushes everything and closes the output file
+		if self.OutFile is None:
+			return
+		self.OutFile.close()
+		self.OutFile = None
+
+class CSVRecorder(BattleRecorder):
+	# Writes the record as CSV
+	def __init__(self, fileName, flushInterval = FLUSHINTERVAL, keyframeInterval = KEYFRAMEINTERVAL):
+		super().__init__(fileName, flushInterval, keyframeInterval)
+		self.Text = None
+		self.Writer = None
+		self.Rows = list()
+
+	def WriteHeader(self, metadata):
+		self.Text = io.TextIOWrapper(self.OutFile, encoding='utf-8', newline='', write_through=True)
+		self.Writer = csv.writer(self.Text)
+		for key, value in metadata.items():
+			self.Writer.writerow(('#' + key, value))
+		self.Writer.writerow(CSVCOLUMNS)
+
+	def WriteUnits(self, turn, units):
+		for unitID, team, xPos, yPos, hp in units:
+			self.Rows.append((turn, 'K', format(unitID, '04x'), format(team, '02x'), (xPos, yPos, hp)))
+
+	def WriteAction(self, turn, action, result):
+		params = BattleParser.EncodeParams(action.Type, action.Params)
+		self.Rows.append((turn, format(action.Type.value, '04x'), action.Subject, params, result))
+
+	def WriteTurn(self, turn):
+		self.Writer.writerows(self.Rows)
+		self.Rows.clear()
+
+	def Close(self):
+		if self.Text is not None:
+			self.Text.flush()
+			self.Text.detach()
+			self.Text = None
+		super().Close()
+
+class SeedRecorder(CSVRecorder):
+	# Writes only the metadata needed to run the battle again
+	def WriteHeader(self, metadata):
+		super().WriteHeader(dict(metadata, record=RecordFormat.SEED.value))
+
+	def WantsKeyframe(self, turn):
+		return False
+
+	def WriteAction(self, turn, action, result):
+		pass
+
+class BinaryRecorder(BattleRecorder):
+	# Writes the compact binary record
+	def __init__(self, fileName, flushInterval = FLUSHINTERVAL, keyframeInterval = KEYFRAMEINTERVAL):
+		super().__init__(fileName, flushInterval, keyframeInterval)
+		self.Chunk = bytearray()
+		self.Count = 0
+		self.Position = 0 # file offset of the next turn
+		self.Index = bytearray() # INDEXENTRYs of the turns written so far
+		self.KeyIndex = bytearray() # INDEXENTRYs of the keyframes written so far
+
+	def WriteHeader(self, metadata):
+		text = "".join("{}={}\n".format(key, value) for key, value in metadata.items()).encode()
+		self.OutFile.write(FILEHEADER.pack(MAGIC, VERSION, len(text)) + text)
+		self.Position = FILEHEADER.size + len(text)
+
+	def WriteUnits(self, turn, units):
+		self.KeyIndex += INDEXENTRY.pack(turn, self.Position)
+		block = bytearray(TURNHEADER.pack(b'K', turn, len(units)))
+		for unit in units:
+			block += KEYRECORD.pack(*unit)
+		self.OutFile.write(block)
+		self.Position += len(block)
+
+	def WriteAction(self, turn, action, result):
+		params = list(action.Params[:2]) + [0] * (2 - len(action.Params[:2]))
+		self.Chunk += ACTIONRECORD.pack(action.Type.value, int(action.Subject, base=16), *params)
+		self.Chunk += RESULTRECORD.pack(*EncodeResult(result))
+		self.Count += 1
+
+	def WriteTurn(self, turn):
+		self.Index += INDEXENTRY.pack(turn, self.Position)
+		self.OutFile.write(TURNHEADER.pack(b'T', turn, self.Count))
+		self.OutFile.write(self.Chunk)
+		self.Position += TURNHEADER.size + len(self.Chunk)
+		self.Chunk.clear()
+		self.Count = 0
+
+	def Close(self):
+		# Appends the turn index so that readers can seek straight to any turn
+		if self.OutFile is not None:
+			self.OutFile.write(INDEXHEADER.pack(b'I', len(self.Index) // INDEXENTRY.size))
+			self.OutFile.write(self.Index)
+			self.OutFile.write(INDEXHEADER.pack(b'K', len(self.KeyIndex) // INDEXENTRY.size))
+			self.OutFile.write(self.KeyIndex)
+			self.OutFile.write(FOOTER.pack(self.Position, INDEXMAGIC))
+		super().Close()
+
+def MakeRecorder(recordFormat, fileName, keyframeInterval = KEYFRAMEINTERVAL):
+	# Returns a recorder for the given RecordFormat, or None for no record
+	match recordFormat:
+		case RecordFormat.CSV:
+			return CSVRecorder(fileName, keyframeInterval=keyframeInterval)
+		case RecordFormat.BIN:
+			return BinaryRecorder(fileName, keyframeInterval=keyframeInterval)
+		case RecordFormat.SEED:
+			return SeedRecorder(fileName, keyframeInterval=0)
+	return None
+
+class ReplayReader:
+	# Common parts of the gameplay record readers
+	# Each action read back is a (values, result) pair, where values is the
+	# tuple given by BattleParser.ConvertToValues
+	def __init__(self, fileName):
+		self.FileName = fileName
+		self.File = None
+		self.Map = None
+		self.Metadata = dict()
+
+	def Open(self):
+		# Maps the file into memory and reads its metadata
+		# Returns False if the file is not a gameplay record of this kind
+		self.File = open(self.FileName, 'rb')
+		try:
+			self.Map = mmap.mmap(self.File.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			self.Close() # an empty file cannot be mapped
+			return False
+		if not self.ReadHeader():
+			self.Close()
+			return False
+		return True
+
+	def ReadHeader(self):
+		return False
+
+	def ReadTurn(self, turn):
+		# Returns the list of actions taken in the given turn
+		# Returns an empty list if nothing was recorded for that turn
+		pass
+
+	def IterateTurns(self, first = 0):
+		# Yields (turn, actions) for every recorded turn from first onwards
+		pass
+
+	def ReadKeyframe(self, turn):
+		# Returns (keyframe turn, units) for the last keyframe at or before the
+		# given turn, where each unit is (unit ID, team, x, y, HP)
+		# Returns None if there is no such keyframe
+		pass
+
+	def LastTurn(self):
+		# Returns the number of the last recorded turn, or None if there are none
+		pass
+
+	def Close(self):
+		# Releases the memory map and the file
+		if self.Map is not None:
+			self.Map.close()
+			self.Map = None
+		if self.File is not None:
+			self.File.close()
+			self.File = None
+
+class CSVReplay(ReplayReader):
+	# Reads a CSV record
+	def __init__(self, fileName):
+		super().__init__(fileName)
+		self.DataStart = 0 # file offset of the first action row
+
+	def ReadHeader(self):
+		position = 0
+		while position < len(self.Map):
+			end = self.LineEnd(position)
+			fields = next(csv.reader([self.Map[position:end].decode()]), [])
+			position = end + 1
+			if len(fields) == 2 and fields[0][:1] == '#':
+				self.Metadata[fields[0][1:]] = fields[1]
+				continue
+			if tuple(fields) != CSVCOLUMNS:
+				return False
+			self.DataStart = min(position, len(self.Map))
+			return True
+		return False
+
+	def LineEnd(self, position):
+		# File offset of the newline ending the line at position
+		end = self.Map.find(b'\n', position)
+		if end == -1:
+			end = len(self.Map)
+		return end
+
+	def LineStart(self, position):
+		# File offset of the first action row starting at or after position
+		if position <= self.DataStart:
+			return self.DataStart
+		return min(self.LineEnd(position - 1) + 1, len(self.Map))
+
+	def TurnAt(self, position):
+		# Turn number of the row starting at position
+		return int(self.Map[position:self.Map.find(b',', position)])
+
+	def FindTurn(self, turn):
+		# File offset of the first row of the first turn at or after the given one
+		# Rows are written in turn order, so the file can be bisected directly
+		low = self.DataStart
+		high = len(self.Map)
+		while low < high:
+			middle = (low + high) // 2
+			start = self.LineStart(middle)
+			if start >= len(self.Map) or self.TurnAt(start) >= turn:
+				high = middle
+			else:
+				low = middle + 1
+		return self.LineStart(low)
+
+	def DecodeRow(self, fields):
+		values = BattleParser.ConvertToValues(fields[1] + fields[2] + fields[3])
+		try:
+			result = ast.literal_eval(fields[4])
+		except (ValueError, SyntaxError):
+			result = fields[4]
+		return (values, result)
+
+	def ReadTurn(self, turn):
+		start = self.FindTurn(turn)
+		end = self.FindTurn(turn + 1)
+		rows = self.Map[start:end].decode().splitlines()
+		return [self.DecodeRow(fields) for fields in csv.reader(rows) if fields[1] != 'K']
+
+	def IterateTurns(self, first = 0):
+		position = self.FindTurn(first)
+		turn = None
+		actions = list()
+		while position < len(self.Map):
+			end = self.LineEnd(position)
+			fields = next(csv.reader([self.Map[position:end].decode()]))
+			position = end + 1
+			if fields[1] == 'K':
+				continue
+			rowTurn = int(fields[0])
+			if rowTurn != turn and turn is not None:
+				yield (turn, actions)
+				actions = list()
+			turn = rowTurn
+			actions.append(self.DecodeRow(fields))
+		if turn is not None:
+			yield (turn, actions)
+
+	def ReadKeyframe(self, turn):
+		interval = int(self.Metadata.get('keyframes', 0))
+		if interval <= 0 or turn < 0:
+			return None
+		# Keyframes fall on every interval'th turn, but the battle may have
+		# ended before the one asked for
+		keyTurn = turn - turn % interval
+		while keyTurn >= 0:
+			units = list()
+			position = self.FindTurn(keyTurn)
+			while position < len(self.Map):
+				end = self.LineEnd(position)
+				fields = next(csv.reader([self.Map[position:end].decode()]))
+				position = end + 1
+				if int(fields[0]) != keyTurn or fields[1] != 'K':
+					break
+				xPos, yPos, hp = ast.literal_eval(fields[4])
+				units.append((fields[2], int(fields[3], base=16), xPos, yPos, hp))
+			if len(units) > 0:
+				return (keyTurn, units)
+			keyTurn -= interval
+		return None
+
+	def LastTurn(self):
+		end = len(self.Map)
+		if end > self.DataStart and self.Map[end - 1:end] == b'\n':
+			end -= 1
+		if end <= self.DataStart:
+			return None
+		return self.TurnAt(self.LineStart(self.Map.rfind(b'\n', self.DataStart, end) + 1))
+
+class BinaryReplay(ReplayReader):
+	# Reads a binary record
+	def __init__(self, fileName):
+		super().__init__(fileName)
+		self.Index = None # INDEXENTRYs, straight from the map when the footer is there
+		self.KeyIndex = None # INDEXENTRYs of the keyframes
+		self.DataEnd = 0 # file offset just past the last turn
+
+	def ReadHeader(self):
+		if len(self.Map) < FILEHEADER.size:
+			return False
+		magic, version, length = FILEHEADER.unpack_from(self.Map, 0)
+		if magic != MAGIC or version != VERSION:
+			return False
+		text = self.Map[FILEHEADER.size:FILEHEADER.size + length].decode()
+		for line in text.splitlines():
+			key, _, value = line.partition('=')
+			self.Metadata[key] = value
+		dataStart = FILEHEADER.size + length
+		if not self.ReadIndex():
+			self.BuildIndex(dataStart)
+		return True
+
+	def ReadIndex(self):
+		# Uses the turn index from the footer, if the file has one
+		if len(self.Map) < FOOTER.size:
+			return False
+		indexStart, magic = FOOTER.unpack_from(self.Map, len(self.Map) - FOOTER.size)
+		if magic != INDEXMAGIC or indexStart + INDEXHEADER.size > len(self.Map):
+			return False
+		marker, count = INDEXHEADER.unpack_from(self.Map, indexStart)
+		entriesStart = indexStart + INDEXHEADER.size
+		if marker != b'I' or entriesStart + count * INDEXENTRY.size > len(self.Map):
+			return False
+		keyStart = entriesStart + count * INDEXENTRY.size
+		keyCount = 0
+		if keyStart + INDEXHEADER.size <= len(self.Map) - FOOTER.size:
+			marker, keyCount = INDEXHEADER.unpack_from(self.Map, keyStart)
+			if marker != b'K' or keyStart + INDEXHEADER.size + keyCount * INDEXENTRY.size > len(self.Map):
+				return False
+		keyStart += INDEXHEADER.size
+		self.Index = memoryview(self.Map)[entriesStart:entriesStart + count * INDEXENTRY.size]
+		self.KeyIndex = memoryview(self.Map)[keyStart:keyStart + keyCount * INDEXENTRY.size]
+		self.DataEnd = indexStart
+		return True
+
+	def BuildIndex(self, position):
+		# Rebuilds the turn index by walking the turn headers
+		# Only used for records that were cut off before the footer was written
+		index = bytearray()
+		keyIndex = bytearray()
+		blockSizes = {b'T': ACTIONRECORD.size + RESULTRECORD.size, b'K': KEYRECORD.size}
+		while position + TURNHEADER.size <= len(self.Map):
+			marker, turn, count = TURNHEADER.unpack_from(self.Map, position)
+			if marker not in blockSizes:
+				break
+			end = position + TURNHEADER.size + count * blockSizes[marker]
+			if end > len(self.Map):
+				break
+			if marker == b'T':
+				index += INDEXENTRY.pack(turn, position)
+			else:
+				keyIndex += INDEXENTRY.pack(turn, position)
+			position = end
+		self.Index = memoryview(index)
+		self.KeyIndex = memoryview(keyIndex)
+		self.DataEnd = position
+
+	def TurnCount(self):
+		return len(self.Index) // INDEXENTRY.size
+
+	def FindEntry(self, turn, index = None):
+		# Position in the index of the first turn at or after the given one
+		# Uses the turn index unless another index is given
+		if index is None:
+			index = self.Index
+		low = 0
+		high = len(index) // INDEXENTRY.size
+		while low < high:
+			middle = (low + high) // 2
+			if INDEXENTRY.unpack_from(index, middle * INDEXENTRY.size)[0] < turn:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def DecodeTurn(self, position):
+		# Decodes the turn block starting at position
+		_, turn, count = TURNHEADER.unpack_from(self.Map, position)
+		position += TURNHEADER.size
+		if numpy is not None and count >= BULKDECODEMIN:
+			# Copied out of the map, so that no array holds on to it
+			block = self.Map[position:position + count * TURNDTYPE.itemsize]
+			records = numpy.frombuffer(block, dtype=TURNDTYPE)
+			allValues = BattleParser.ConvertArrayToValues(BattleParser.ConvertBlockToArray(records))
+			# DecodeResult inlined, without going through ResultKind for every row
+			boolKind, intKind, locationKind = ResultKind.BOOL.value, ResultKind.INT.value, ResultKind.LOCATION.value
+			results = [bool(first) if kind == boolKind else first if kind == intKind else (first, second) if kind == locationKind else None
+					for kind, first, second in zip(records['kind'].tolist(), records['first'].tolist(), records['second'].tolist())]
+			return (turn, list(zip(allValues, results)))
+		actions = list()
+		for _ in range(count):
+			values = BattleParser.ConvertFromBinary(self.Map, position)
+			position += ACTIONRECORD.size
+			result = DecodeResult(*RESULTRECORD.unpack_from(self.Map, position))
+			position += RESULTRECORD.size
+			actions.append((values, result))
+		return (turn, actions)
+
+	def ReadTurn(self, turn):
+		entry = self.FindEntry(turn)
+		if entry >= self.TurnCount():
+			return list()
+		entryTurn, position = INDEXENTRY.unpack_from(self.Index, entry * INDEXENTRY.size)
+		if entryTurn != turn:
+			return list()
+		return self.DecodeTurn(position)[1]
+
+	def IterateTurns(self, first = 0):
+		for entry in range(self.FindEntry(first), self.TurnCount()):
+			yield self.DecodeTurn(INDEXENTRY.unpack_from(self.Index, entry * INDEXENTRY.size)[1])
+
+	def LastTurn(self):
+		if self.TurnCount() == 0:
+			return None
+		return INDEXENTRY.unpack_from(self.Index, (self.TurnCount() - 1) * INDEXENTRY.size)[0]
+
+	def ReadKeyframe(self, turn):
+		entry = self.FindEntry(turn + 1, self.KeyIndex) - 1
+		if entry < 0:
+			return None
+		position = INDEXENTRY.unpack_from(self.KeyIndex, entry * INDEXENTRY.size)[1]
+		_, keyTurn, count = TURNHEADER.unpack_from(self.Map, position)
+		position += TURNHEADER.size
+		units = list()
+		for unitID, team, xPos, yPos, hp in KEYRECORD.iter_unpack(self.Map[position:position + count * KEYRECORD.size]):
+			units.append((format(unitID, '04x'), team, xPos, yPos, hp))
+		return (keyTurn, units)
+
+	def Close(self):
+		for index in (self.Index, self.KeyIndex):
+			if index is not None:
+				index.release()
+		self.Index = None
+		self.KeyIndex = None
+		super().Close()
+
+def OpenReplay(fileName):
+	# Opens a gameplay record of either format for reading
+	# Returns None if the file is not a gameplay record
+	for readerType in (BinaryReplay, CSVReplay):
+		reader = readerType(fileName)
+		try:
+			if reader.Open():
+				return reader
+		except (UnicodeDecodeError, ValueError, csv.Error):
+			reader.Close()
+	return None
+
+# EOF
@@ -0,0 +1,129 @@
+# battleResolve.py
+# Resolution of simultaneous turns.
+# TURN MODES
+# In the default SEQUENTIAL mode every unit's action is carried out as soon as
+# it is asked for, in the order the units are listed, so a unit early in the
+# list can take a square (or a life) that a later one was going for.
+# In SIMULTANEOUS mode the engine first collects every unit's action and then
+# carries them out all at once, in phases:
+#  spawns   a unit is placed if its square is on the board, was empty when
+#           the turn began, and is asked for by no other spawn
+#  moves    every mover steps at once; a move fails if it leaves the board,
+#           if another mover wants the same square, if two units would swap
+#           squares, or if the square is held by a unit that stays where it
+#           is (including movers whose own moves failed). Rings of three or
+#           more units stepping into each other's squares all go ahead.
+#  attacks  each attack hits whoever is on the square in front of the
+#           attacker once everyone has moved; all of a turn's damage lands
+#           together, and every attacker gets its target's HP after all of it
+#  others   scans and delays, which see the board as the turn leaves it
+# so no outcome depends on the order of the units. The actions are recorded
+# in the same phase order, so that a replay which applies them one by one
+# ends up in the same state.
+# The decisions are made on whole NumPy arrays of squares, each encoded as a
+# single key y * width + x (see SquareKeys), plus whether each square asked
+# for was taken when the phase began (looked up in the engine's GridIndex);
+# only carrying out the results touches the units one at a time. Needs NumPy,
+# like the array store.
+from enum import Enum
+
+from battleActions import numpy
+
+class TurnMode(Enum):
+	# Defines how the actions of a turn are carried out
+	SEQUENTIAL = 'sequential'
+	SIMULTANEOUS = 'simultaneous'
+
+def HasResolver():
+	# Returns True if NumPy is available for simultaneous turns
+	return numpy is not None
+
+def SquareKeys(xVals, yVals, width):
+	# Returns the key of each (x, y) square as an int64 array
+	return numpy.asarray(yVals, dtype=numpy.int64) * width + numpy.asarray(xVals, dtype=numpy.int64)
+
+def InBounds(xVals, yVals, width, height):
+	# Returns a bool array, True for the squares on the board
+	xVals = numpy.asarray(xVals)
+	yVals = numpy.asarray(yVals)
+	return (xVals >= 0) & (xVals < width) & (yVals >= 0) & (yVals < height)
+
+def BoardKeys(xVals, yVals, width, height, base = 0):
+	# Returns the keys of a set of squares, with every square that is off the
+	# board given a key of its own below -base, so that it matches nothing
+	valid = InBounds(xVals, yVals, width, height)
+	keys = SquareKeys(xVals, yVals, width)
+	return (numpy.where(valid, keys, -1 - base - numpy.arange(len(keys))), valid)
+
+def Unique(keys):
+	# Returns a bool array, True where the key appears only once
+	if len(keys) == 0:
+		return numpy.zeros(0, dtype=bool)
+	values, inverse, counts = numpy.unique(keys, return_inverse=True, return_counts=True)
+	return counts[inverse] == 1
+
+def Lookup(keys, sortedKeys):
+	# Finds each key in an already sorted array
+	# Returns an array of positions in sortedKeys, -1 where the key is missing
+	if len(sortedKeys) == 0:
+		return numpy.full(len(keys), -1, dtype=numpy.int64)
+	positions = numpy.minimum(numpy.searchsorted(sortedKeys, keys), len(sortedKeys) - 1)
+	return numpy.where(sortedKeys[positions] == keys, positions, -1)
+
+def ResolveSpawns(xVals, yVals, taken, width, height):
+	# Decides which spawns succeed
+	# taken is True for each spawn whose square was taken at the start of
+	# the turn; returns a bool array, True for the spawns that succeed
+	keys, valid = BoardKeys(xVals, yVals, width, height)
+	valid &= ~numpy.asarray(taken, dtype=bool)
+	valid &= Unique(keys)
+	return valid
+
+def ResolveMoves(fromX, fromY, toX, toY, taken, width, height):
+	# Decides which moves succeed
+	# taken is True for each move whose destination is taken, by a mover or
+	# not; returns a bool array, True for the moves that succeed
+	count = len(fromX)
+	fromKeys = BoardKeys(fromX, fromY, width, height)[0]
+	toKeys, valid = BoardKeys(toX, toY, width, height, count)
+	valid &= Unique(toKeys)
+	# Find the mover, if any, that starts on each mover's destination
+	order = numpy.argsort(fromKeys, kind='stable')
+	ahead = Lookup(toKeys, fromKeys[order])
+	hasAhead = ahead >= 0
+	ahead = numpy.where(hasAhead, order[ahead], -1)
+	# A unit that is not moving at all holds its square
+	valid &= hasAhead | ~numpy.asarray(taken, dtype=bool)
+	# Two units cannot pass through each other
+	valid &= ~(hasAhead & (toKeys[ahead] == fromKeys))
+	# Every mover stuck behind one that stays put stays put too, all the way
+	# down the line; destinations are unique by now, so each mover has at
+	# most one follower still going
+	follower = numpy.full(count, -1, dtype=numpy.int64)
+	going = numpy.flatnonzero(valid & hasAhead)
+	follower[ahead[going]] = going
+	stuck = numpy.flatnonzero(~valid)
+	while len(stuck) > 0:
+		stuck = follower[stuck]
+		stuck = stuck[stuck >= 0]
+		stuck = stuck[valid[stuck]]
+		valid[stuck] = False
+	return valid
+
+def ResolveAttacks(xVals, yVals, taken, width, height):
+	# Finds the target of each attack
+	# taken is True for each attack whose square is taken after the moves;
+	# returns the key of each attack's target, or -1 if it hits nothing
+	keys, valid = BoardKeys(xVals, yVals, width, height)
+	return numpy.where(valid & numpy.asarray(taken, dtype=bool), keys, -1)
+
+def CountHits(targets):
+	# Returns a tuple of the keys of the squares hit, and the number of
+	# attacks on each
+	return numpy.unique(targets[targets >= 0], return_counts=True)
+
+def SquareOf(key, width):
+	# Returns the (x, y) square of a key
+	return (key % width, key // width)
+
+# EOF
@@ -0,0 +1,232 @@
+# battleWorld.py
+# Array-backed storage for the arena's units.
+# Instead of every unit being an Actor object with its own position, HP and
+# controller, an ArrayStore holds them in compact columns indexed by slot:
+#  X, Y        int32 position
+#  HP          int32 hit points
+#  Team        uint8 index into the store's list of controllers
+#  Alive       uint8, cleared when the unit is culled
+#  LastAction  uint8 value of the ActionType of the unit's latest action
+# Slots are handed out in creation order and never reused, like the IDs
+# themselves, so going through the living slots in order is going through the
+# units in acting order. The engine reads and writes single units through
+# SlotOf (ID -> slot) and the columns directly; bookkeeping that touches every
+# unit (culling, noting each unit's last action, looking up where a list of
+# units stand) works on NumPy views of whole columns at once.
+# No object is kept per unit. Code that wants Actors (the display, records,
+# checks) gets them from ArrayUnits, ArrayUnitMap and ArrayDead, which stand
+# in for the engine's ListActors, DictActors and ListDead and make an
+# ArrayActor view of a slot whenever one is asked for; see Engine.SetStore.
+# Needs NumPy; check HasArrays() before making a store.
+from array import array
+from collections.abc import Mapping, Sequence
+
+from battleActions import ActionType, numpy
+
+DELAY = ActionType.DELAY.value # LastAction of a unit that has not acted yet
+
+def HasArrays():
+	# Returns True if NumPy is available for the array store
+	return numpy is not None
+
+class ArrayActor:
+	# A view of one slot of an ArrayStore, standing in for an Actor
+	# Views are made on demand and hold nothing but the slot; two views of
+	# the same slot are equal
+	__slots__ = ('Store', 'Index')
+
+	def __init__(self, store, index):
+		self.Store = store
+		self.Index = index
+
+	def __eq__(self, other):
+		if not isinstance(other, ArrayActor):
+			return NotImplemented
+		return self.Store is other.Store and self.Index == other.Index
+
+	def __hash__(self):
+		return hash((id(self.Store), self.Index))
+
+	@property
+	def ID(self):
+		return self.Store.IDs[self.Index]
+
+	@property
+	def xPos(self):
+		return self.Store.X[self.Index]
+
+	@xPos.setter
+	def xPos(self, value):
+		self.Store.X[self.Index] = value
+
+	@property
+	def yPos(self):
+		return self.Store.Y[self.Index]
+
+	@yPos.setter
+	def yPos(self, value):
+		self.Store.Y[self.Index] = value
+
+	@property
+	def HP(self):
+		return self.Store.HP[self.Index]
+
+	@HP.setter
+	def HP(self, value):
+		self.Store.HP[self.Index] = value
+
+	@property
+	def Controller(self):
+		return self.Store.Controllers[self.Store.Team[self.Index]]
+
+	@property
+	def Color(self):
+		return self.Store.Colors[self.Store.Team[self.Index]]
+
+	@property
+	def LastAction(self):
+		return ActionType(self.Store.LastActions[self.Index])
+
+	@LastAction.setter
+	def LastAction(self, value):
+		self.Store.LastActions[self.Index] = value.value
+
+	def Location(self):
+		return (self.Store.X[self.Index], self.Store.Y[self.Index])
+
+class ArrayStore:
+	# Columns holding the state of every unit ever created
+	def __init__(self):
+		self.IDs = list() # slot -> ID
+		self.SlotOf = dict() # ID -> slot, for every living unit
+		self.LivingIDs = list() # IDs of the living units, in acting order
+		self.LivingSides = list() # and their controllers
+		self.Dead = list() # slots of the dead, in the order they died
+		self.Controllers = list() # team index -> controller name
+		self.Colors = list() # team index -> display color
+		self.TeamOf = dict() # controller name -> team index
+		self.X = array('i')
+		self.Y = array('i')
+		self.HP = array('i')
+		self.Team = array('B')
+		self.Alive = array('B')
+		self.LastActions = array('B')
+		# NumPy views of the columns are only made inside a method and let go
+		# before it returns, as an array cannot grow while one is held
+
+	def GetTeam(self, controller, color):
+		# Returns the team index of a controller, adding it if it is new
+		team = self.TeamOf.get(controller)
+		if team is None:
+			team = len(self.Controllers)
+			self.Controllers.append(controller)
+			self.Colors.append(color)
+			self.TeamOf[controller] = team
+		return team
+
+	def NewUnit(self, newID, controller, location, hp, color):
+		# Fills the next slot with a new living unit and returns the slot
+		slot = len(self.IDs)
+		self.IDs.append(newID)
+		self.SlotOf[newID] = slot
+		self.LivingIDs.append(newID)
+		self.LivingSides.append(controller)
+		self.X.append(location[0])
+		self.Y.append(location[1])
+		self.HP.append(hp)
+		self.Team.append(self.GetTeam(controller, color))
+		self.Alive.append(1)
+		self.LastActions.append(DELAY)
+		return slot
+
+	def ControllerOf(self, unitID):
+		# Returns the controller of a living unit
+		return self.Controllers[self.Team[self.SlotOf[unitID]]]
+
+	def Locations(self, unitIDs):
+		# Returns the (x, y) of each of the given living units, in order
+		if len(unitIDs) == 0:
+			return list()
+		slotOf = self.SlotOf
+		slots = [slotOf[unitID] for unitID in unitIDs]
+		xVals = numpy.frombuffer(self.X, dtype=numpy.int32)[slots].tolist()
+		yVals = numpy.frombuffer(self.Y, dtype=numpy.int32)[slots].tolist()
+		return list(zip(xVals, yVals))
+
+	def SetLastActions(self, actionTypes):
+		# Notes each living unit's latest action, given in acting order
+		lastActions = self.LastActions
+		slotOf = self.SlotOf
+		for unitID, actionType in zip(self.LivingIDs, actionTypes):
+			lastActions[slotOf[unitID]] = actionType.value
+
+	def Cull(self):
+		# Marks every living unit with no HP left as dead
+		# Returns (ID, (x, y), controller, HP) for each unit that has just
+		# died, in slot order; they are already gone from SlotOf and the
+		# living lists
+		if len(self.IDs) == 0:
+			return list()
+		alive = numpy.frombuffer(self.Alive, dtype=numpy.uint8)
+		hp = numpy.frombuffer(self.HP, dtype=numpy.int32)
+		dying = numpy.flatnonzero(alive.astype(bool) & (hp <= 0))
+		if len(dying) == 0:
+			return list()
+		alive[dying] = 0
+		teams = numpy.frombuffer(self.Team, dtype=numpy.uint8)
+		living = numpy.flatnonzero(alive)
+		livingTeams = teams[living].tolist()
+		deadTeams = teams[dying].tolist()
+		locations = zip(numpy.frombuffer(self.X, dtype=numpy.int32)[dying].tolist(), numpy.frombuffer(self.Y, dtype=numpy.int32)[dying].tolist())
+		hpLeft = hp[dying].tolist()
+		living = living.tolist()
+		dying = dying.tolist()
+		del alive, hp, teams
+		ids = self.IDs
+		controllers = self.Controllers
+		deadIDs = [ids[slot] for slot in dying]
+		for unitID in deadIDs:
+			del self.SlotOf[unitID]
+		self.Dead += dying
+		self.LivingIDs = [ids[slot] for slot in living]
+		self.LivingSides = [controllers[team] for team in livingTeams]
+		return list(zip(deadIDs, locations, [controllers[team] for team in deadTeams], hpLeft))
+
+class ArrayUnits(Sequence):
+	# The living units of an ArrayStore in acting order, as ArrayActors
+	def __init__(self, store):
+		self.Store = store
+
+	def __len__(self):
+		return len(self.Store.LivingIDs)
+
+	def __getitem__(self, index):
+		store = self.Store
+		return ArrayActor(store, store.SlotOf[store.LivingIDs[index]])
+
+class ArrayUnitMap(Mapping):
+	# ID -> ArrayActor, for every living unit of an ArrayStore
+	def __init__(self, store):
+		self.Store = store
+
+	def __len__(self):
+		return len(self.Store.SlotOf)
+
+	def __iter__(self):
+		return iter(self.Store.SlotOf)
+
+	def __getitem__(self, unitID):
+		return ArrayActor(self.Store, self.Store.SlotOf[unitID])
+
+class ArrayDead(Sequence):
+	# The dead units of an ArrayStore in the order they died, as ArrayActors
+	def __init__(self, store):
+		self.Store = store
+
+	def __len__(self):
+		return len(self.Store.Dead)
+
+	def __getitem__(self, index):
+		return ArrayActor(self.Store, self.Store.Dead[index])
+
+# EOF
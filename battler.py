@@ -2,32 +2,38 @@
 # battler.py
 # Contains the main driver and components for running the autobattler
 # IMPORTS
-import sys
-import os
 import argparse
+import time
 import random
+import itertools
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor, wait
 from enum import Enum
 from abc import ABC, abstractmethod
 from colorama import Fore, Back, Style
 
-from battleActions import Action, ActionType, Dir, BattleParser
+from battleActions import Action, ActionType, Dir, BattleParser, ProtocolMode, WireFormat
+from battleActions import IsControllerSpec, LoadController, ParseWorldSize, ParseSquare, FormatWorldSize
+from battleActions import numpy, BULKDECODEMIN, Cell, ScanOffsets, SCANRADIUS, MAXSCANRADIUS
+from battleComms import PipeSession
+from battleDisplay import CursesRenderer, Rulers, ClampView, UnitsInView
+from battleLog import LOG, Level, TraceBuffer
+from battleMetrics import BattleMetrics, Measure, PrintSummary
+from battleRecord import RecordFormat, MakeRecorder, KEYFRAMEINTERVAL
+from battleResolve import TurnMode, HasResolver, ResolveSpawns, ResolveMoves, ResolveAttacks, CountHits, SquareOf
+from battleWorld import ArrayStore, ArrayUnits, ArrayUnitMap, ArrayDead, HasArrays
 
 # GLOBALS
-WORLDSIDELENGTH = 10
+WORLDSIDELENGTH = 10 # default width and height of the world; see Engine.Width
 STARTINGHP = 1
 MAXDURATION = 10
 SPAWNCOUNT = 5
-
-# FIXME: move this debug tool out to a portable drop-in module
-VERBOSEMODE = False
-def logmsg(*args, **kwargs):
-	global VERBOSEMODE
-	if VERBOSEMODE == True:
-		print(*args, file=sys.stderr, **kwargs)
+UNITKEYS = attrgetter('ID', 'Controller') # Actor -> (ID, controller), see Engine.LivingUnits
 
 # CLASSES
 class Actor:
 	# Defines the minimum reqs for an entity in the arena
+	__slots__ = ('ID', 'Controller', 'xPos', 'yPos', 'HP', 'Color', 'LastAction')
 	ID: int         # assigned by the engine
 	Controller: str # corr. to the pipe of the player that created it
 	xPos: int
@@ -41,21 +47,29 @@ class Actor:
 		self.yPos = newLocation[1]
 		self.HP = newHP
 		self.Color = newColor
-		self.LastAction = Engine.DelayAction(self.ID)
-		# DEBUG
-		if self.Controller == Engine.p1Controller:
-			self.Color = Fore.BLUE
-		elif self.Controller == Engine.p2Controller:
-			self.Color = Fore.GREEN
-		# DEBUG-END
-		logmsg("*   Actor created: {}:{} @{}, HP: {}".format(self.ID, self.Controller, self.Location(), self.HP)) # DEBUG
+		self.LastAction = None # ActionType of the unit's latest action, set by the engine
+		if LOG.Debugging:
+			LOG.Debug("*   Actor created: {}:{} @{}, HP: {}", self.ID, self.Controller, self.Location(), self.HP) # DEBUG
 
 	def Location(self):
 		return (self.xPos, self.yPos)
 
+class Tally:
+	# Running totals for one controller's living units, kept up to date by
+	# the engine as units are created, damaged and culled
+	__slots__ = ('Units', 'HP', 'Lost')
+	def __init__(self):
+		self.Units = 0 # living units
+		self.HP = 0 # their HP added up; includes this turn's dead until the cull
+		self.Lost = 0 # units culled so far
+
+	def AsDict(self):
+		return {'units': self.Units, 'hp': self.HP, 'lost': self.Lost}
+
 class Engine:
 	# Defines the system that runs and referees the battle
-	TurnCur = 0
+	# All of the world state lives on the instance, so that several battles
+	# can be run in the same process without interfering with each other
 	class Mode(Enum):
 		OFFLINE = 0
 		STARTUP = 1
@@ -63,23 +77,56 @@ class Engine:
 		PAUSED = 3
 		FINISH = 4
 		SHUTDOWN = 5
-	State = Mode.OFFLINE
-	StatePrev = Mode.OFFLINE
-	p1Controller = 'fifo_pipeP1'
-	p2Controller = 'fifo_pipeP2'
-	outFileName = 'default_out' # FIXME: unspecified output filenames should be timestamps
-	ListActionsThisTurn = list()
-	ListActors = list()
-	ListDead = list()
 	DirMap = {
 		Dir.UP: (0, 1),
 		Dir.DOWN: (0, -1),
 		Dir.LEFT: (-1, 0),
 		Dir.RIGHT: (1, 0)
 	}
+	DirParams = {direction: (direction.value,) for direction in DirMap} # shared Params tuples
+	ScanOffsetTable = {radius: ScanOffsets(radius) for radius in range(MAXSCANRADIUS + 1)} # radius -> squares a SCAN covers
+	ScanParams = {radius: (radius,) for radius in range(MAXSCANRADIUS + 1)}
 
-	def __init__(self):
-		logmsg("*   Initializing game engine") # DEBUG
+	def __init__(self, p1Controller = 'fifo_pipeP1', p2Controller = 'fifo_pipeP2', outFileName = 'default_out'):
+		LOG.Debug("*   Initializing game engine") # DEBUG
+		self.TurnCur = 0
+		self.MaxDuration = MAXDURATION
+		self.State = Engine.Mode.OFFLINE
+		self.StatePrev = Engine.Mode.OFFLINE
+		self.p1Controller = p1Controller
+		self.p2Controller = p2Controller
+		self.outFileName = outFileName # FIXME: unspecified output filenames should be timestamps
+		# Only occupied squares are stored (see GridIndex), so the world can be
+		# up to MAXWORLDSIZE a side without costing any more memory
+		self.Width = WORLDSIDELENGTH
+		self.Height = WORLDSIDELENGTH
+		self.ViewFocus = None # square the display starts centred on; None follows the armies
+		self.Headless = False # if True, skip all rendering and delays
+		self.FrameRate = 20 # max display refreshes per second
+		self.TickDelay = 0.3 # seconds to pause between turns when not headless
+		self.Renderer = None
+		self.Sessions = dict() # controller -> PipeSession
+		self.Plugins = dict() # controller -> in-process Controller (see battleActions)
+		self.PendingResults = dict() # batch controller -> {ID: retval} for the next request
+		self.TurnBudget = None # seconds each controller may take per turn; None waits forever
+		self.TimeSpent = dict() # unit controller -> seconds waited on it this turn
+		self.Stalled = set() # unit controllers that still owe a reply from a missed deadline
+		self.Outstanding = dict() # batch controller -> its latest request's Future
+		self.Pool = None # worker threads for querying batch controllers
+		self.Recorder = None # see battleRecord; None keeps no record
+		self.Metrics = None # see battleMetrics; None times nothing
+		self.Trace = None # see battleLog.TraceBuffer; None keeps no trace
+		self.Seed = None # plugins' dice are seeded from this; None leaves them unseeded
+		self.Store = None # see SetStore; None keeps each unit's state in its Actor
+		self.TurnMode = TurnMode.SEQUENTIAL # see battleResolve
+		self.ListActionsThisTurn = list()
+		self.ActionPool = dict() # action class -> spare instances for reuse
+		self.ListActors = list()
+		self.ListDead = list()
+		self.GridIndex = dict() # (x, y) -> ID, for every living unit on the board
+		self.DictActors = dict() # ID -> Actor, for every living unit
+		self.Tallies = dict() # controller -> Tally of its living units
+		self.NextIDNum = 1 # 0x0000 is reserved for the controller itself
 		self.SetToState(Engine.Mode.STARTUP)
 
 	def SetToState(self, newMode):
@@ -87,443 +134,1010 @@ class Engine:
 		self.StatePrev = self.State
 		self.State = newMode
 
+	def SetStore(self, store):
+		# Keeps the units' state in the given ArrayStore (see battleWorld)
+		# rather than in Actors; must be called before any unit is created
+		# ListActors, DictActors and ListDead become views of the store
+		self.Store = store
+		self.ListActors = ArrayUnits(store)
+		self.DictActors = ArrayUnitMap(store)
+		self.ListDead = ArrayDead(store)
+
 	def SetUpComms(self):
 		# Sets up the infrastructure between self and the players
-		# NOTE that mkfifo only creates the pipes, it does not open them
-		logmsg("*   Setting up pipes {} and {}".format(self.p1Controller, self.p2Controller)) # DEBUG
-		if not os.path.exists(self.p1Controller):
-			os.mkfifo(self.p1Controller)
-		if not os.path.exists(self.p2Controller):
-			os.mkfifo(self.p2Controller)
-
-	def New_DisplayBattle(self):
-		# Better method using python curses to do a crude animation
-		import curses
-		screen = curses.initscr()
-		screen.addstr(0, 0, "my test string")
-		# Start the indices at 1 to leave some padding
-		yIndex = 1
-		xIndex = 2
-		topRuler = ""
-		topBar = ""
-		fieldLine = ""
-		for val in range(WORLDSIDELENGTH):
-			topRuler += str(val)
-		for i in range(len(topRuler)):
-			topBar += '|'
-		# Add the top rulers to the screen
-		screen.addstr(yIndex, xIndex, topRuler)
-		yIndex += 1
-		xIndex = 2
-		screen.addstr(yIndex, xIndex, topBar)
-		yIndex += 1
-		xIndex = 0
-		# Add the battlefield
-		for yVal in reversed(range(WORLDSIDELENGTH)):
-			#print(str(yVal) + '-', end='')
-			fieldLine += str(yVal) + '-'
-			for xVal in range(WORLDSIDELENGTH):
-				if self.IsOccupied((xVal, yVal)):
-					unit = Engine.GetIDAt(xVal, yVal)
-					thisController = self.GetControllerOf(unit)
-					match thisController:
-						case self.p1Controller:
-							#print(Fore.BLUE + '@' + Style.RESET_ALL, end='')
-							fieldLine += '@'
-						case self.p2Controller:
-							#print(Fore.GREEN + '@' + Style.RESET_ALL, end='')
-							fieldLine += '@'
-						case _:
-							#print('@', end='')
-							fieldLine += '@'
-				else:
-					#print('┼', end='')
-					fieldLine += '┼'
-			#print('-' + str(yVal))
-			fieldLine += '-' + str(yVal)
-			screen.addstr(yIndex, xIndex, fieldLine)
-			fieldLine = ""
-			yIndex += 1
-			xIndex = 0
-		# Add the bottom rulers
-		xIndex = 2
-		screen.addstr(yIndex, xIndex, topBar)
-		yIndex += 1
-		xIndex = 2
-		screen.addstr(yIndex, xIndex, topRuler)
-		# Add the unit roster
-		# FIXME: put the turncount here
-		for guy in self.ListActors:
-			nextLine = "U-" + str(guy.ID) + "[" + str(guy.HP) + "] :" + str(guy.xPos) + "," + str(guy.yPos) + ":" + str(guy.LastAction.Type)
-			screen.addstr(yIndex, xIndex, nextLine)
-			nextLine = ""
-			yIndex += 1
-			xIndex = 2
-		for corpse in self.ListDead:
-			nextLine = "D-" + str(corpse.ID) + "[" + str(corpse.HP) + "] :" + str(corpse.xPos) + "," + str(corpse.yPos) + ":" + str(corpse.LastAction.Type)
-			screen.addstr(yIndex, xIndex, nextLine)
-			nextLine = ""
-			yIndex += 1
-			xIndex = 2
-		xIndex = 2
-		screen.addstr(yIndex, xIndex, "  id   HP  x, y  ^last action taken")
-		# Need to call .refresh in order to flush the buffer to output
-		screen.refresh()
-		curses.napms(300)
-		curses.endwin()
-
-	def DisplayBattle(self):
+		# Each player gets a pipe session that stays open for the whole battle;
+		# this blocks until both players have connected
+		# Players named as module:Class are loaded into this process instead
+		LOG.Debug("*   Setting up pipes {} and {}", self.p1Controller, self.p2Controller) # DEBUG
+		for index, controller in enumerate((self.p1Controller, self.p2Controller)):
+			if IsControllerSpec(controller):
+				plugin = LoadController(controller)
+				plugin.Start(controller, (self.Width, self.Height), self.GetSeedFor(index))
+				self.Plugins[controller] = plugin
+				LOG.Debug("*   {} loaded in-process", controller) # DEBUG
+				continue
+			session = PipeSession(controller)
+			session.OpenAsEngine()
+			# The controller opens with a hello naming its protocol mode
+			hello = session.ReadLine()
+			greeting = BattleParser.DecodeHello(hello)
+			if greeting is False:
+				LOG.Warn("* ! {} sent a bad hello: {}; assuming unit mode", controller, hello) # DEBUG
+				greeting = (ProtocolMode.UNIT, WireFormat.HEX)
+			session.Mode, session.Format = greeting
+			session.StartReader() # lets replies be waited for with a deadline
+			self.Sessions[controller] = session
+			LOG.Debug("*   {} connected in {} mode, {} format", controller, session.Mode.value, session.Format.value) # DEBUG
+			if self.TurnMode == TurnMode.SIMULTANEOUS and session.Mode == ProtocolMode.UNIT:
+				# A unit-mode controller waits for each action's return value
+				# before it is asked for the next one
+				LOG.Warn("* ! {} speaks unit mode; taking turns in order instead", controller) # DEBUG
+				self.TurnMode = TurnMode.SEQUENTIAL
+
+	def GetSeedFor(self, index):
+		# Returns the seed for the given player's dice: each side gets its own,
+		# so that two copies of the same bot do not make the same moves
+		if self.Seed is None:
+			return None
+		return (self.Seed + index) % (1 << 32)
+
+	def OpenDisplay(self):
+		# Starts the live display, if one is wanted
+		if self.Headless or self.Renderer is not None:
+			return
+		self.Renderer = CursesRenderer((self.Width, self.Height), self.FrameRate, self.ViewFocus)
+		self.Renderer.Open([self.p1Controller, self.p2Controller])
+
+	def CloseDisplay(self):
+		# Draws the final frame and gives the terminal back
+		if self.Renderer is None:
+			return
+		self.Renderer.Draw(self, force=True)
+		self.Renderer.Close()
+		self.Renderer = None
+
+	def DisplayBattle(self, centre = None, viewSize = (64, 32)):
 		# Pretty-prints the battlefield to stdout
 		# prototype for "live mode" later on
+		# Only the viewSize squares around centre (default the middle of the
+		# world) are shown, along with the units on them
 		# the colorama module supplies Fore, Back, Style, useable like so:
 		# print(Fore.RED + 'this is red text')
 		# print(Back.GREEN + 'and now with a green background')
 		# print(Style.DIM + 'and in dim text')
 		# print(Style.RESET_ALL, 'back to normal')
-		# FIXME: can't seem to use the colors if they are stored in vars?
-		print("----TURN #{}----".format(str(self.TurnCur)))
-		topRuler = "  "
-		topBar = "  "
-		for val in range(WORLDSIDELENGTH):
-			topRuler += str(val)
-		print(topRuler)
-		for i in range(len(topRuler) - 2):
-			topBar += '|'
-		print(topBar)
-		for yVal in reversed(range(WORLDSIDELENGTH)):
-			#row = str(yVal)
-			print(str(yVal) + '-', end='')
-			for xVal in range(WORLDSIDELENGTH):
-				if self.IsOccupied((xVal, yVal)):
-					unit = Engine.GetIDAt(xVal, yVal)
-					#glyphColor = Engine.GetColor(unit)
-					thisController = self.GetControllerOf(unit)
-					match thisController:
-						case self.p1Controller:
-							print(Fore.BLUE + '@' + Style.RESET_ALL, end='')
-						case self.p2Controller:
-							print(Fore.GREEN + '@' + Style.RESET_ALL, end='')
-						case _:
-							print('@', end='')
+		if centre is None:
+			centre = (self.Width // 2, self.Height // 2)
+		width = min(viewSize[0], self.Width)
+		height = min(viewSize[1], self.Height)
+		left = ClampView(centre[0], width, self.Width)
+		bottom = ClampView(centre[1], height, self.Height)
+		units = UnitsInView(self, left, bottom, width, height)
+		labelWidth = len(str(self.Height - 1))
+		lines = ["----TURN #{}----".format(str(self.TurnCur))]
+		numbers, digits = Rulers(left, width)
+		lines.append(" " * (labelWidth + 1) + numbers)
+		lines.append(" " * (labelWidth + 1) + digits)
+		for yVal in reversed(range(bottom, bottom + height)):
+			row = [str(yVal).rjust(labelWidth) + '-']
+			for xVal in range(left, left + width):
+				unit = units.get((xVal, yVal))
+				if unit is None:
+					row.append('┼')
 				else:
-					print('┼', end='')
-			print('-' + str(yVal))
-		print(topBar)
-		print(topRuler)
-		# print a list of all the living actors
-		for guy in self.ListActors:
-			match guy.Controller:
-				case self.p1Controller:
-					print(Fore.BLUE, end='')
-				case self.p2Controller:
-					print(Fore.GREEN, end='')
-			print("U-{}[{}] :{},{}:{}".format(guy.ID, guy.HP, guy.xPos, guy.yPos, guy.LastAction.Type))
+					row.append(unit.Color + '@' + Style.RESET_ALL)
+			row.append('-' + str(yVal))
+			lines.append("".join(row))
+		lines.append(" " * (labelWidth + 1) + digits)
+		lines.append(" " * (labelWidth + 1) + numbers)
+		# list the living actors in view, then the dead ones
+		for guy in sorted(units.values(), key=lambda unit: unit.ID):
+			lines.append(guy.Color + "U-{}[{}] :{},{}:{}".format(guy.ID, guy.HP, guy.xPos, guy.yPos, guy.LastAction))
 		for corpse in self.ListDead:
-			print(Fore.WHITE + Style.DIM, end='')
-			print("U-{}[{}] :{},{}:{}".format(corpse.ID, corpse.HP, corpse.xPos, corpse.yPos, corpse.LastAction.Type))
-		print(Style.RESET_ALL + "  id   HP  x, y  ^last action taken")
+			if left <= corpse.xPos < left + width and bottom <= corpse.yPos < bottom + height:
+				lines.append(Fore.WHITE + Style.DIM + "U-{}[{}] :{},{}:{}".format(corpse.ID, corpse.HP, corpse.xPos, corpse.yPos, corpse.LastAction))
+		lines.append(Style.RESET_ALL + "  id   HP  x, y  ^last action taken")
+		print("\n".join(lines))
 
-	@classmethod
 	def GetNewIDNum(self):
-		# Generates ID numbers in the range [0, 0xFFFF)
-		# Additionally checks to ensure there are no ID number clashes
-		idStr = hex(random.randrange(0xFFFF))
-		for unit in self.ListActors:
-			if idStr == unit.ID:
-				idStr = self.GetNewIDNum()
-		idStr = idStr[2:].rjust(4, '0')
+		# Generates ID numbers in the range [1, 0xFFFF]
+		# IDs are handed out in sequence and never reused, so they cannot clash
+		if self.NextIDNum > 0xFFFF:
+			raise OverflowError("Engine has run out of unit ID numbers")
+		idStr = format(self.NextIDNum, '04x')
+		self.NextIDNum += 1
 		return idStr
 
-	@classmethod
+	def AddUnit(self, newID, controller, location, hp):
+		# Registers a newly created unit on the board and in its side's tally
+		if self.IsInBounds(location):
+			self.GridIndex[tuple(location)] = newID
+		tally = self.GetTally(controller)
+		tally.Units += 1
+		tally.HP += hp
+
+	def GetTally(self, controller):
+		# Returns the Tally for the given controller, starting one if needed
+		tally = self.Tallies.get(controller)
+		if tally is None:
+			tally = self.Tallies[controller] = Tally()
+		return tally
+
 	def CreateUnit(self, controller, location):
 		# System method for creating new units
-		logmsg("*   Creating new unit under {} at {}".format(controller, location)) # DEBUG
-		newID = Engine.GetNewIDNum()
-		newUnit = Actor(newID, controller, location)
-		self.ListActors.append(newUnit)
-		logmsg("*   U-{}:{} created at {}".format(newID, controller, location)) # DEBUG
-		return newUnit.ID
-
-	@classmethod
+		if LOG.Debugging:
+			LOG.Debug("*   Creating new unit under {} at {}", controller, location) # DEBUG
+		newID = self.GetNewIDNum()
+		if self.Store is not None:
+			self.Store.NewUnit(newID, controller, location, STARTINGHP, self.GetTeamColor(controller))
+		else:
+			newUnit = Actor(newID, controller, location, newColor = self.GetTeamColor(controller))
+			newUnit.LastAction = ActionType.DELAY
+			self.ListActors.append(newUnit)
+			self.DictActors[newID] = newUnit
+		self.AddUnit(newID, controller, location, STARTINGHP)
+		if LOG.Debugging:
+			LOG.Debug("*   U-{}:{} created at {}", newID, controller, location) # DEBUG
+		return newID
+
 	def IsOccupied(self, location):
 		# Given a specified tuple (x, y),
 		# is there a unit that occupies those coordinates?
-		flag = False
-		for unit in self.ListActors:
-			if unit.xPos == location[0] and unit.yPos == location[1]:
-				flag = True
-		return flag
+		return tuple(location) in self.GridIndex
 
-	@classmethod
-	def GetColor(self, target):
-		# Untested
+	def IsInBounds(self, location):
+		# Is the given (x, y) tuple a valid square on the board?
+		return 0 <= location[0] < self.Width and 0 <= location[1] < self.Height
+
+	def CheckIndex(self):
+		# Verifies that the GridIndex and DictActors agree with the ListActors
+		# Returns True if they match, False otherwise
+		if len(self.DictActors) != len(self.ListActors):
+			LOG.Warn("* ! DictActors does not match ListActors") # DEBUG
+			return False
+		expected = dict()
 		for unit in self.ListActors:
-			if unit.ID == target:
-				return unit.Color
+			if self.DictActors.get(unit.ID) != unit:
+				LOG.Warn("* ! U-{} is missing from DictActors", unit.ID) # DEBUG
+				return False
+			location = unit.Location()
+			if not self.IsInBounds(location):
+				continue
+			if location in expected:
+				LOG.Warn("* ! U-{} and U-{} share {}", expected[location], unit.ID, location) # DEBUG
+				return False
+			expected[location] = unit.ID
+		if expected != self.GridIndex:
+			LOG.Warn("* ! GridIndex does not match ListActors") # DEBUG
+			return False
+		return True
+
+	def GetTeamColor(self, controller):
+		# Picks the display color for units belonging to the given controller
+		if controller == self.p1Controller:
+			return Fore.BLUE
+		elif controller == self.p2Controller:
+			return Fore.GREEN
 		return Fore.WHITE
 
-	def KillUnit(self, target):
-		# Not working, opted for safer in-place method
-		for index in range(len(self.ListActors)):
-			if self.ListActors[index].ID == target:
-				self.ListActors.pop(index)
-				logmsg("* x U-{} has died".format(target))
-			else:
-				logmsg("* ! Did not find target for culling...")
+	def GetColor(self, target):
+		# Untested
+		unit = self.DictActors.get(target)
+		if unit is None:
+			return Fore.WHITE
+		return unit.Color
 
 	def ExecuteGameLoop(self, duration, startingSize):
 		# Runs the game loop from start to finish
-		for round in range(duration + 1): # add one to cover the zeroth-round of setup
-			match self.State:
-				case Engine.Mode.OFFLINE:
-					logmsg("*!! ERR: Engine is offline") # DEBUG
-					return
-				case Engine.Mode.STARTUP:
-					logmsg("*   Starting up game") # DEBUG
-					self.SetupBattle(startingSize) # Spawn the starting units
-					self.SetToState(Engine.Mode.RUNNING)
-					continue
-				case Engine.Mode.RUNNING:
-					logmsg("*---TURN " + str(self.TurnCur)) # DEBUG
-					# Check whether the battle should end
-					if self.IsBattleOver():
-						self.SetToState(Engine.Mode.FINISH)
-					else:
-						self.IterateBattle()
-					continue
-				case Engine.Mode.PAUSED:
-					logmsg("*   Game has been paused") # DEBUG
-					# FIXME: causes loop lock without a way to trap input
-					# FIXME: good thing there's no way to get here...?
-					continue
-				case Engine.Mode.FINISH:
-					logmsg("*   The battle has ended") # DEBUG
-					# FIXME: display battle outcomes if requested
-					self.SetToState(Engine.Mode.SHUTDOWN)
-					continue
-				case Engine.Mode.SHUTDOWN:
-					logmsg("*   The game engine will now shut down") # DEBUG
-					self.Cleanup()
-					return
+		# If anything goes wrong, the trace of the last actions is dumped
+		self.MaxDuration = duration
+		try:
+			while True: # the SHUTDOWN state ends the loop once IsBattleOver says so
+				match self.State:
+					case Engine.Mode.OFFLINE:
+						LOG.Error("*!! ERR: Engine is offline") # DEBUG
+						return
+					case Engine.Mode.STARTUP:
+						LOG.Debug("*   Starting up game") # DEBUG
+						self.SetupBattle(startingSize) # Spawn the starting units
+						self.OpenRecord(startingSize)
+						self.OpenDisplay()
+						self.SetToState(Engine.Mode.RUNNING)
+						continue
+					case Engine.Mode.RUNNING:
+						LOG.Debug("*---TURN {}", self.TurnCur) # DEBUG
+						# Check whether the battle should end
+						if self.IsBattleOver():
+							self.SetToState(Engine.Mode.FINISH)
+						else:
+							self.IterateBattle()
+						continue
+					case Engine.Mode.PAUSED:
+						LOG.Debug("*   Game has been paused") # DEBUG
+						# FIXME: causes loop lock without a way to trap input
+						# FIXME: good thing there's no way to get here...?
+						continue
+					case Engine.Mode.FINISH:
+						LOG.Debug("*   The battle has ended") # DEBUG
+						LOG.Info("*   Final tallies: {}", self.Summary())
+						self.SetToState(Engine.Mode.SHUTDOWN)
+						continue
+					case Engine.Mode.SHUTDOWN:
+						LOG.Debug("*   The game engine will now shut down") # DEBUG
+						self.Cleanup()
+						return
+		except BaseException as err:
+			# Leaves a record of how the battle got here, even with logging off
+			LOG.Error("*!! ERR: battle stopped on turn {}: {!r}", self.TurnCur, err)
+			LOG.DumpTrace("{} vs {} stopped on turn {}: {!r}".format(self.p1Controller, self.p2Controller, self.TurnCur, err), self.Trace)
+			raise
 
 	def IterateBattle(self):
 		# Performs a single round of battle
-		logmsg("*   Iterating again") # DEBUG
+		LOG.Debug("*   Iterating again") # DEBUG
 		if self.State == Engine.Mode.SHUTDOWN:
-			logmsg("*!! ERR: Attempting to iterate during shutdown!") # DEBUG
+			LOG.Error("*!! ERR: Attempting to iterate during shutdown!") # DEBUG
 			return
-		for unit in self.ListActors:
-			logmsg("*   Requesting next action for U-{}".format(unit.ID)) # DEBUG
-			actionVals = self.GetNextActionFor(unit)
-			# 0=type, 1=subject, 2=params
-			nextAction = self.BuildActionFrom(actionVals[0], unit.ID, actionVals[2])
-			unit.LastAction = nextAction
-			self.ListActionsThisTurn.append(nextAction)
-			result = self.ListActionsThisTurn[-1].Do() # The action is not removed until recorded
-			with open(unit.Controller, "w") as outputPipe: # Send retval to the controller
-				logmsg("* > {}: returning {}".format(unit.Controller, str(result)))
-				outputPipe.write(str(result))
-		logmsg("*   All units have acted; checking for dead...")
-		deadActors = list(filter(lambda unit: unit.HP <= 0, self.ListActors))
-		if len(deadActors) > 0:
-			logmsg("*   Culling...")
+		metrics = self.Metrics
+		if metrics is not None:
+			metrics.StartTurn()
+		if self.Recorder is not None and self.Recorder.WantsKeyframe(self.TurnCur):
+			self.Recorder.WriteKeyframe(self.TurnCur, self.ListActors, self.ListDead)
+			if metrics is not None:
+				metrics.Lap('record')
+		# Batch controllers are asked for all of their units' actions up front
+		batchActions = self.GatherBatchActions()
+		if metrics is not None:
+			metrics.Lap('gather')
+		self.TimeSpent = dict.fromkeys(self.Sessions, 0.0)
+		if self.TurnMode == TurnMode.SIMULTANEOUS:
+			self.ActTogether(batchActions)
+		else:
+			self.ActInOrder(batchActions)
+		LOG.Debug("*   All units have acted; checking for dead...")
+		if self.Store is not None:
+			# The store takes them off its own lists
+			corpses = self.Store.Cull()
+		else:
+			deadActors = [unit for unit in self.ListActors if unit.HP <= 0]
 			for target in deadActors:
+				del self.DictActors[target.ID]
 				self.ListDead.append(target)
-				self.ListActors.remove(target)
-		logmsg("*   Next turn beginning")
-		#self.DisplayBattle()
-		self.New_DisplayBattle()
-		# FIXME: Use pop() to write each action out to a gameplay record
-		# instead of just wiping the list
-		#while len(self.ListActionsThisTurn) > 0:
-			#self.Record(self.ListActionsThisTurn.pop(0))
-		self.ListActionsThisTurn.clear()
+			if len(deadActors) > 0:
+				# One pass over the survivors rather than a list.remove per corpse
+				self.ListActors = [unit for unit in self.ListActors if unit.ID in self.DictActors]
+			corpses = [(target.ID, target.Location(), target.Controller, target.HP) for target in deadActors]
+		if len(corpses) > 0:
+			LOG.Debug("*   Culling...")
+			for unitID, location, controller, hp in corpses:
+				if self.GridIndex.get(location) == unitID:
+					del self.GridIndex[location]
+				# Take the corpse's HP off as it stands, so that the tally
+				# goes back to the sum over the living
+				tally = self.Tallies[controller]
+				tally.Units -= 1
+				tally.HP -= hp
+				tally.Lost += 1
+		if metrics is not None:
+			metrics.Lap('cull')
+		LOG.Debug("*   Next turn beginning")
+		if not self.Headless:
+			#self.DisplayBattle()
+			self.Renderer.Draw(self)
+			if metrics is not None:
+				metrics.Lap('render')
+			if self.TickDelay > 0:
+				time.sleep(self.TickDelay)
+				if metrics is not None:
+					metrics.Lap('idle')
+		if self.Recorder is not None:
+			self.Recorder.EndTurn(self.TurnCur)
+		self.ReleaseActions()
+		if metrics is not None:
+			metrics.Lap('record')
+			metrics.EndTurn()
 		self.TurnCur += 1 # *Always* the last action of this method
 
+	def LivingUnits(self):
+		# Returns the (ID, controller) of every living unit, in acting order
+		if self.Store is not None:
+			return zip(self.Store.LivingIDs, self.Store.LivingSides)
+		return map(UNITKEYS, self.ListActors)
+
+	def NoteLastActions(self, actionTypes):
+		# Sets each living unit's LastAction, given in acting order
+		if self.Store is not None:
+			self.Store.SetLastActions(actionTypes)
+			return
+		for unit, actionType in zip(self.ListActors, actionTypes):
+			unit.LastAction = actionType
+
+	def LocationsOf(self, unitIDs):
+		# Returns the (x, y) of each of the given living units, in order
+		if self.Store is not None:
+			return self.Store.Locations(unitIDs)
+		actors = self.DictActors
+		return [actors[unitID].Location() for unitID in unitIDs]
+
+	def ActInOrder(self, batchActions):
+		# Asks for and carries out each unit's action in turn, in the order
+		# the units are listed
+		metrics = self.Metrics
+		trace = self.Trace
+		lastActions = list()
+		for unitID, controller in self.LivingUnits():
+			awaitingResult = True
+			if controller in batchActions:
+				actionVals = batchActions[controller].get(unitID)
+				if actionVals is None:
+					LOG.Warn("* ! {} sent no action for U-{}", controller, unitID) # DEBUG
+					actionVals = (ActionType.DELAY, unitID, list())
+			else:
+				if LOG.Debugging:
+					LOG.Debug("*   Requesting next action for U-{}", unitID) # DEBUG
+				actionVals = self.GetNextActionFor(unitID, controller)
+				if actionVals is None:
+					# The controller was not asked or did not answer in time,
+					# so it is not waiting for a return value either
+					actionVals = (ActionType.DELAY, unitID, list())
+					awaitingResult = False
+			# 0=type, 1=subject, 2=params
+			nextAction = self.BuildActionFrom(actionVals[0], unitID, actionVals[2])
+			lastActions.append(nextAction.Type)
+			self.ListActionsThisTurn.append(nextAction)
+			if metrics is not None:
+				metrics.Lap('request', controller)
+			result = self.ListActionsThisTurn[-1].Do() # The action is not removed until recorded
+			if metrics is not None:
+				metrics.Lap('do', controller)
+			self.Record(nextAction, result)
+			if trace is not None:
+				trace.Add(self.TurnCur, unitID, nextAction.Type, nextAction.Params, result)
+			if metrics is not None:
+				metrics.Lap('record')
+			if controller in batchActions:
+				# Held back until the controller's next request
+				self.PendingResults.setdefault(controller, dict())[unitID] = result
+			elif awaitingResult:
+				if LOG.Debugging:
+					LOG.Debug("* > {}: returning {}", controller, str(result))
+				self.Sessions[controller].WriteLine(str(result)) # Send retval to the controller
+				if metrics is not None:
+					metrics.Lap('request', controller)
+		self.NoteLastActions(lastActions)
+
+	def ActTogether(self, batchActions):
+		# Collects every unit's action and then carries them all out at once,
+		# so that no outcome depends on the order of the units
+		# (see battleResolve); only batch and in-process controllers can take
+		# part, which SetUpComms makes sure of
+		# Actions and results are kept in parallel lists rather than in a
+		# tuple per unit, which for big armies mostly costs garbage collection
+		metrics = self.Metrics
+		store = self.Store
+		actors = self.DictActors
+		grid = self.GridIndex
+		spawns = list()
+		moves = list()
+		attacks = list()
+		others = list()
+		phases = {Engine.SpawnAction: spawns, Engine.MoveAction: moves, Engine.AttackAction: attacks}
+		noActions = dict()
+		lastActions = list()
+		for unitID, controller in self.LivingUnits():
+			actionVals = batchActions.get(controller, noActions).get(unitID)
+			if actionVals is None:
+				LOG.Warn("* ! {} sent no action for U-{}", controller, unitID) # DEBUG
+				actionVals = (ActionType.DELAY, unitID, list())
+			nextAction = self.BuildActionFrom(actionVals[0], unitID, actionVals[2])
+			lastActions.append(nextAction.Type)
+			self.ListActionsThisTurn.append(nextAction)
+			phases.get(type(nextAction), others).append(nextAction)
+		self.NoteLastActions(lastActions)
+		if metrics is not None:
+			metrics.Lap('request')
+		results = list() # one per action, in the order of spawns + moves + attacks + others
+		if len(spawns) > 0:
+			locations = [spawn.Location for spawn in spawns]
+			locationArray = numpy.array(locations).reshape(-1, 2)
+			taken = [location in grid for location in locations]
+			success = ResolveSpawns(locationArray[:, 0], locationArray[:, 1], taken, self.Width, self.Height)
+			for spawn, placed in zip(spawns, success.tolist()):
+				if placed:
+					results.append(self.SetLocation(spawn.Subject, spawn.Location))
+				else:
+					results.append(self.GetLocation(spawn.Subject))
+		if len(moves) > 0:
+			starts = self.LocationsOf([move.Subject for move in moves])
+			ends = [(start[0] + move.Direction[0], start[1] + move.Direction[1]) for start, move in zip(starts, moves)]
+			startArray = numpy.array(starts).reshape(-1, 2)
+			endArray = numpy.array(ends).reshape(-1, 2)
+			taken = [end in grid for end in ends]
+			success = ResolveMoves(startArray[:, 0], startArray[:, 1], endArray[:, 0], endArray[:, 1], taken, self.Width, self.Height).tolist()
+			# Every square left behind is emptied before any is filled, as a
+			# mover may be stepping into another's
+			for start, moved in zip(starts, success):
+				if moved:
+					del grid[start]
+			for move, moved, start, end in zip(moves, success, starts, ends):
+				if moved:
+					if store is not None:
+						slot = store.SlotOf[move.Subject]
+						store.X[slot], store.Y[slot] = end
+					else:
+						unit = actors[move.Subject]
+						unit.xPos, unit.yPos = end
+					grid[end] = move.Subject
+					results.append(end)
+				else:
+					results.append(start)
+		if len(attacks) > 0:
+			squares = self.LocationsOf([attack.Subject for attack in attacks])
+			squares = [(square[0] + attack.DirOffset[0], square[1] + attack.DirOffset[1]) for square, attack in zip(squares, attacks)]
+			squareArray = numpy.array(squares).reshape(-1, 2)
+			taken = [square in grid for square in squares]
+			targets = ResolveAttacks(squareArray[:, 0], squareArray[:, 1], taken, self.Width, self.Height)
+			hpLeft = {-1: False} # target key -> its HP once every hit has landed
+			for key, count in zip(*(values.tolist() for values in CountHits(targets))):
+				hpLeft[key] = self.AdjustHP(grid[SquareOf(key, self.Width)], -count)
+			results += [hpLeft[key] for key in targets.tolist()]
+		results += [nextAction.Do() for nextAction in others]
+		if metrics is not None:
+			metrics.Lap('do')
+		recorder = self.Recorder
+		trace = self.Trace
+		pending = self.PendingResults
+		for controller in (self.p1Controller, self.p2Controller):
+			pending.setdefault(controller, dict())
+		for nextAction, result in zip(itertools.chain(spawns, moves, attacks, others), results):
+			if recorder is not None:
+				recorder.WriteAction(self.TurnCur, nextAction, result)
+			if trace is not None:
+				trace.Add(self.TurnCur, nextAction.Subject, nextAction.Type, nextAction.Params, result)
+			# Held back until the controller's next request
+			pending[self.GetControllerOf(nextAction.Subject)][nextAction.Subject] = result
+		if metrics is not None:
+			metrics.Lap('record')
+
 	def BuildActionFrom(self, actionType, actionUnitID: int, actionParams) -> Action:
 		# Create an Action of the correct type
 		# The class Action has only a Type(ActionType) and a Subject(hex string)
-		logmsg("*   Building action: t:{}, u:{}, p:{}".format(actionType, actionUnitID, actionParams)) # DEBUG
-		match actionType:
-			case ActionType.DELAY: # = 0
-				newAction = self.DelayAction(actionUnitID)
-			case ActionType.SCAN: # = 1
-				newAction = self.ScanAction(actionUnitID)
-			case ActionType.MOVE: # = 2
-				direction = Dir(int(actionParams[0], base=16))
-				newAction = self.MoveAction(actionUnitID, direction)
-			case ActionType.ATTACK: # = 3
-				direction = Dir(int(actionParams[0], base=16))
-				newAction = self.AttackAction(actionUnitID, direction)
-			case ActionType.SPAWN: # = 4
-				# FIXME: add sanity checking for the spawn location
-				location = (int(actionParams[0]), int(actionParams[1]))
-				newAction = self.SpawnAction(actionUnitID, location)
-		# FIXME: need to make sure there is a Null value of ActionType
+		# Params are ints, as decoded by BattleParser; actions whose params
+		# make no sense are turned into a DelayAction
+		if LOG.Debugging:
+			LOG.Debug("*   Building action: t:{}, u:{}, p:{}", actionType, actionUnitID, actionParams) # DEBUG
+		newAction = None
+		try:
+			match actionType:
+				case ActionType.SCAN: # = 1
+					radius = actionParams[0] if len(actionParams) > 0 else 0
+					newAction = self.GetPooledAction(self.ScanAction, actionUnitID, radius)
+				case ActionType.MOVE: # = 2
+					direction = Dir(actionParams[0])
+					if direction in Engine.DirMap:
+						newAction = self.GetPooledAction(self.MoveAction, actionUnitID, direction)
+				case ActionType.ATTACK: # = 3
+					direction = Dir(actionParams[0])
+					if direction in Engine.DirMap:
+						newAction = self.GetPooledAction(self.AttackAction, actionUnitID, direction)
+				case ActionType.SPAWN: # = 4
+					# The location is checked when the spawn is carried out
+					location = (actionParams[0], actionParams[1])
+					newAction = self.GetPooledAction(self.SpawnAction, actionUnitID, location)
+		except (ValueError, IndexError):
+			LOG.Warn("* ! Bad params for {}: {}", actionType, actionParams) # DEBUG
+		if newAction is None: # ActionType.DELAY = 0, or unusable params
+			newAction = self.GetPooledAction(self.DelayAction, actionUnitID)
 		return newAction
 
-	@classmethod
+	def GetPooledAction(self, actionClass, *args):
+		# Returns an action of the given class aimed with args, reusing a spare
+		# one from an earlier turn when there is one
+		spares = self.ActionPool.get(actionClass)
+		if spares:
+			newAction = spares.pop()
+			newAction.Set(*args)
+			return newAction
+		return actionClass(self, *args)
+
+	def ReleaseActions(self):
+		# Hands this turn's actions back to the pool once they have been carried
+		# out and recorded; nothing else keeps hold of them
+		# Spares left over from earlier turns are let go, so the pool never
+		# holds more than one action per living unit (e.g. the first turn's
+		# spawns are not kept for the rest of the battle)
+		for spares in self.ActionPool.values():
+			spares.clear()
+		for oldAction in self.ListActionsThisTurn:
+			self.ActionPool.setdefault(type(oldAction), list()).append(oldAction)
+		self.ListActionsThisTurn.clear()
+
 	def GetControllerOf(self, unitID):
 		# Gets the controller (pipe name) of the specified unit
-		for unit in self.ListActors:
-			if unit.ID == unitID:
-				return unit.Controller
-		return ""
+		store = self.Store
+		if store is not None:
+			slot = store.SlotOf.get(unitID)
+			if slot is None:
+				return ""
+			return store.Controllers[store.Team[slot]]
+		unit = self.DictActors.get(unitID)
+		if unit is None:
+			return ""
+		return unit.Controller
 
-	@classmethod
 	def GetIDAt(self, xVal, yVal):
 		# Gets the ID of a unit at a given coordinate
-		for unit in self.ListActors:
-			if unit.xPos == xVal and unit.yPos == yVal:
-				return unit.ID
-		return False
+		return self.GridIndex.get((xVal, yVal), False)
 
-	@classmethod
 	def GetLocation(self, target):
 		# Returns the grid coordinates of the target
-		for unit in self.ListActors:
-			if unit.ID == target:
-				return (unit.xPos, unit.yPos)
-		# Could not find in the list
-		return (-1, -1)
+		store = self.Store
+		if store is not None:
+			slot = store.SlotOf.get(target)
+			if slot is None:
+				return (-1, -1)
+			return (store.X[slot], store.Y[slot])
+		unit = self.DictActors.get(target)
+		if unit is None:
+			# Could not find in the registry
+			return (-1, -1)
+		return (unit.xPos, unit.yPos)
 
-	@classmethod
 	def SetLocation(self, target, newLocation):
 		# Moves target to specified absolute coordinates
-		for unit in self.ListActors:
-			if unit.ID == target:
-				unit.xPos = newLocation[0]
-				unit.yPos = newLocation[1]
-				return (unit.xPos, unit.yPos)
-		# Could not find in the list
-		return (-1, -1)
-
-	@classmethod
+		store = self.Store
+		if store is not None:
+			slot = store.SlotOf.get(target)
+			if slot is None:
+				return (-1, -1)
+			oldLocation = (store.X[slot], store.Y[slot])
+			if self.GridIndex.get(oldLocation) == target:
+				del self.GridIndex[oldLocation]
+			newLocation = (newLocation[0], newLocation[1])
+			store.X[slot], store.Y[slot] = newLocation
+			if self.IsInBounds(newLocation):
+				self.GridIndex[newLocation] = target
+			return newLocation
+		unit = self.DictActors.get(target)
+		if unit is None:
+			# Could not find in the registry
+			return (-1, -1)
+		oldLocation = unit.Location()
+		if self.GridIndex.get(oldLocation) == target:
+			del self.GridIndex[oldLocation]
+		unit.xPos = newLocation[0]
+		unit.yPos = newLocation[1]
+		if self.IsInBounds(newLocation):
+			self.GridIndex[(unit.xPos, unit.yPos)] = target
+		return (unit.xPos, unit.yPos)
+
 	def AdjustHP(self, target, offset):
 		# Adjust HP of a single unit by the given offset
-		for unit in self.ListActors:
-			if unit.ID == target:
-				unit.HP += offset
-				return unit.HP
-		return -1
+		store = self.Store
+		if store is not None:
+			slot = store.SlotOf.get(target)
+			if slot is None:
+				return -1
+			hp = store.HP[slot] + offset
+			store.HP[slot] = hp
+			self.Tallies[store.Controllers[store.Team[slot]]].HP += offset
+			return hp
+		unit = self.DictActors.get(target)
+		if unit is None:
+			return -1
+		unit.HP += offset
+		self.Tallies[unit.Controller].HP += offset
+		return unit.HP
 
-	def Record(self, nextAction):
+	def OpenRecord(self, armySize):
+		# Starts the gameplay record, if one is wanted
+		if self.Recorder is None:
+			return
+		metadata = {
+			'p1': self.p1Controller,
+			'p2': self.p2Controller,
+			'world': FormatWorldSize(self.Width, self.Height),
+			'size': armySize,
+			'time': self.MaxDuration,
+			'seed': self.Seed,
+			'turnmode': self.TurnMode.value
+		}
+		if self.TurnBudget is not None:
+			metadata['budget'] = self.TurnBudget # a seed-only record of this cannot be regenerated
+		self.Recorder.Open(metadata)
+
+	def Record(self, nextAction, result):
 		# Writes an action line to the output file
-		#csvwriter.writerow((nextAction.Type, nextAction.Subject, nextAction.params))
-		pass
+		if self.Recorder is not None:
+			self.Recorder.WriteAction(self.TurnCur, nextAction, result)
 
 	def SetupBattle(self, armySize):
 		# Creates the starting units
 		for index in range(armySize):
-			self.ListActors.append(Actor(self.GetNewIDNum(), self.p1Controller))
-			self.ListActors.append(Actor(self.GetNewIDNum(), self.p2Controller))
+			self.CreateUnit(self.p1Controller, (-1, -1))
+			self.CreateUnit(self.p2Controller, (-1, -1))
 
-	def GetNextActionFor(self, target):
+	def GetNextActionFor(self, unitID, controller):
 		# Requests action values for a given unit
 		# Calls the controller pipe from the specified unit
-		logmsg("* > {} -> U-{}".format(target.Controller, target.ID)) # DEBUG
+		# Returns None if the controller was not asked or did not answer in time
+		# (e.g. it has used up its turn budget), in which case the unit delays
+		session = self.Sessions[controller]
+		if controller in self.Stalled and not self.Resync(controller):
+			return None
+		timeLeft = None
+		if self.TurnBudget is not None:
+			timeLeft = self.TurnBudget - self.TimeSpent[controller]
+			if timeLeft <= 0:
+				return None
+		if LOG.Debugging:
+			LOG.Debug("* > {} -> U-{}", controller, unitID) # DEBUG
 		# Start by notifying the player of the waiting unit:
-		with open(target.Controller, "w") as outputPipe:
-			outputPipe.write(str(target.ID))
+		session.WriteLine(str(unitID))
 		# As per API, target controller should respond with a move/spawn req:
-		with open(target.Controller, "r") as inputPipe:
-			for bytecode in inputPipe:
-				logmsg("* < {} <- {}".format(target.Controller, bytecode)) # DEBUG
-				if len(bytecode) == 0:
-					logmsg("* ! {} closed at other end".format(target.Controller)) # DEBUG
-					break
-			logmsg("*   Parsing new action")
-			# FIXME: is there a null value i can set for the variable 'bytecode'?
+		startTime = time.monotonic()
+		try:
+			bytecode = session.ReadLine(timeout=timeLeft)
+		except TimeoutError:
+			LOG.Warn("* ! {} missed its deadline for U-{}", controller, unitID) # DEBUG
+			self.Stalled.add(controller)
+			bytecode = False
+		self.TimeSpent[controller] += time.monotonic() - startTime
+		if bytecode is False:
+			return None
+		if LOG.Debugging:
+			LOG.Debug("* < {} <- {}", controller, bytecode) # DEBUG
+		if bytecode is None:
+			LOG.Warn("* ! {} closed at other end", controller) # DEBUG
+			return None
+		if LOG.Debugging:
+			LOG.Debug("*   Parsing new action")
+		if isinstance(bytecode, bytes):
+			newValues = BattleParser.ConvertFromBinary(bytecode)
+		else:
 			newValues = BattleParser.ConvertToValues(bytecode)
-			logmsg("*   Values obtained:", newValues) # DEBUG
+		if newValues is False:
+			LOG.Warn("* ! {} sent an unreadable action: {}", controller, bytecode) # DEBUG
+			return (ActionType.DELAY, unitID, list())
+		LOG.Debug("*   Values obtained: {}", newValues) # DEBUG
 		return newValues
 
+	def Resync(self, controller):
+		# Checks whether a stalled unit controller has sent its late reply
+		# The late action is dropped, but answering it puts the controller back
+		# in step so that it can be asked about the next unit
+		session = self.Sessions[controller]
+		try:
+			late = session.ReadLine(timeout=0)
+		except TimeoutError:
+			return False
+		if late is None:
+			return False
+		LOG.Debug("*   {} caught up; dropping late action {}", controller, late) # DEBUG
+		session.WriteLine(str(False))
+		self.Stalled.discard(controller)
+		return True
+
+	def GatherBatchActions(self):
+		# Asks every batch controller for its units' actions at the same time
+		# Returns a dict of controller -> {ID: action values}; controllers that
+		# miss the deadline get an empty dict, so all of their units delay
+		batchActions = dict()
+		unitsOf = dict() # controller -> IDs of its living units, in acting order
+		for unitID, controller in self.LivingUnits():
+			unitsOf.setdefault(controller, list()).append(unitID)
+		# The budget starts as the requests go out
+		deadline = None
+		if self.TurnBudget is not None:
+			deadline = time.monotonic() + self.TurnBudget
+		futures = dict()
+		for controller, session in self.Sessions.items():
+			if session.Mode != ProtocolMode.BATCH:
+				continue
+			batchActions[controller] = dict()
+			previous = self.Outstanding.get(controller)
+			if previous is not None and not previous.done():
+				LOG.Warn("* ! {} is still busy with an earlier turn", controller) # DEBUG
+				continue
+			if self.Pool is None:
+				self.Pool = ThreadPoolExecutor(max_workers=len(self.Sessions))
+			unitIDs = unitsOf.get(controller, list())
+			results = self.PendingResults.get(controller, dict())
+			self.PendingResults[controller] = dict()
+			if self.Metrics is not None:
+				futures[controller] = self.Pool.submit(Measure, self.GetNextActionsFor, controller, self.TurnCur, unitIDs, results, deadline)
+			else:
+				futures[controller] = self.Pool.submit(self.GetNextActionsFor, controller, self.TurnCur, unitIDs, results, deadline)
+			self.Outstanding[controller] = futures[controller]
+		# The pipe controllers are already working on this turn, so the
+		# plugins' time on this thread does not come out of their budget;
+		# each plugin is held to the budget on its own
+		for controller in self.Plugins:
+			unitIDs = unitsOf.get(controller, list())
+			results = self.PendingResults.get(controller, dict())
+			self.PendingResults[controller] = dict()
+			if self.Metrics is not None:
+				batchActions[controller] = self.Metrics.Timed('gather', controller, self.GetPluginActionsFor, controller, self.TurnCur, unitIDs, results)
+			else:
+				batchActions[controller] = self.GetPluginActionsFor(controller, self.TurnCur, unitIDs, results)
+		if len(futures) == 0:
+			return batchActions
+		timeout = None
+		if deadline is not None:
+			timeout = max(0.0, deadline - time.monotonic())
+		done, notDone = wait(futures.values(), timeout=timeout)
+		for controller, future in futures.items():
+			if future not in done:
+				LOG.Warn("* ! {} missed its deadline for turn {}", controller, self.TurnCur) # DEBUG
+			elif self.Metrics is not None:
+				# Only replies in time count, and only the main thread adds to the metrics
+				batchActions[controller], seconds = future.result()
+				self.Metrics.Add('gather', controller, seconds)
+			else:
+				batchActions[controller] = future.result()
+		return batchActions
+
+	def GetPluginActionsFor(self, controller, turn, unitIDs, results):
+		# Asks an in-process controller for all of its units' actions
+		# A plugin cannot be interrupted, so one that overruns the turn budget
+		# has its actions thrown away afterwards instead
+		# Returns a dict of unit ID -> action values; units left out will delay
+		startTime = time.monotonic()
+		newValues = self.Plugins[controller].NextActions(turn, unitIDs, results)
+		if self.TurnBudget is not None and time.monotonic() - startTime > self.TurnBudget:
+			LOG.Warn("* ! {} missed its deadline for turn {}", controller, turn) # DEBUG
+			return dict()
+		actions = dict()
+		for values in newValues:
+			actions[values[1]] = values
+		return actions
+
+	def GetNextActionsFor(self, controller, turn, unitIDs, results, deadline = None):
+		# Requests action values for all of a batch controller's units at once
+		# Runs on a worker thread, so it only touches the controller's session
+		# Returns a dict of unit ID -> action values; units left out will delay
+		session = self.Sessions[controller]
+		LOG.Debug("* > {} -> T-{}: {} units", controller, turn, len(unitIDs)) # DEBUG
+		session.WriteLine(BattleParser.EncodeBatchRequest(turn, unitIDs, results))
+		while True:
+			timeout = None
+			if deadline is not None:
+				timeout = max(0.0, deadline - time.monotonic())
+			try:
+				reply = session.ReadLine(timeout=timeout)
+			except TimeoutError:
+				return dict()
+			LOG.Debug("* < {} <- {}", controller, reply) # DEBUG
+			if reply is None:
+				LOG.Warn("* ! {} closed at other end", controller) # DEBUG
+				return dict()
+			if session.Format == WireFormat.BIN:
+				decoded = BattleParser.DecodeBatchReplyBinary(reply)
+			else:
+				decoded = BattleParser.DecodeBatchReply(reply)
+			if decoded is False:
+				LOG.Warn("* ! {} sent a bad reply for turn {}", controller, turn) # DEBUG
+				return dict()
+			if decoded[0] == turn:
+				break
+			LOG.Debug("*   {} sent a late reply for turn {}; dropped", controller, decoded[0]) # DEBUG
+		actions = dict()
+		if session.Format == WireFormat.BIN:
+			# Already decoded straight from the reply buffer
+			for index, newValues in enumerate(decoded[1]):
+				if newValues is False:
+					LOG.Warn("* ! {} sent an unreadable action: record {}", controller, index) # DEBUG
+					continue
+				actions[newValues[1]] = newValues
+			return actions
+		if numpy is not None and len(decoded[1]) >= BULKDECODEMIN:
+			# Decode the whole reply in one go
+			allValues = BattleParser.ConvertArrayToValues(BattleParser.ConvertBlockToArray(decoded[1]))
+		else:
+			allValues = [BattleParser.ConvertToValues(bytecode) for bytecode in decoded[1]]
+		for bytecode, newValues in zip(decoded[1], allValues):
+			if newValues is False:
+				LOG.Warn("* ! {} sent an unreadable action: {}", controller, bytecode) # DEBUG
+				continue
+			actions[newValues[1]] = newValues
+		return actions
+
+	def CountUnits(self):
+		# Returns a dict of controller -> number of living units
+		return {controller: self.GetTally(controller).Units for controller in (self.p1Controller, self.p2Controller)}
+
+	def Summary(self):
+		# Returns the tallies of both sides and who is ahead, as a dict:
+		#  {'p1': {'units', 'hp', 'lost'}, 'p2': {...}, 'turns': n, 'winner': 'p1', 'p2' or 'draw'}
+		# The side with more living units is ahead, or with more HP if they
+		# have as many units
+		p1 = self.GetTally(self.p1Controller)
+		p2 = self.GetTally(self.p2Controller)
+		if (p1.Units, p1.HP) > (p2.Units, p2.HP):
+			winner = 'p1'
+		elif (p2.Units, p2.HP) > (p1.Units, p1.HP):
+			winner = 'p2'
+		else:
+			winner = 'draw'
+		return {'p1': p1.AsDict(), 'p2': p2.AsDict(), 'turns': self.TurnCur, 'winner': winner}
+
+	def CheckTallies(self):
+		# Verifies the Tallies against a count of the ListActors
+		# Returns True if they match, False otherwise
+		expected = dict()
+		for unit in self.ListActors:
+			units, hp = expected.get(unit.Controller, (0, 0))
+			expected[unit.Controller] = (units + 1, hp + unit.HP)
+		for controller, tally in self.Tallies.items():
+			if expected.pop(controller, (0, 0)) != (tally.Units, tally.HP):
+				LOG.Warn("* ! Tally for {} does not match ListActors", controller) # DEBUG
+				return False
+		if len(expected) > 0:
+			LOG.Warn("* ! Units under {} have no tally", list(expected)) # DEBUG
+			return False
+		return True
+
 	def IsBattleOver(self):
 		# Simple boolean helper for checking the ongoing battle state
-		if self.TurnCur >= MAXDURATION:
-			return True
-		if len(self.ListActors) <= 1:
+		if self.TurnCur >= self.MaxDuration:
 			return True
-		return False
+		# Over as soon as no more than one side has anyone left
+		standing = 0
+		for tally in self.Tallies.values():
+			if tally.Units > 0:
+				standing += 1
+		return standing <= 1
 
 	def Cleanup(self):
 		# Runs manual cleanup procedures: pipe deletion, &c
-		if os.path.exists(self.p1Controller):
-			os.remove(self.p1Controller)
-		if os.path.exists(self.p2Controller):
-			os.remove(self.p2Controller)
+		self.CloseDisplay()
+		if self.Recorder is not None:
+			self.Recorder.Close()
+		if self.Pool is not None:
+			self.Pool.shutdown(wait=False, cancel_futures=True)
+			self.Pool = None
+		for session in self.Sessions.values():
+			session.Close()
+			session.Remove()
+		self.Sessions.clear()
+		for plugin in self.Plugins.values():
+			plugin.Stop()
+		self.Plugins.clear()
+		if self.Metrics is not None:
+			self.Metrics.Close({'p1': self.p1Controller, 'p2': self.p2Controller, 'seed': self.Seed,
+					'world': FormatWorldSize(self.Width, self.Height), 'time': self.MaxDuration, 'units': self.NextIDNum - 1,
+					'tallies': {controller: tally.AsDict() for controller, tally in self.Tallies.items()}})
+		LOG.Flush()
 
 	# ACTIONS
 	class DelayAction(Action):
+		__slots__ = ('Engine', 'Subject')
 		Type = ActionType.DELAY
 		
-		def __init__(self, newSubject):
+		def __init__(self, engine, newSubject):
+			self.Engine = engine
+			self.Set(newSubject)
+
+		def Set(self, newSubject):
 			self.Subject = newSubject
 		
 		def Do(self):
 			# enjoy ur break
-			logmsg("*   U-{}: Do.DELAY".format(self.Subject)) # DEBUG
+			if LOG.Debugging:
+				LOG.Debug("*   U-{}: Do.DELAY", self.Subject) # DEBUG
 			return True
 
 	class ScanAction(Action):
+		__slots__ = ('Engine', 'Subject', 'Radius', 'Params')
 		Type = ActionType.SCAN
 
-		def __init__(self, newSubject):
+		def __init__(self, engine, newSubject, newRadius = 0):
+			self.Engine = engine
+			self.Set(newSubject, newRadius)
+
+		def Set(self, newSubject, newRadius = 0):
 			self.Subject = newSubject
+			if newRadius <= 0:
+				newRadius = SCANRADIUS
+			self.Radius = min(newRadius, MAXSCANRADIUS)
+			self.Params = Engine.ScanParams[self.Radius]
 
 		def Do(self):
 			# give the subject an image of the neighboring tiles
-			#return TileString
-			logmsg("*   U-{}: Do.SCAN".format(self.Subject)) # DEBUG
-			# FIXME: this is just a stub, the return value is undecided
-			return True
+			# Only the squares around the subject are looked up in the GridIndex,
+			# so a scan costs the same however many units there are
+			# Returns the view as encoded by BattleParser.EncodeScan, or false if
+			# the subject is not on the board
+			engine = self.Engine
+			xVal, yVal = engine.GetLocation(self.Subject) # (-1, -1) if it is dead
+			if not engine.IsInBounds((xVal, yVal)):
+				return False
+			if LOG.Debugging:
+				LOG.Debug("*   U-{}: Do.SCAN around {} radius {}", self.Subject, (xVal, yVal), self.Radius) # DEBUG
+			radius = self.Radius
+			grid = engine.GridIndex
+			actors = engine.DictActors
+			side = engine.GetControllerOf(self.Subject)
+			# An array store has no Actors to ask, so it is asked directly
+			controllerOf = None
+			if engine.Store is not None:
+				controllerOf = engine.Store.ControllerOf
+			# Squares only need checking against the edges near one
+			inside = radius <= xVal < engine.Width - radius and radius <= yVal < engine.Height - radius
+			empty = Cell.EMPTY.value
+			cells = list()
+			for offX, offY in Engine.ScanOffsetTable[radius]:
+				location = (xVal + offX, yVal + offY)
+				unitID = grid.get(location)
+				if unitID is None:
+					if inside or engine.IsInBounds(location):
+						cells.append(empty)
+					else:
+						cells.append(Cell.EDGE.value)
+				elif (actors[unitID].Controller if controllerOf is None else controllerOf(unitID)) == side:
+					cells.append(Cell.FRIEND.value)
+				else:
+					cells.append(Cell.ENEMY.value)
+			return BattleParser.EncodeScan(radius, cells)
 
 	class MoveAction(Action):
+		__slots__ = ('Engine', 'Subject', 'Direction', 'Params')
 		Type = ActionType.MOVE
-		Direction = (-1, -1)
 
-		def __init__(self, newSubject, newDirection):
+		def __init__(self, engine, newSubject, newDirection):
+			self.Engine = engine
+			self.Set(newSubject, newDirection)
+
+		def Set(self, newSubject, newDirection):
 			self.Subject = newSubject
 			self.Direction = Engine.DirMap[newDirection]
+			self.Params = Engine.DirParams[newDirection]
 
 		def Do(self):
-			#posnCurrent = Engine.GetLocation(self.Subject)
-			oldX, oldY = Engine.GetLocation(self.Subject)
+			#posnCurrent = self.Engine.GetLocation(self.Subject)
+			oldX, oldY = self.Engine.GetLocation(self.Subject)
 			offX, offY = self.Direction
 			newX = oldX + offX
 			newY = oldY + offY
-			logmsg("*   U-{}: Do.MOVE from {} to {}".format(self.Subject, (oldX, oldY), (newX, newY))) # DEBUG
-			if newX >= WORLDSIDELENGTH or newY >= WORLDSIDELENGTH or newX < 0 or newY < 0:
+			if LOG.Debugging:
+				LOG.Debug("*   U-{}: Do.MOVE from {} to {}", self.Subject, (oldX, oldY), (newX, newY)) # DEBUG
+			if not self.Engine.IsInBounds((newX, newY)):
 				# New position is out of bounds, don't move
 				return (oldX, oldY)
-			if Engine.IsOccupied((newX, newY)):
+			if self.Engine.IsOccupied((newX, newY)):
 				return (oldX, oldY)
-			result = Engine.SetLocation(self.Subject, (newX, newY))
+			result = self.Engine.SetLocation(self.Subject, (newX, newY))
 			return (newX, newY)
 
 	class AttackAction(Action):
+		__slots__ = ('Engine', 'Subject', 'Direction', 'DirOffset', 'Params')
 		Type = ActionType.ATTACK
-		Direction = Dir.NONE
-		DirOffset = (-1, -1)
 
-		def __init__(self, newSubject, newDirection):
+		def __init__(self, engine, newSubject, newDirection):
+			self.Engine = engine
+			self.Set(newSubject, newDirection)
+
+		def Set(self, newSubject, newDirection):
 			self.Subject = newSubject
 			self.Direction = newDirection
 			self.DirOffset = Engine.DirMap[newDirection]
+			self.Params = Engine.DirParams[newDirection]
 
 		def Do(self):
 			result = False
-			logmsg("*   U-{}: Do.ATTACK to {}".format(self.Subject, self.Direction)) # DEBUG
+			if LOG.Debugging:
+				LOG.Debug("*   U-{}: Do.ATTACK to {}", self.Subject, self.Direction) # DEBUG
 			# get the location of the subject
-			oldX, oldY = Engine.GetLocation(self.Subject)
+			oldX, oldY = self.Engine.GetLocation(self.Subject)
 			offX, offY = self.DirOffset
 			# combine w/ direction to get target location
 			newX = oldX + offX
 			newY = oldY + offY
-			if Engine.IsOccupied((newX, newY)): # if target location contains a robot,
-				target = Engine.GetIDAt(newX, newY)
-				result = Engine.AdjustHP(target, -1) # then that robot loses 1 pt hp
-				logmsg("*   U-{}: Successful attack on U-{}".format(self.Subject, target))
+			if self.Engine.IsOccupied((newX, newY)): # if target location contains a robot,
+				target = self.Engine.GetIDAt(newX, newY)
+				result = self.Engine.AdjustHP(target, -1) # then that robot loses 1 pt hp
+				if LOG.Debugging:
+					LOG.Debug("*   U-{}: Successful attack on U-{}", self.Subject, target)
 			return result # otherwise return false
 
 	class SpawnAction(Action):
@@ -532,17 +1146,26 @@ class Engine:
 		# the specified location.
 		# That is, this is an Action generated in response to the Engine
 		# allocating a new unit to a player
+		__slots__ = ('Engine', 'Subject', 'Location', 'Params')
 		Type = ActionType.SPAWN
-		Location = (0, 0)
 
-		def __init__(self, target, newLocation):
+		def __init__(self, engine, target, newLocation):
+			self.Engine = engine
+			self.Set(target, newLocation)
+
+		def Set(self, target, newLocation):
 			self.Subject = target # corr. to team ID
-			self.Location = newLocation
+			self.Location = tuple(newLocation)
+			self.Params = self.Location
 
 		def Do(self):
 			# Move the premade unit to the board
-			logmsg("*   U-{}: Do.SPAWN at {}".format(self.Subject, self.Location)) # DEBUG
-			result = Engine.SetLocation(self.Subject, self.Location)
+			if LOG.Debugging:
+				LOG.Debug("*   U-{}: Do.SPAWN at {}", self.Subject, self.Location) # DEBUG
+			if not self.Engine.IsInBounds(self.Location) or self.Engine.IsOccupied(self.Location):
+				# Can't stack units or place them off the board
+				return self.Engine.GetLocation(self.Subject)
+			result = self.Engine.SetLocation(self.Subject, self.Location)
 			return result
 
 def main():
@@ -555,36 +1178,133 @@ def main():
 	#argparser.add_argument('playerTwo', type=str, nargs=1,
 			#help='The path to the executable of the second player program')
 	argparser.add_argument('--pipe1', '-p1', type=str, nargs=1,
-			help='The path to the named pipe for the first player.')
+			help='The path to the named pipe for the first player, or a module:Class plugin.')
 	argparser.add_argument('--pipe2', '-p2', type=str, nargs=1,
-			help='The path to the named pipe for the second player.')
+			help='The path to the named pipe for the second player, or a module:Class plugin.')
 	argparser.add_argument('--size', '-s', type=int, default=SPAWNCOUNT,
 			help='The number of units to spawn at battle start.')
 	argparser.add_argument('--time', '-t', type=int, default=MAXDURATION,
 			help='The maximum number of rounds to allow in the battle.')
+	argparser.add_argument('--world', '-w', type=ParseWorldSize, default=(WORLDSIDELENGTH, WORLDSIDELENGTH),
+			help='The size of the world, as N for N x N squares or as WxH.')
+	argparser.add_argument('--view', type=str, default=None,
+			help='The square X,Y to centre the display on; by default it follows the armies.')
+	argparser.add_argument('--output', '-o', type=str, default=None,
+			help='The path of the gameplay record to write.')
+	argparser.add_argument('--record', type=str, default=RecordFormat.CSV.value,
+			choices=[entry.value for entry in RecordFormat],
+			help='The format of the gameplay record, or none to skip it.')
+	argparser.add_argument('--keyframes', type=int, default=KEYFRAMEINTERVAL,
+			help='The number of turns between world-state snapshots in the record, or 0 for none.')
+	argparser.add_argument('--seed', type=int, default=None,
+			help='The seed for the battle; plugin players roll from seed and seed+1.')
+	argparser.add_argument('--arrays', action='store_true', default=False,
+			help='Keep unit state in compact arrays rather than an object per unit; less memory for very large armies.')
+	argparser.add_argument('--turn-mode', type=str, default=TurnMode.SEQUENTIAL.value,
+			choices=[entry.value for entry in TurnMode],
+			help='Carry out each unit\'s action as it comes in, or all of a turn\'s actions at once.')
 	argparser.add_argument('--verbose', '-v', action='store_true', default=False,
-			help='Display debugging output.')
+			help='Display debugging output; the same as --log-level debug.')
+	argparser.add_argument('--log-level', type=str, default=None,
+			choices=[entry.name.lower() for entry in Level],
+			help='The lowest level of message to log (default off).')
+	argparser.add_argument('--log', type=str, default=None,
+			help='The path of a file to log to instead of stderr.')
+	argparser.add_argument('--trace', type=int, default=0,
+			help='The number of recent actions to keep and dump to the log if the battle fails.')
+	argparser.add_argument('--metrics', type=str, default=None, nargs='?', const='',
+			help='Time each phase of every turn, report it at the end and write it to this JSON file.')
+	argparser.add_argument('--budget', type=int, default=None,
+			help='The number of milliseconds each player may take per turn; late units delay.')
+	argparser.add_argument('--headless', action='store_true', default=False,
+			help='Run without any display or delays and report the turn rate.')
+	argparser.add_argument('--fps', type=float, default=20,
+			help='The maximum number of display refreshes per second.')
+	argparser.add_argument('--tick', type=int, default=300,
+			help='The number of milliseconds to pause between turns when displaying.')
 	args = argparser.parse_args()
 	engine = Engine()
 	if args.pipe1 is not None:
 		engine.p1Controller = str(args.pipe1[0])
 	if args.pipe2 is not None:
 		engine.p2Controller = str(args.pipe2[0])
-	if args.verbose is True:
-		global VERBOSEMODE
-		VERBOSEMODE = True
+	if engine.p1Controller == engine.p2Controller and IsControllerSpec(engine.p1Controller):
+		# The same plugin on both sides; the names must tell the teams apart
+		engine.p1Controller += '#1'
+		engine.p2Controller += '#2'
+	if args.log_level is not None:
+		LOG.SetLevel(Level[args.log_level.upper()])
+	elif args.verbose is True:
+		LOG.SetLevel(Level.DEBUG)
+	if args.log is not None:
+		LOG.Open(args.log)
+	if args.trace > 0:
+		engine.Trace = TraceBuffer(args.trace)
+	engine.Headless = args.headless
+	engine.Width, engine.Height = args.world
+	if args.view is not None:
+		try:
+			engine.ViewFocus = ParseSquare(args.view)
+		except ValueError:
+			argparser.error("--view takes a square as X,Y: {}".format(args.view))
+	if args.arrays is True:
+		if HasArrays():
+			engine.SetStore(ArrayStore())
+		else:
+			print("NumPy is not installed; keeping unit state in Actors.")
+	if TurnMode(args.turn_mode) == TurnMode.SIMULTANEOUS:
+		if HasResolver():
+			engine.TurnMode = TurnMode.SIMULTANEOUS
+		else:
+			print("NumPy is not installed; taking turns in order.")
+	if args.output is not None:
+		engine.outFileName = args.output
+	# Every battle gets a seed, picked here if none was given, so that it
+	# can be recorded and the battle played again
+	engine.Seed = args.seed
+	if engine.Seed is None:
+		engine.Seed = random.SystemRandom().randrange(1 << 32)
+	if RecordFormat(args.record) == RecordFormat.SEED:
+		if not (IsControllerSpec(engine.p1Controller) and IsControllerSpec(engine.p2Controller)):
+			print("A seed-only record needs both players to be module:Class plugins. Exiting.")
+			return
+		if args.budget is not None:
+			print("A seed-only record cannot be replayed exactly with a turn budget. Exiting.")
+			return
+	engine.Recorder = MakeRecorder(RecordFormat(args.record), engine.outFileName, args.keyframes)
+	if args.metrics is not None:
+		engine.Metrics = BattleMetrics(args.metrics or None)
+	if args.budget is not None:
+		engine.TurnBudget = args.budget / 1000
+	engine.FrameRate = args.fps
+	engine.TickDelay = args.tick / 1000
 	duration = args.time
 	spawnQty = args.size
+	engine.SetUpComms()
 	# *** FIXME: Logic for invoking the player programs at engine runtime
-	#engine.SetUpComms() # FIXME: this is a stupid method
 	#p1Invocation = args.playerOne[0] + ' ' + engine.p1Controller
 	#p2Invocation = args.playerTwo[0] + ' ' + engine.p2Controller
-	#logmsg("*   Starting first player: " + p1Invocation) # DEBUG
+	#LOG.Debug("*   Starting first player: {}", p1Invocation) # DEBUG
 	#os.system(p1Invocation)
-	#logmsg("*   Starting second player: " + p2Invocation) # DEBUG
+	#LOG.Debug("*   Starting second player: {}", p2Invocation) # DEBUG
 	#os.system(p2Invocation)
 	# ***
-	engine.ExecuteGameLoop(duration, spawnQty)
+	startTime = time.perf_counter()
+	try:
+		engine.ExecuteGameLoop(duration, spawnQty)
+	finally:
+		engine.CloseDisplay() # make sure the terminal is restored
+	elapsed = time.perf_counter() - startTime
+	if engine.Headless:
+		turnRate = engine.TurnCur / elapsed if elapsed > 0 else 0.0
+		print("{} turns in {:.3f}s ({:.1f} turns/sec)".format(engine.TurnCur, elapsed, turnRate))
+		summary = engine.Summary()
+		for side, controller in (('p1', engine.p1Controller), ('p2', engine.p2Controller)):
+			tally = summary[side]
+			print("{} {}: {} units left, {} HP, {} lost".format(side, controller, tally['units'], tally['hp'], tally['lost']))
+		print("winner: {}".format(summary['winner']))
+	if engine.Metrics is not None:
+		PrintSummary(engine.Metrics.Summary())
 
 if __name__ == "__main__":
 	main()
@@ -2,10 +2,14 @@
 # randoBot.py
 # Simple testing/template robot that takes a random action every turn.
 # Literally does not do anything except roll a die for every request.
+# Runs either as its own process talking over a pipe, or inside the arena as
+# the randoBot:RandoBot plugin.
 import os
 import random
 import argparse
-from battleActions import Action, ActionType, Dir
+from battleActions import Action, ActionType, Dir, BattleParser, ProtocolMode, WireFormat, Controller
+from battleActions import ParseWorldSize
+from battleComms import PipeSession
 from battler import WORLDSIDELENGTH
 
 # FIXME: need to set up a standalone mode that watches the pipe
@@ -16,17 +20,18 @@ def getNextID(pipe):
 	unitID = 0
 	return unitID
 
-def randomXYString():
-	xval = random.randrange(0, WORLDSIDELENGTH)
-	yval = random.randrange(0, WORLDSIDELENGTH)
-	xstr = hex(xval)[2:]
-	ystr = hex(yval)[2:]
-	xstr = xstr.rjust(2, '0')
-	ystr = ystr.rjust(2, '0')
+# Every roll takes the dice to use, so that each in-process RandoBot can have
+# its own seeded random.Random; the pipe version rolls the module's own dice
+# worldSize is the (width, height) of the world
+WORLDSIZE = (WORLDSIDELENGTH, WORLDSIDELENGTH)
+
+def randomXY(worldSize = WORLDSIZE, dice = random):
+	xval = dice.randrange(0, worldSize[0])
+	yval = dice.randrange(0, worldSize[1])
 	#print("%   Randobot generated loc {}, {}".format(xval, yval)) # DEBUG
-	return xstr + ystr
+	return [xval, yval]
 
-def randomDirString():
+def randomDir(dice = random):
 	# UP = 01 00 -> 10
 	# DN = 10 00 -> a0
 	# LT = 00 01 -> 01
@@ -34,105 +39,160 @@ def randomDirString():
 	# UP + LT = 01 01 -> 11
 	# UP + RT = 01 10 -> 1a
 	# DN + RT = 10 10 -> aa
-	newDir = random.choice(list(Dir))
+	newDir = dice.choice(list(Dir))
 	if newDir == Dir.NONE:
-		return randomDirString()
-	newStr = hex(newDir.value)[2:]
-	if len(newStr) == 1:
-		newStr = newStr.rjust(2, '0')
-	#print("%   Randobot generated dir {}({})".format(newDir, newStr)) # DEBUG
-	return newStr
-
-def randomAct(unitID):
+		return randomDir(dice)
+	#print("%   Randobot generated dir {}".format(newDir)) # DEBUG
+	return newDir
+
+def randomValues(unitID, worldSize = WORLDSIZE, dice = random):
 	# Randomly selects from the set of actions
-	result = random.randrange(0, 4)
-	# Start with the enum value of the action type
-	actionString = hex(result)[2:]
-	actionString = actionString.rjust(4, '0')
-	# Append the unit ID #
-	actionString += unitID
+	result = ActionType(dice.randrange(0, 4))
 	# Format any params, if needed
 	params = list()
 	match result:
-		case 0:
+		case ActionType.DELAY:
 			# delay - no params
-			actionString += '0'
+			pass
 			#print("%   : U-" + str(unitID) + " will delay") # DEBUG
-		case 1:
+		case ActionType.SCAN:
 			# scan - no params
-			actionString += '0'
+			pass
 			#print("%   : U-" + str(unitID) + " will scan") # DEBUG
-		case 2:
+		case ActionType.MOVE:
 			# move - direction
-			newDir = randomDirString()
-			actionString += newDir
+			params.append(randomDir(dice).value)
 			#print("%   : U-" + str(unitID) + " will move") # DEBUG
-		case 3:
+		case ActionType.ATTACK:
 			# attack - direction
-			newDir = randomDirString()
-			actionString += newDir
+			params.append(randomDir(dice).value)
 			#print("%   : U-" + str(unitID) + " will attack") # DEBUG
-		case 4:
+		case ActionType.SPAWN:
 			# spawn - location
-			newLoc = randomXYString()
-			actionString += newLoc
+			params = randomXY(worldSize, dice)
 			#print("%   : U-" + str(unitID) + " will spawn") # DEBUG
-	# FIXME: put togther a parser tool for the string conversion?
-	actionString = actionString.ljust(12, '0') # pad with zeroes if too short
-	actionString = '0x' + actionString
-	return actionString
+	return (result, unitID, params)
+
+def randomAct(unitID, wireFormat = WireFormat.HEX, worldSize = WORLDSIZE):
+	# Randomly selects from the set of actions, as a bytecode
+	return BattleParser.ConvertToBytecode(*randomValues(unitID, worldSize), wireFormat)
 
-def spawnAct(unitID):
+def spawnValues(unitID, worldSize = WORLDSIZE, dice = random):
 	# Creates a spawn request
 	# does NOT validate!
-	spawnReqString = hex(ActionType.SPAWN.value)[2:] # = 0x0004
-	spawnReqString = spawnReqString.rjust(4, '0') # prepend zeroes
-	spawnReqString = '0x' + spawnReqString
-	spawnReqString += unitID
-	spawnReqString += randomXYString()
-	#print("%   New spawn action created: " + spawnReqString) # DEBUG
-	return spawnReqString
-
-def subproc(pipeName):
-	# the set of instructions for the forked subprocess
-	listUnits = list()
-	random.seed()
+	return (ActionType.SPAWN, unitID, randomXY(worldSize, dice))
+
+def spawnAct(unitID, wireFormat = WireFormat.HEX, worldSize = WORLDSIZE):
+	# Creates a spawn request, as a bytecode
+	spawnReq = BattleParser.ConvertToBytecode(*spawnValues(unitID, worldSize), wireFormat)
+	#print("%   New spawn action created: {}".format(spawnReq)) # DEBUG
+	return spawnReq
+
+def nextValues(unitID, knownUnits, worldSize = WORLDSIZE, dice = random):
+	# Picks the action values for a single unit
+	if unitID not in knownUnits:
+		#print("%   U-{} not in list, spawning".format(unitID)) # DEBUG
+		knownUnits.add(unitID)
+		return spawnValues(unitID, worldSize, dice)
+	# generate a random action for that unit
+	return randomValues(unitID, worldSize, dice)
+
+def nextCommand(unitID, knownUnits, wireFormat = WireFormat.HEX, worldSize = WORLDSIZE):
+	# Picks the command for a single unit, as a bytecode
+	return BattleParser.ConvertToBytecode(*nextValues(unitID, knownUnits, worldSize), wireFormat)
+
+class RandoBot(Controller):
+	# The same dice, rolled inside the arena's process
+	def Start(self, name, worldSize, seed = None):
+		super().Start(name, worldSize, seed)
+		self.KnownUnits = set()
+		self.Dice = random.Random(seed)
+
+	def NextActions(self, turn, unitIDs, results):
+		# results are discarded
+		return [nextValues(unitID, self.KnownUnits, self.WorldSize, self.Dice) for unitID in unitIDs]
+
+def sendCommand(session, command):
+	# Sends a command in whichever encoding it was built with
+	if isinstance(command, bytes):
+		session.WriteBlob(command)
+	else:
+		session.WriteLine(command)
+
+def unitLoop(session, wireFormat, worldSize = WORLDSIZE):
+	# Answers one request per unit until the arena closes the session
+	knownUnits = set()
 	keepGoing = True
 	currentTurn = 0
 	while keepGoing == True:
 		# read a unit ID from the pipe
-		with open(pipeName, 'r') as inPipe:
-			#print("%   {}: Awaiting request".format(pipeName)) # DEBUG
-			unitID = inPipe.readline()
-			#print("% < {}: unit {} requested new action".format(pipeName, unitID)) # DEBUG
-		if unitID not in listUnits:
-			#print("%   U-{} not in list, spawning".format(unitID)) # DEBUG
-			listUnits.append(unitID)
-			newCommand = spawnAct(unitID)
-		else:
-			# generate a random action for that unit
-			newCommand = randomAct(unitID)
-		with open(pipeName, 'w') as outPipe:
-			#print("% > {}: cmd {} to {}".format(pipeName, newCommand, pipeName)) # DEBUG
-			outPipe.write(newCommand)
-		with open(pipeName, 'r') as inPipe:
-			#print("%   {}: Awaiting return value".format(pipeName)) # DEBUG
-			retVal = inPipe.readline() # discard
-			#print("% < {}: Obtained retval: {}".format(pipeName, retVal)) # DEBUG
+		#print("%   {}: Awaiting request".format(session.Name)) # DEBUG
+		unitID = session.ReadLine()
+		if unitID is None:
+			break # the arena has closed the session
+		#print("% < {}: unit {} requested new action".format(session.Name, unitID)) # DEBUG
+		newCommand = nextCommand(unitID, knownUnits, wireFormat, worldSize)
+		#print("% > {}: cmd {} to {}".format(session.Name, newCommand, session.Name)) # DEBUG
+		sendCommand(session, newCommand)
+		#print("%   {}: Awaiting return value".format(session.Name)) # DEBUG
+		retVal = session.ReadLine() # discard
+		if retVal is None:
+			break # the arena has closed the session
+		#print("% < {}: Obtained retval: {}".format(session.Name, retVal)) # DEBUG
 		currentTurn += 1
 
+def batchLoop(session, wireFormat, worldSize = WORLDSIZE):
+	# Answers one request per turn, covering all units, until the arena closes the session
+	knownUnits = set()
+	while True:
+		request = session.ReadLine()
+		if request is None:
+			break # the arena has closed the session
+		turn, unitIDs, results = BattleParser.DecodeBatchRequest(request) # results are discarded
+		commands = [nextCommand(unitID, knownUnits, wireFormat, worldSize) for unitID in unitIDs]
+		if wireFormat == WireFormat.BIN:
+			session.WriteBlob(BattleParser.EncodeBatchReplyBinary(turn, commands))
+		else:
+			session.WriteLine(BattleParser.EncodeBatchReply(turn, commands))
+
+def subproc(pipeName, mode = ProtocolMode.UNIT, wireFormat = WireFormat.HEX, seed = None, worldSize = WORLDSIZE):
+	# the set of instructions for the forked subprocess
+	random.seed(seed)
+	session = PipeSession(pipeName)
+	session.OpenAsController()
+	session.WriteLine(BattleParser.EncodeHello(mode, wireFormat))
+	if mode == ProtocolMode.BATCH:
+		batchLoop(session, wireFormat, worldSize)
+	else:
+		unitLoop(session, wireFormat, worldSize)
+	session.Close()
+
 def main():
 	argparser = argparse.ArgumentParser(
 			prog='Randobot',
 			description='A proof of concept and testing robot',
 			epilog='The epilog is the bottom of the help text')
 	argparser.add_argument('targetPipe', type=str, help='The filename of the pipe to connect to')
+	argparser.add_argument('--batch', '-b', action='store_true', default=False,
+			help='Request all of a turn\'s actions in one exchange instead of one per unit.')
+	argparser.add_argument('--binary', action='store_true', default=False,
+			help='Send actions as binary records instead of hex bytecode strings.')
+	argparser.add_argument('--seed', type=int, default=None,
+			help='Seed the dice for a repeatable run.')
+	argparser.add_argument('--world', type=ParseWorldSize, default=WORLDSIZE,
+			help='The size of the arena\'s world, as N or WxH.')
 	args = argparser.parse_args()
+	mode = ProtocolMode.UNIT
+	if args.batch is True:
+		mode = ProtocolMode.BATCH
+	wireFormat = WireFormat.HEX
+	if args.binary is True:
+		wireFormat = WireFormat.BIN
 	procID = os.fork()
 	if procID != 0:
 		return; # the parent dies
 	else:
-		subproc(args.targetPipe) # the child remains
+		subproc(args.targetPipe, mode, wireFormat, args.seed, args.world) # the child remains
 
 if __name__ == "__main__":
 	main()
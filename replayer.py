@@ -11,14 +11,17 @@
 # IMPORTS
 import argparse
 import curses
-import magic
 import os
+import tempfile
+import time
 from collections import deque
 from enum import Enum
 #from colorama import Fore, Back, Style
 
-from battleActions import Dir, ActionType, Action
-from battler import logmsg
+from battleActions import Dir, ActionType, Action, ParseWorldSize, IsControllerSpec
+from battleRecord import OpenReplay, RecordFormat, MakeRecorder
+from battleResolve import TurnMode
+from battler import Engine, STARTINGHP, WORLDSIDELENGTH
 
 animationSpeed = 1.0
 
@@ -60,12 +63,105 @@ class VirtuaPrinter:
 			# Performs an animation based on the current action
 			pass
 
+class BattleState:
+	# The world as it stands at the start of a given turn, rebuilt from a record
+	def __init__(self):
+		self.Turn = 0
+		self.Units = dict() # unit ID -> [team, x, y, HP]
+		self.Dead = dict() # unit ID -> [team, x, y, HP]
+		self.Grid = dict() # (x, y) -> unit ID
+
+	def LoadKeyframe(self, keyTurn, units):
+		# Replaces the current state with a keyframe from the record
+		self.__init__()
+		self.Turn = keyTurn
+		for unitID, team, xPos, yPos, hp in units:
+			if hp <= 0:
+				self.Dead[unitID] = [team, xPos, yPos, hp]
+				continue
+			self.Units[unitID] = [team, xPos, yPos, hp]
+			if xPos >= 0 and yPos >= 0:
+				self.Grid[(xPos, yPos)] = unitID
+
+	def ApplyTurn(self, turn, actions):
+		# Applies one turn's recorded actions and their results
+		# Results carry the outcome, so no game rules need to be re-run here
+		for values, result in actions:
+			if values is False:
+				continue
+			actionType, unitID, params = values
+			unit = self.Units.setdefault(unitID, [0, -1, -1, STARTINGHP])
+			match actionType:
+				case ActionType.MOVE | ActionType.SPAWN:
+					if isinstance(result, tuple):
+						if self.Grid.get((unit[1], unit[2])) == unitID:
+							del self.Grid[(unit[1], unit[2])]
+						unit[1], unit[2] = result
+						if result[0] >= 0 and result[1] >= 0:
+							self.Grid[result] = unitID
+				case ActionType.ATTACK:
+					if isinstance(result, int) and not isinstance(result, bool):
+						try:
+							offX, offY = Engine.DirMap[Dir(params[0])]
+						except (KeyError, ValueError):
+							continue
+						target = self.Grid.get((unit[1] + offX, unit[2] + offY))
+						if target is not None:
+							self.Units[target][3] = result
+		# Cull the dead, as the engine does at the end of every turn
+		for unitID in [unitID for unitID, unit in self.Units.items() if unit[3] <= 0]:
+			unit = self.Units.pop(unitID)
+			if self.Grid.get((unit[1], unit[2])) == unitID:
+				del self.Grid[(unit[1], unit[2])]
+			self.Dead[unitID] = unit
+		self.Turn = turn + 1
+
+	def SeekTo(self, replay, turn):
+		# Rebuilds the state at the start of the given turn from the nearest
+		# keyframe and the turns of actions that follow it
+		keyframe = replay.ReadKeyframe(turn)
+		if keyframe is None:
+			self.__init__() # no keyframe; replay everything from the start
+		else:
+			self.LoadKeyframe(*keyframe)
+		for recordedTurn, actions in replay.IterateTurns(self.Turn):
+			if recordedTurn >= turn:
+				break
+			self.ApplyTurn(recordedTurn, actions)
+		self.Turn = turn
+
+def CanRegenerate(metadata):
+	# Returns True if a seed-only record holds enough to run its battle again:
+	# both players must be in-process plugins, with no turn budget
+	return (IsControllerSpec(metadata.get('p1', '')) and IsControllerSpec(metadata.get('p2', ''))
+			and 'budget' not in metadata and 'seed' in metadata)
+
+def Regenerate(metadata, fileName):
+	# Runs a battle from a seed-only record again, writing its full record to
+	# fileName; only in-process controllers with a fixed seed can be rerun
+	# Returns False if the record cannot be regenerated
+	if not CanRegenerate(metadata):
+		return False
+	engine = Engine(metadata['p1'], metadata['p2'], fileName)
+	engine.Width, engine.Height = ParseWorldSize(metadata.get('world', WORLDSIDELENGTH))
+	engine.Headless = True
+	engine.Seed = int(metadata['seed'])
+	engine.TurnMode = TurnMode(metadata.get('turnmode', TurnMode.SEQUENTIAL.value))
+	engine.Recorder = MakeRecorder(RecordFormat.BIN, fileName)
+	engine.SetUpComms()
+	engine.ExecuteGameLoop(int(metadata['time']), int(metadata['size']))
+	return True
+
 def main():
 	# Throw an error if an input was not given
 	argparser = argparse.ArgumentParser(prog='replayer.py',
 			description='Plays back an output file from the robot battler.')
 	argparser.add_argument('file', type=str,
 			help='The path of the output file to be played back.')
+	argparser.add_argument('--turn', '-t', type=int, default=0,
+			help='The turn to start playback from.')
+	argparser.add_argument('--count', '-c', type=int, default=1,
+			help='The number of turns to play back.')
 	args = argparser.parse_args()
 	if args.file is None:
 		print("No output file was specified. Exiting.")
@@ -75,17 +171,57 @@ def main():
 	if os.path.exists(inputPath) is False:
 		print("'{}' file does not exist. Exiting.".format(inputPath))
 		return
-	# Make sure the file is a csv
-	filetype = magic.from_file(inputPath)
-	if 'csv' not in filetype:
-		print("'{}' is not a valid CSV file. Exiting.".format(inputPath))
-	# Process the file:
-	#	For each line in the output file:
-	#		convert the line to an internal action
-	#		put the action onto the playback stack
-	#	For each action on the stack:
-	#		execute the given action
-
+	# Make sure the file is a gameplay record
+	seekStart = time.perf_counter()
+	replay = OpenReplay(inputPath)
+	if replay is None:
+		print("'{}' is not a valid battle record. Exiting.".format(inputPath))
+		return
+	regenPath = None
+	if replay.Metadata.get('record') == RecordFormat.SEED.value:
+		# Only the seed was kept; run the battle again to get the actions back
+		if not CanRegenerate(replay.Metadata):
+			replay.Close()
+			print("'{}' is a seed record of a battle with pipe players or a turn budget; it cannot be regenerated. Exiting.".format(inputPath))
+			return
+		handle, regenPath = tempfile.mkstemp(suffix='.bin')
+		os.close(handle)
+		try:
+			Regenerate(replay.Metadata, regenPath)
+		finally:
+			replay.Close()
+		replay = OpenReplay(regenPath)
+		print("regenerated from seed in {:.3f}ms".format((time.perf_counter() - seekStart) * 1000))
+	try:
+		print(", ".join("{}={}".format(key, value) for key, value in replay.Metadata.items()))
+		print("last turn recorded: {}".format(replay.LastTurn()))
+		# Rebuild the world as it stood when the requested turn began
+		state = BattleState()
+		state.SeekTo(replay, args.turn)
+		print("world at turn {} ({:.3f}ms):".format(args.turn, (time.perf_counter() - seekStart) * 1000))
+		for unitID, (team, xPos, yPos, hp) in sorted(state.Units.items()):
+			print("  U-{} P{} [{}] :{},{}".format(unitID, team, hp, xPos, yPos))
+		for unitID, (team, xPos, yPos, hp) in sorted(state.Dead.items()):
+			print("  D-{} P{} [{}] :{},{}".format(unitID, team, hp, xPos, yPos))
+		# Seek to the requested turn; only the turns played back are decoded
+		turns = replay.IterateTurns(args.turn)
+		for turn, actions in turns:
+			if turn >= args.turn + args.count:
+				break
+			if seekStart is not None:
+				print("found turn {} in {:.3f}ms".format(turn, (time.perf_counter() - seekStart) * 1000))
+				seekStart = None
+			print("----TURN #{}----".format(turn))
+			for values, result in actions:
+				if values is False:
+					continue
+				actionType, unitID, params = values
+				print("  {} {} {} -> {}".format(unitID, actionType.name, params, result))
+		turns.close()
+	finally:
+		replay.Close()
+		if regenPath is not None:
+			os.remove(regenPath)
 
 if __name__ == "__main__":
 	main()
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+# tournament.py
+# Runs many battles between a set of bots in parallel and ranks the bots.
+# Every pairing is played the given number of rounds from each side; matches
+# are spread over a pool of worker processes, one battle per worker at a time.
+# Each match is isolated from the others:
+#  - its pipes live in a fresh temporary directory
+#  - its bots are started in their own process group, which is killed once
+#    the match is over (so no pkill is needed, and matches never collide)
+#  - it gets its own seed and writes its own gameplay record
+#  - with --trace, it keeps its own trace of recent actions, which goes to
+#    stderr if the match fails or times out
+#  - with --metrics, its phase timings go to match-NNNN.metrics.json
+# BOT COMMANDS
+# A bot is given as NAME=COMMAND, where COMMAND may use {pipe} for the pipe
+# name to connect to and {seed} for its seed, which is derived from the match's
+# seed and differs between the two sides (identical dice would have both bots
+# make the same moves); if {pipe} is not used, the pipe name is appended.
+# {world} is the size of the world, as N or WxH.
+#  --bot "rando=./randoBot.py {pipe} --seed {seed} --world {world}"
+# A bot may also be an in-process plugin given as NAME=module:Class (see
+# battleActions), which needs no pipes or processes at all.
+#  --bot "fastRando=randoBot:RandoBot"
+# RESULTS
+# One row per match is written to <output>/results.csv, next to the match
+# records, and the standings are printed as win/loss/duration tables.
+# IMPORTS
+import argparse
+import csv
+import os
+import random
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from battleActions import IsControllerSpec, ParseWorldSize, FormatWorldSize
+from battleLog import TraceBuffer
+from battleMetrics import BattleMetrics
+from battler import Engine, MAXDURATION, SPAWNCOUNT, WORLDSIDELENGTH
+from battleRecord import RecordFormat, MakeRecorder, KEYFRAMEINTERVAL
+from battleResolve import TurnMode, HasResolver
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULTBOTS = [
+	'rando={} {} {{pipe}} --seed {{seed}} --world {{world}}'.format(sys.executable, os.path.join(HERE, 'randoBot.py')),
+	'randoBatch={} {} {{pipe}} --batch --binary --seed {{seed}} --world {{world}}'.format(sys.executable, os.path.join(HERE, 'randoBot.py'))
+]
+RESULTCOLUMNS = ('match', 'p1', 'p2', 'seed', 'winner', 'p1units', 'p2units', 'turns', 'seconds', 'record', 'error')
+
+class MatchTimeout(Exception):
+	# Raised inside a worker when a match runs past its time limit
+	pass
+
+def ParseBot(text):
+	# Splits a NAME=COMMAND bot spec; a bare command is named after its first word
+	name, sep, command = text.partition('=')
+	if sep == '':
+		command = text
+		name = os.path.basename(shlex.split(text)[0])
+	if '{pipe}' not in command and not IsControllerSpec(command):
+		command += ' {pipe}'
+	return (name, command)
+
+def StartBot(command, pipeName, seed, worldSize):
+	# Starts a bot in its own process group so that it can be killed with
+	# everything it forked
+	argv = shlex.split(command.format(pipe=shlex.quote(pipeName), seed=seed, world=FormatWorldSize(*worldSize)))
+	return subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+			start_new_session=True)
+
+def StopBot(process):
+	# Kills whatever is left of a bot's process group
+	try:
+		os.killpg(process.pid, signal.SIGKILL)
+	except (ProcessLookupError, PermissionError):
+		pass # already gone
+	process.wait()
+
+def OnAlarm(signum, frame):
+	raise MatchTimeout()
+
+def CanSeedRecord(match):
+	# A seed-only record can only be regenerated if both bots are in-process
+	# plugins and no turn budget is set (see battler.main)
+	return IsControllerSpec(match['p1'][1]) and IsControllerSpec(match['p2'][1]) and match['budget'] is None
+
+def RunMatch(match):
+	# Plays one match in this worker process and returns its results row
+	# match is a dict holding the match number, both bots, the seed and the
+	# battle settings
+	result = dict.fromkeys(RESULTCOLUMNS, '')
+	result.update(match=match['match'], p1=match['p1'][0], p2=match['p2'][0], seed=match['seed'])
+	workDir = tempfile.mkdtemp(prefix='robobattle-')
+	bots = list()
+	engine = Engine(os.path.join(workDir, 'p1'), os.path.join(workDir, 'p2'))
+	# Plugins are named by their spec, tagged so that two copies stay apart
+	if IsControllerSpec(match['p1'][1]):
+		engine.p1Controller = match['p1'][1] + '#1'
+	if IsControllerSpec(match['p2'][1]):
+		engine.p2Controller = match['p2'][1] + '#2'
+	engine.Headless = True
+	engine.Seed = match['seed']
+	engine.Width, engine.Height = match['world']
+	engine.TurnMode = match['turnmode'] # may fall back to sequential if a bot speaks unit mode
+	recordFormat = match['record']
+	if recordFormat == RecordFormat.SEED and not CanSeedRecord(match):
+		recordFormat = RecordFormat.BIN
+	if recordFormat != RecordFormat.NONE:
+		engine.outFileName = os.path.join(match['output'], 'match-{:04d}.{}'.format(match['match'], recordFormat.value))
+		engine.Recorder = MakeRecorder(recordFormat, engine.outFileName, match['keyframes'])
+		result['record'] = os.path.basename(engine.outFileName)
+	if match['budget'] is not None:
+		engine.TurnBudget = match['budget']
+	if match['metrics']:
+		engine.Metrics = BattleMetrics(os.path.join(match['output'], 'match-{:04d}.metrics.json'.format(match['match'])))
+	if match['trace'] > 0:
+		engine.Trace = TraceBuffer(match['trace'])
+	signal.signal(signal.SIGALRM, OnAlarm)
+	startTime = time.perf_counter()
+	try:
+		# Both ends of each pipe block until the other opens, so the bots
+		# have to be running before the engine connects to them
+		for index, (side, controller) in enumerate((('p1', engine.p1Controller), ('p2', engine.p2Controller))):
+			if IsControllerSpec(controller):
+				continue
+			bots.append(StartBot(match[side][1], controller, engine.GetSeedFor(index), match['world']))
+		if match['timeout'] > 0:
+			signal.alarm(match['timeout'])
+		engine.SetUpComms()
+		engine.ExecuteGameLoop(match['time'], match['size'])
+	except MatchTimeout:
+		result['error'] = 'timeout'
+	except Exception as err:
+		result['error'] = repr(err)
+	finally:
+		signal.alarm(0)
+		engine.Cleanup() # safe to repeat after a normal shutdown
+		for process in bots:
+			StopBot(process)
+		shutil.rmtree(workDir, ignore_errors=True)
+	result['seconds'] = round(time.perf_counter() - startTime, 3)
+	result['turns'] = engine.TurnCur
+	# The same tallies and winner the battler itself reports
+	summary = engine.Summary()
+	result['p1units'] = summary['p1']['units']
+	result['p2units'] = summary['p2']['units']
+	if result['error'] != '':
+		result['winner'] = ''
+	else:
+		result['winner'] = summary['winner']
+	return result
+
+def Standings(results):
+	# Totals up each bot's record over all the matches that finished
+	table = dict()
+	for row in results:
+		for side, other in (('p1', 'p2'), ('p2', 'p1')):
+			entry = table.setdefault(row[side], {'played': 0, 'wins': 0, 'losses': 0, 'draws': 0, 'errors': 0, 'turns': 0, 'seconds': 0.0})
+			entry['played'] += 1
+			entry['turns'] += row['turns']
+			entry['seconds'] += row['seconds']
+			if row['winner'] == side:
+				entry['wins'] += 1
+			elif row['winner'] == other:
+				entry['losses'] += 1
+			elif row['winner'] == 'draw':
+				entry['draws'] += 1
+			else:
+				entry['errors'] += 1
+	return table
+
+def PrintTables(results):
+	# Prints the standings and the head-to-head wins
+	table = Standings(results)
+	ranking = sorted(table, key=lambda name: (table[name]['wins'], -table[name]['losses']), reverse=True)
+	width = max([len(name) for name in ranking] + [3])
+	print("{:<{w}}  {:>6} {:>5} {:>6} {:>5} {:>6} {:>6} {:>9} {:>8}".format(
+			'bot', 'played', 'wins', 'losses', 'draws', 'errors', 'win%', 'avg turns', 'avg secs', w=width))
+	for name in ranking:
+		entry = table[name]
+		played = max(entry['played'], 1)
+		print("{:<{w}}  {:>6} {:>5} {:>6} {:>5} {:>6} {:>6.1f} {:>9.1f} {:>8.3f}".format(
+				name, entry['played'], entry['wins'], entry['losses'], entry['draws'], entry['errors'],
+				100.0 * entry['wins'] / played, entry['turns'] / played, entry['seconds'] / played, w=width))
+	# Head to head: wins of the row's bot against the column's bot
+	wins = dict()
+	for row in results:
+		if row['winner'] in ('p1', 'p2'):
+			loser = 'p2' if row['winner'] == 'p1' else 'p1'
+			key = (row[row['winner']], row[loser])
+			wins[key] = wins.get(key, 0) + 1
+	print()
+	print("{:<{w}}  ".format('wins vs', w=width) + " ".join("{:>{w}}".format(name, w=width) for name in ranking))
+	for name in ranking:
+		cells = ["{:>{w}}".format('-' if name == other else wins.get((name, other), 0), w=width) for other in ranking]
+		print("{:<{w}}  ".format(name, w=width) + " ".join(cells))
+
+def main():
+	argparser = argparse.ArgumentParser(prog='tournament.py',
+			description='Runs a round-robin tournament of robot battles in parallel.')
+	argparser.add_argument('--bot', action='append', default=None,
+			help='A bot to enter, as NAME=COMMAND; may be given more than once.')
+	argparser.add_argument('--rounds', '-r', type=int, default=10,
+			help='The number of matches per pairing and side.')
+	argparser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+			help='The number of matches to run at once.')
+	argparser.add_argument('--seed', type=int, default=None,
+			help='The seed the match seeds are drawn from.')
+	argparser.add_argument('--size', '-s', type=int, default=SPAWNCOUNT,
+			help='The number of units to spawn at battle start.')
+	argparser.add_argument('--time', '-t', type=int, default=MAXDURATION,
+			help='The maximum number of rounds to allow in each battle.')
+	argparser.add_argument('--world', '-w', type=ParseWorldSize, default=(WORLDSIDELENGTH, WORLDSIDELENGTH),
+			help='The size of the world, as N for N x N squares or as WxH.')
+	argparser.add_argument('--turn-mode', type=str, default=TurnMode.SEQUENTIAL.value,
+			choices=[entry.value for entry in TurnMode],
+			help='Carry out each unit\'s action as it comes in, or all of a turn\'s actions at once.')
+	argparser.add_argument('--budget', type=int, default=None,
+			help='The number of milliseconds each player may take per turn; late units delay.')
+	argparser.add_argument('--timeout', type=int, default=300,
+			help='The number of seconds a match may run before it is abandoned, or 0 for no limit.')
+	argparser.add_argument('--output', '-o', type=str, default='tournament_out',
+			help='The directory for the match records and results.')
+	argparser.add_argument('--record', type=str, default=RecordFormat.BIN.value,
+			choices=[entry.value for entry in RecordFormat],
+			help='The format of each match\'s gameplay record, or none to skip them.')
+	argparser.add_argument('--keyframes', type=int, default=KEYFRAMEINTERVAL,
+			help='The number of turns between world-state snapshots in the records, or 0 for none.')
+	argparser.add_argument('--trace', type=int, default=0,
+			help='The number of recent actions to keep per match and dump if it fails.')
+	argparser.add_argument('--metrics', action='store_true', default=False,
+			help='Time the phases of every match\'s turns and write them next to its record.')
+	args = argparser.parse_args()
+	bots = [ParseBot(text) for text in (args.bot or DEFAULTBOTS)]
+	if len(set(name for name, _ in bots)) < len(bots):
+		print("Bot names must be unique. Exiting.")
+		return
+	if len(bots) < 2:
+		print("A tournament needs at least two bots. Exiting.")
+		return
+	if TurnMode(args.turn_mode) == TurnMode.SIMULTANEOUS and not HasResolver():
+		print("NumPy is not installed; taking turns in order.")
+		args.turn_mode = TurnMode.SEQUENTIAL.value
+	os.makedirs(args.output, exist_ok=True)
+	seeds = random.Random(args.seed)
+	matches = list()
+	for first in bots:
+		for second in bots:
+			if first is second:
+				continue
+			for _ in range(args.rounds):
+				matches.append({
+					'match': len(matches),
+					'p1': first,
+					'p2': second,
+					'seed': seeds.randrange(1 << 32),
+					'size': args.size,
+					'time': args.time,
+					'world': args.world,
+					'turnmode': TurnMode(args.turn_mode),
+					'budget': args.budget / 1000 if args.budget is not None else None,
+					'timeout': args.timeout,
+					'output': args.output,
+					'record': RecordFormat(args.record),
+					'keyframes': args.keyframes,
+					'trace': args.trace,
+					'metrics': args.metrics
+				})
+	if RecordFormat(args.record) == RecordFormat.SEED:
+		fallbacks = sum(1 for match in matches if not CanSeedRecord(match))
+		if fallbacks > 0:
+			print("{} matches need pipe bots or a turn budget, so they get bin records instead of seed records.".format(fallbacks))
+	print("{} matches between {} bots on {} workers".format(len(matches), len(bots), args.jobs))
+	results = list()
+	startTime = time.perf_counter()
+	with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+		for future in as_completed([pool.submit(RunMatch, match) for match in matches]):
+			row = future.result()
+			results.append(row)
+			if row['error'] != '':
+				print("match {} ({} vs {}) failed: {}".format(row['match'], row['p1'], row['p2'], row['error']))
+	elapsed = time.perf_counter() - startTime
+	results.sort(key=lambda row: row['match'])
+	with open(os.path.join(args.output, 'results.csv'), 'w', newline='') as outFile:
+		writer = csv.DictWriter(outFile, fieldnames=RESULTCOLUMNS)
+		writer.writeheader()
+		writer.writerows(results)
+	print("{} matches in {:.1f}s ({:.1f} matches/sec)".format(len(results), elapsed, len(results) / elapsed if elapsed > 0 else 0.0))
+	print()
+	PrintTables(results)
+
+if __name__ == "__main__":
+	main()
+
+# EOF